@@ -2,21 +2,41 @@ from .queue import (
     Job,
     Status,
     Storage,
+    ResultStore,
     InMemoryStorage,
     Worker,
+    AsyncWorker,
+    aget_result,
+    aget_results,
+    Middleware,
+    ProfilingMiddleware,
     RetryPolicy,
+    RetentionPolicy,
     task,
     SqliteStorage,
+    ShardedSqliteStorage,
+    Broker,
+    RemoteStorage,
 )
 
 __all__ = [
     "Job",
     "Status",
     "Storage",
+    "ResultStore",
     "InMemoryStorage",
     "Worker",
+    "AsyncWorker",
+    "aget_result",
+    "aget_results",
+    "Middleware",
+    "ProfilingMiddleware",
     "RetryPolicy",
+    "RetentionPolicy",
     "task",
     "SqliteStorage",
+    "ShardedSqliteStorage",
+    "Broker",
+    "RemoteStorage",
 ]
 __version__ = "0.2.7"
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import asyncio
+import functools
+import inspect
+import threading
+import time
+
+from .errors import TaskExecutionError, TaskNotFound
+from .registry import BATCHES, REGISTRY
+from .storage import ResultStore, Storage
+from .types import Job
+from .worker import Worker
+
+# Threads for aget_result(s) waits; more concurrent awaits queue for one
+RESULT_WAIT_THREADS = 32
+_WAIT_SLICE = 1.0
+_waits: ThreadPoolExecutor | None = None
+_waits_lock = threading.Lock()
+
+# Worker arguments AsyncWorker can't honour, with the only value it accepts
+_UNSUPPORTED = {"concurrency": 1, "processes": 0, "prefetch": 0, "timeout_mode": "thread"}
+
+
+class AsyncWorker(Worker):
+    # Runs `async def` tasks concurrently on one event loop. Storage calls
+    # block, so they go to a small dedicated thread pool; plain sync tasks
+    # are pushed to the loop's default executor so they never stall it.
+    # Heartbeats and reaping reuse the Worker's background threads.
+    def __init__(
+        self,
+        storage: Storage,
+        max_concurrency: int = 100,
+        storage_threads: int = 4,
+        **kwargs: Any,
+    ):
+        # refused rather than silently running without the isolation or
+        # parallelism asked for
+        unsupported = [
+            f"{name}={kwargs[name]!r}"
+            for name, default in _UNSUPPORTED.items()
+            if name in kwargs and kwargs[name] != default
+        ]
+        if unsupported:
+            raise ValueError(
+                f"AsyncWorker does not support {', '.join(unsupported)}; "
+                "use max_concurrency, or Worker for process pools and prefetch"
+            )
+        super().__init__(storage, **kwargs)
+        self.max_concurrency = max(1, max_concurrency)
+        self.storage_threads = max(1, storage_threads)
+
+    def run_forever(self) -> None:
+        asyncio.run(self.run())
+
+    async def run(self) -> None:
+        self._start_helpers()
+        loop = asyncio.get_running_loop()
+        active: set[asyncio.Task[None]] = set()
+        with ThreadPoolExecutor(
+            max_workers=self.storage_threads, thread_name_prefix="pinion-storage"
+        ) as io:
+
+            def offload(fn: Callable[..., Any], *args: Any) -> asyncio.Future[Any]:
+                return loop.run_in_executor(io, functools.partial(fn, *args))
+
+            try:
+                while not self.stop_event.is_set():
+                    free = self.max_concurrency - len(active)
+                    if free <= 0:
+                        await asyncio.wait(active, return_when=asyncio.FIRST_COMPLETED)
+                        continue
+                    if self._hooks["before_claim"]:
+                        self._run_hooks("before_claim")
+                    started = time.time()
+                    try:
+                        jobs = await offload(
+                            self.storage.dequeue_many, free, self.poll_timeout, self.queues
+                        )
+                    except Exception:
+                        # a storage or broker hiccup must not end the loop
+                        self.log.exception("worker.claim_failed")
+                        await asyncio.sleep(self.poll_timeout)
+                        continue
+                    if jobs:
+                        self._observe_claim(jobs, started)
+                    batches: dict[str, list[Job]] = {}
+                    for job in jobs:
+                        with self._lock:
+                            self._inflight[job.id] = job
+                        if job.func_name.lower() in BATCHES:
+                            batches.setdefault(job.func_name.lower(), []).append(job)
+                            continue
+                        t = asyncio.create_task(self._process_async(job, offload))
+                        active.add(t)
+                        t.add_done_callback(active.discard)
+                    for group in batches.values():
+                        # batch handlers block while topping up, so they get a thread
+                        t = asyncio.create_task(asyncio.to_thread(self._dispatch, group))
+                        active.add(t)
+                        t.add_done_callback(active.discard)
+            finally:
+                # let in-flight jobs finish and ack before the storage pool closes
+                if active:
+                    await asyncio.gather(*active, return_exceptions=True)
+
+    async def _process_async(
+        self, job: Job, offload: Callable[..., asyncio.Future[Any]]
+    ) -> None:
+        self.log.info(
+            "job.start id=%s name=%s attempt=%d",
+            job.id,
+            job.func_name,
+            job.attempts,
+        )
+        try:
+            fn = REGISTRY.get(job.func_name.lower())
+            if not fn:
+                raise TaskNotFound(
+                    f"no task registered: {job.func_name!r} (known: {list(REGISTRY)})"
+                )
+
+            async def call() -> Any:
+                if inspect.iscoroutinefunction(fn):
+                    result = fn(*job.args, **job.kwargs)
+                else:
+                    result = await asyncio.to_thread(fn, *job.args, **job.kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+                return result
+
+            timeout = self.task_timeout if self.task_timeout else None
+            started = time.perf_counter()
+            try:
+                for hook in self._hooks["before_execute"]:
+                    hook(self, job)
+                try:
+                    value = await asyncio.wait_for(call(), timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"task timed out after {self.task_timeout}s") from None
+            except Exception as e:
+                if self._hooks["after_execute"]:
+                    self._run_hooks("after_execute", job, None, e)
+                raise
+            else:
+                if self._hooks["after_execute"]:
+                    self._run_hooks("after_execute", job, value, None)
+            finally:
+                self.metrics.observe(
+                    "execution_seconds", time.perf_counter() - started, job.func_name
+                )
+            if self.store_results:
+                await offload(self._save_result, job, value)
+            await offload(self.storage.mark_done, job)
+            self._incr(job.func_name, processed=1, succeeded=1)
+        except Exception as e:
+            try:
+                await offload(self._fail, job, e)
+            except Exception:
+                pass
+        finally:
+            with self._lock:
+                self._inflight.pop(job.id, None)
+
+
+def _result_waits() -> ThreadPoolExecutor:
+    # Result waits block a thread each, so they get their own pool rather
+    # than the loop's default executor, which AsyncWorker's sync tasks use
+    global _waits
+    with _waits_lock:
+        if _waits is None:
+            _waits = ThreadPoolExecutor(RESULT_WAIT_THREADS, thread_name_prefix="pinion-result")
+        return _waits
+
+
+async def aget_result(
+    storage: ResultStore, job_id: str, timeout: float | None = None
+) -> Any:
+    # same semantics as storage.get_result
+    found = await aget_results(storage, [job_id], timeout)
+    if job_id not in found:
+        raise TimeoutError(f"no result for job {job_id} after {timeout}s")
+    value = found[job_id]
+    if isinstance(value, TaskExecutionError):
+        raise value
+    return value
+
+
+async def aget_results(
+    storage: ResultStore, job_ids: list[str], timeout: float | None = 0
+) -> dict[str, Any]:
+    # Blocks a thread for at most _WAIT_SLICE at a time, so a cancelled
+    # await frees it soon and waits queued for a thread keep their deadline
+    loop = asyncio.get_running_loop()
+    ids = list(dict.fromkeys(job_ids))
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        step = _WAIT_SLICE
+        if deadline is not None:
+            step = max(0.0, min(step, deadline - time.monotonic()))
+        found = await loop.run_in_executor(_result_waits(), storage.get_results, ids, step)
+        if len(found) == len(ids) or (deadline is not None and time.monotonic() >= deadline):
+            return found
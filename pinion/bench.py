@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+import platform
+import tempfile
+import threading
+import time
+
+from . import __version__
+from .inmemory import InMemoryStorage
+from .middleware import Middleware
+from .registry import task
+from .retry import RetryPolicy
+from .sharded import ShardedSqliteStorage
+from .sqlite_storage import SqliteStorage
+from .types import Job
+from .worker import Worker
+
+NOOP = "pinion-bench-noop"
+SLEEP = "pinion-bench-sleep"
+
+
+# Registered on import so process-pool children (imports=["pinion.bench"])
+# know them too
+@task(NOOP)
+def _noop(payload: str = "") -> None:
+    pass
+
+
+@task(SLEEP)
+def _sleep(seconds: float, payload: str = "") -> None:
+    time.sleep(seconds)
+
+
+@dataclass(slots=True)
+class BenchConfig:
+    backend: str = "memory"  # "memory" or "sqlite"
+    jobs: int = 2000
+    producers: int = 1  # enqueueing threads
+    enqueue_batch: int = 1  # > 1 uses enqueue_many
+    consumers: int = 1  # Worker instances, each on its own thread
+    concurrency: int = 1  # execution slots per worker
+    processes: int = 0  # per-worker process pool for task bodies
+    claim_batch: int = 1
+    prefetch: int = 0  # per-worker buffer of claimed jobs
+    shards: int = 0  # > 0 splits the sqlite backend over N files
+    payload_bytes: int = 0
+    task: str = "noop"  # "noop" or "sleep"
+    sleep: float = 0.001  # seconds per job for the sleep task
+    db: str | None = None  # SQLite path; a temporary file by default
+    timeout: float = 120.0
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    # nearest-rank p50/p95/p99 in milliseconds
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+    return {
+        "p50": pick(0.50) * 1000,
+        "p95": pick(0.95) * 1000,
+        "p99": pick(0.99) * 1000,
+        "max": ordered[-1] * 1000,
+    }
+
+
+class _Recorder(Middleware):
+    # enqueue-to-start latency, taken as the worker hands a job to its task
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.started: list[float] = []
+
+    def before_execute(self, worker: Worker, job: Job) -> None:
+        waited = time.time() - job.created_at
+        with self.lock:
+            self.started.append(waited)
+
+
+class _TimedStorage:
+    # Times claim calls that return jobs; everything else passes through
+    def __init__(self, storage: Any, claims: list[float], lock: threading.Lock) -> None:
+        self._storage = storage
+        self._claims = claims
+        self._lock = lock
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._storage, name)
+
+    def dequeue(self, timeout: float | None = None, queues: Any = None) -> Job | None:
+        started = time.perf_counter()
+        job = self._storage.dequeue(timeout, queues)
+        if job is not None:
+            self._record(time.perf_counter() - started)
+        return job
+
+    def dequeue_many(self, n: int, timeout: float | None = None, queues: Any = None) -> list[Job]:
+        started = time.perf_counter()
+        jobs = self._storage.dequeue_many(n, timeout, queues)
+        if jobs:
+            self._record(time.perf_counter() - started)
+        return jobs
+
+    def _record(self, seconds: float) -> None:
+        with self._lock:
+            self._claims.append(seconds)
+
+
+def run_bench(config: BenchConfig) -> dict[str, Any]:
+    # Producers enqueue config.jobs jobs while consumers drain them; returns
+    # a JSON-serializable report with throughput and latency percentiles.
+    task(NOOP)(_noop)
+    task(SLEEP)(_sleep)
+    tmp = None
+    if config.backend == "memory":
+        storage: Any = InMemoryStorage()
+    elif config.backend == "sqlite":
+        path = config.db
+        if path is None:
+            tmp = tempfile.TemporaryDirectory(prefix="pinion-bench-")
+            path = str(Path(tmp.name) / "bench.db")
+        storage = ShardedSqliteStorage(path, config.shards) if config.shards else SqliteStorage(path)
+    else:
+        raise ValueError(f"unknown backend {config.backend!r}")
+
+    if config.task not in ("noop", "sleep"):
+        raise ValueError(f"unknown bench task {config.task!r}")
+    payload = "x" * config.payload_bytes
+
+    def make() -> Job:
+        if config.task == "noop":
+            return Job(NOOP, kwargs={"payload": payload})
+        return Job(SLEEP, args=(config.sleep,), kwargs={"payload": payload})
+
+    recorder = _Recorder()
+    claims: list[float] = []
+    claims_lock = threading.Lock()
+    workers = [
+        Worker(
+            _TimedStorage(storage, claims, claims_lock),  # type: ignore[arg-type]
+            poll_timeout=0.05,
+            retry=RetryPolicy(max_retries=0),
+            visibility_timeout=None,
+            heartbeat_interval=1.0,
+            claim_batch=config.claim_batch,
+            prefetch=config.prefetch,
+            concurrency=config.concurrency,
+            processes=config.processes,
+            imports=["pinion.bench"],
+            middleware=[recorder],
+        )
+        for _ in range(max(1, config.consumers))
+    ]
+
+    enqueues: list[float] = []
+    enqueue_lock = threading.Lock()
+    shares = [config.jobs // config.producers] * config.producers
+    shares[0] += config.jobs - sum(shares)
+
+    def produce(count: int) -> None:
+        timings = []
+        while count > 0:
+            n = min(count, config.enqueue_batch)
+            started = time.perf_counter()
+            if n == 1:
+                storage.enqueue(make())
+            else:
+                storage.enqueue_many([make() for _ in range(n)])
+            # per-job cost, so batched and single enqueues compare directly
+            timings.extend([(time.perf_counter() - started) / n] * n)
+            count -= n
+        with enqueue_lock:
+            enqueues.extend(timings)
+
+    def done() -> int:
+        return sum(w.metrics["processed"] + w.metrics["dead_lettered"] for w in workers)
+
+    threads = [threading.Thread(target=w.run_forever, daemon=True) for w in workers]
+    try:
+        for t in threads:
+            t.start()
+        started = time.perf_counter()
+        producers = [threading.Thread(target=produce, args=(n,)) for n in shares]
+        for p in producers:
+            p.start()
+        for p in producers:
+            p.join()
+        enqueued_in = time.perf_counter() - started
+        deadline = time.time() + config.timeout
+        while done() < config.jobs and time.time() < deadline:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+    finally:
+        for w in workers:
+            w.stop()
+        for t in threads:
+            t.join(timeout=5.0)
+        for w in workers:
+            w.join(1.0)
+        if isinstance(storage, (SqliteStorage, ShardedSqliteStorage)):
+            storage.close()
+        if tmp is not None:
+            tmp.cleanup()
+
+    completed = done()
+    return {
+        "config": asdict(config),
+        "pinion": __version__,
+        "python": platform.python_version(),
+        "completed": completed,
+        "failed": sum(w.metrics["dead_lettered"] for w in workers),
+        "elapsed_s": elapsed,
+        "jobs_per_s": completed / elapsed if elapsed else 0.0,
+        "enqueue_per_s": config.jobs / enqueued_in if enqueued_in else 0.0,
+        "latency_ms": {
+            "enqueue": percentiles(enqueues),
+            "enqueue_to_start": percentiles(recorder.started),
+            "claim": percentiles(claims),
+        },
+    }
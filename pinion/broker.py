@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+import asyncio
+import importlib.util
+import ipaddress
+import logging
+import sqlite3
+import struct
+import threading
+import time
+
+from .errors import TaskExecutionError
+from .serializers import Serializer, get_serializer
+from .types import Job, Status
+
+# Every frame is a fixed header and a serializer-encoded body. Requests
+# carry an op code, responses a status, and both the request id, so a
+# client can pipeline many requests on one connection and match replies
+# arriving in any order.
+HEADER = struct.Struct("!IIB")  # body length, request id, op or status
+OK, ERROR = 0, 1
+# The first frame names the client's serializer, as raw ASCII; the broker
+# refuses a mismatch so both sides decode the same way.
+HELLO = 0
+OPS = (
+    "hello",
+    "enqueue",
+    "enqueue_many",
+    "dequeue_many",
+    "mark_done",
+    "mark_failed",
+    "retry_later",
+    "dead_letter",
+    "size",
+    "heartbeat_many",
+    "release",
+    "reap_stale",
+    "store_result",
+    "get_results",
+)
+OP_CODES = {name: code for code, name in enumerate(OPS)}
+MAX_FRAME = 64 * 1024 * 1024
+
+
+def job_to_wire(job: Job) -> list[Any]:
+    # plain values only, so json and msgpack carry jobs as well as pickle
+    return [
+        job.id, job.func_name, list(job.args), job.kwargs, job.status.value,
+        job.attempts, job.created_at, job.run_at, job.priority, job.queue, job.dedup_key,
+    ]
+
+
+def job_from_wire(fields: list[Any]) -> Job:
+    (id, func_name, args, kwargs, status, attempts, created_at,
+     run_at, priority, queue, dedup_key) = fields
+    return Job(
+        func_name, tuple(args), kwargs, id=id, status=Status(status), attempts=attempts,
+        created_at=created_at, run_at=run_at, priority=priority, queue=queue,
+        dedup_key=dedup_key,
+    )
+
+
+def wire_serializer() -> str:
+    # The default codec on both ends: msgpack when installed, else json.
+    # Neither can run code while decoding, unlike pickle.
+    return "msgpack" if importlib.util.find_spec("msgpack") else "json"
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class _RemoteException(Exception):
+    # A client's task exception, carried as its repr; storages record
+    # repr(exc), so they store exactly what a local worker would
+    def __repr__(self) -> str:
+        return self.args[0]
+
+
+class Broker:
+    # Serves a storage backend to RemoteStorage clients over TCP. Storage
+    # calls run on a thread pool; claims that find nothing wait on the event
+    # loop, and each enqueue wakes as many waiters as it added jobs, so idle
+    # workers cost nothing and get work pushed without polling. A waiter also
+    # wakes when the storage's next delayed job falls due; poll_interval is
+    # the fallback for storages that can't say when that is.
+    # Bodies from any peer are decoded with the serializer, so pickle (an
+    # explicit opt-in) is refused on non-loopback binds unless
+    # allow_pickle=True says every client that can connect is trusted.
+    def __init__(
+        self,
+        storage: Any,
+        host: str = "127.0.0.1",
+        port: int = 7878,
+        serializer: str | Serializer | None = None,
+        threads: int = 8,
+        poll_interval: float = 0.25,
+        logger: logging.Logger | None = None,
+        allow_pickle: bool = False,
+    ) -> None:
+        self.storage = storage
+        self.host = host
+        self.port = port
+        self.address: tuple[str, int] | None = None
+        self.log = logger or logging.getLogger("pinion.broker")
+        self._serializer = get_serializer(serializer or wire_serializer())
+        if self._serializer.name == "pickle" and not allow_pickle and not _is_loopback(host):
+            raise ValueError(
+                f"pickle lets any client reaching {host}:{port} run code on the broker; "
+                "use json or msgpack, bind to loopback, or pass allow_pickle=True"
+            )
+        self._threads = threads
+        self._poll_interval = poll_interval
+        self._handlers: dict[int, Callable[..., Any]] = {
+            OP_CODES[name]: getattr(self, f"_op_{name}") for name in OPS[1:]
+        }
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopping: asyncio.Event | None = None
+        self._thread: threading.Thread | None = None
+        # claimers parked until an enqueue, oldest first
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._generation = 0
+        self._results_event: asyncio.Event | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._clients: dict[asyncio.StreamWriter, asyncio.Task[Any]] = {}
+
+    # --- lifecycle ---
+    def serve_forever(self, ready: threading.Event | None = None) -> None:
+        asyncio.run(self._serve(ready))
+
+    def start(self) -> tuple[str, int]:
+        # Serves from a background thread; returns the bound address, which
+        # tells the real port when port=0
+        ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self.serve_forever, args=(ready,), name="pinion-broker", daemon=True
+        )
+        self._thread.start()
+        ready.wait()
+        if self.address is None:
+            raise RuntimeError(f"broker failed to listen on {self.host}:{self.port}")
+        return self.address
+
+    def stop(self) -> None:
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None:
+            self._thread.join()
+
+    async def _serve(self, ready: threading.Event | None) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._results_event = asyncio.Event()
+        self._executor = executor = ThreadPoolExecutor(
+            self._threads, thread_name_prefix="pinion-broker"
+        )
+        try:
+            server = await asyncio.start_server(self._connection, self.host, self.port)
+        except OSError:
+            if ready is not None:
+                ready.set()
+            raise
+        self.address = server.sockets[0].getsockname()[:2]
+        self.log.info("broker.listening address=%s:%s", *self.address)
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await self._stopping.wait()
+        finally:
+            # closing each client ends its handler, which asyncio.run would
+            # otherwise cancel mid-read
+            for writer in self._clients:
+                writer.close()
+            for waiter in self._waiters:
+                waiter.cancel()
+            await asyncio.gather(*self._clients.values(), return_exceptions=True)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- connections ---
+    async def _connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        lock = asyncio.Lock()
+        tasks: set[asyncio.Task[None]] = set()
+        peer = writer.get_extra_info("peername")
+        self._clients[writer] = asyncio.current_task()  # type: ignore[assignment]
+        try:
+            request_id, op, body = await self._read(reader)
+            if op != HELLO or body.decode() != self._serializer.name:
+                message = f"broker speaks {self._serializer.name!r}, not {body.decode()!r}"
+                await self._reply(writer, lock, request_id, ERROR, message.encode())
+                return
+            await self._reply(writer, lock, request_id, OK, b"")
+            while True:
+                request_id, op, body = await self._read(reader)
+                # requests run concurrently; a blocked claim never holds up
+                # the acks pipelined behind it
+                task = asyncio.create_task(self._dispatch(writer, lock, request_id, op, body))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            # in-flight requests see the closed writer and give back claims
+            writer.close()
+            self._clients.pop(writer, None)
+            self.log.debug("broker.disconnected peer=%s", peer)
+
+    @staticmethod
+    async def _read(reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+        length, request_id, op = HEADER.unpack(await reader.readexactly(HEADER.size))
+        if length > MAX_FRAME:
+            raise ValueError(f"frame of {length} bytes exceeds {MAX_FRAME}")
+        return request_id, op, await reader.readexactly(length)
+
+    @staticmethod
+    async def _reply(
+        writer: asyncio.StreamWriter, lock: asyncio.Lock, request_id: int, status: int, body: bytes
+    ) -> None:
+        if writer.is_closing():
+            return
+        writer.write(HEADER.pack(len(body), request_id, status) + body)
+        async with lock:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def _dispatch(
+        self, writer: asyncio.StreamWriter, lock: asyncio.Lock, request_id: int, op: int, body: bytes
+    ) -> None:
+        try:
+            handler = self._handlers.get(op)
+            if handler is None:
+                raise ValueError(f"unknown op {op}")
+            status, value = OK, await handler(writer, *self._serializer.loads(body))
+        except Exception as exc:
+            status, value = ERROR, [type(exc).__name__, str(exc)]
+        await self._reply(writer, lock, request_id, status, self._serializer.dumps(value))
+
+    def _run(self, fn: Callable[..., Any], *args: Any) -> asyncio.Future[Any]:
+        return self._loop.run_in_executor(self._executor, partial(fn, *args))  # type: ignore[union-attr]
+
+    def _wake(self, n: int) -> None:
+        # called on the loop after jobs became claimable
+        self._generation += 1
+        while n > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                n -= 1
+
+    # --- ops; arguments arrive as the client sent them ---
+    async def _op_enqueue(self, writer: Any, fields: list[Any], on_duplicate: str) -> str:
+        job = job_from_wire(fields)
+        job_id = await self._run(partial(self.storage.enqueue, job, on_duplicate=on_duplicate))
+        if job_id == job.id:
+            self._wake(1)
+        return job_id
+
+    async def _op_enqueue_many(
+        self, writer: Any, chunk: list[list[Any]], on_duplicate: str
+    ) -> int:
+        jobs = [job_from_wire(fields) for fields in chunk]
+        count = await self._run(
+            partial(self.storage.enqueue_many, jobs, on_duplicate=on_duplicate)
+        )
+        self._wake(count)
+        return count
+
+    async def _op_dequeue_many(
+        self,
+        writer: asyncio.StreamWriter,
+        n: int,
+        timeout: float | None,
+        queues: list[str] | None,
+        task: str | None,
+    ) -> list[list[Any]]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            generation = self._generation
+            jobs = await self._run(self.storage.dequeue_many, n, 0, queues, task)
+            if jobs:
+                if writer.is_closing():
+                    # the client left while we claimed: hand the jobs back
+                    await self._run(self.storage.release, jobs)
+                    self._wake(len(jobs))
+                    return []
+                return [job_to_wire(job) for job in jobs]
+            # sleep until an op changes the queue or a delayed job falls due;
+            # with nothing delayed there is no timer, so idle claimers cost
+            # no storage calls at all
+            next_due = await self._run(self._next_due)
+            wait = None if next_due is None else max(0.0, next_due - time.time())
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                wait = remaining if wait is None else min(wait, remaining)
+            if writer.is_closing():
+                return []
+            if self._generation == generation:
+                waiter = self._loop.create_future()  # type: ignore[union-attr]
+                self._waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, wait)
+                except TimeoutError:
+                    # _wake may already have popped the cancelled waiter
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+
+    def _next_due(self) -> float | None:
+        # When the storage's earliest delayed job is due; storages that can't
+        # tell are polled every poll_interval
+        next_due = getattr(self.storage, "_next_due", None)
+        if next_due is None:
+            return time.time() + self._poll_interval
+        try:
+            return next_due()
+        except sqlite3.OperationalError:
+            return time.time() + self._poll_interval
+
+    async def _op_mark_done(self, writer: Any, fields: list[Any]) -> None:
+        await self._run(self.storage.mark_done, job_from_wire(fields))
+
+    async def _op_mark_failed(self, writer: Any, fields: list[Any], error: str) -> None:
+        await self._run(self.storage.mark_failed, job_from_wire(fields), _RemoteException(error))
+
+    async def _op_retry_later(
+        self, writer: Any, fields: list[Any], error: str, delay: float
+    ) -> None:
+        await self._run(
+            self.storage.retry_later, job_from_wire(fields), _RemoteException(error), delay
+        )
+        self._wake(1)
+
+    async def _op_dead_letter(self, writer: Any, fields: list[Any], error: str) -> None:
+        await self._run(self.storage.dead_letter, job_from_wire(fields), _RemoteException(error))
+
+    async def _op_size(self, writer: Any, queue: str | None) -> int:
+        return await self._run(self.storage.size, queue)
+
+    async def _op_heartbeat_many(self, writer: Any, chunk: list[list[Any]]) -> None:
+        await self._run(self.storage.heartbeat_many, [job_from_wire(f) for f in chunk])
+
+    async def _op_release(self, writer: Any, chunk: list[list[Any]]) -> None:
+        await self._run(self.storage.release, [job_from_wire(f) for f in chunk])
+        self._wake(len(chunk))
+
+    async def _op_reap_stale(self, writer: Any, visibility_timeout: float) -> int:
+        reaped = await self._run(self.storage.reap_stale, visibility_timeout)
+        self._wake(reaped)
+        return reaped
+
+    async def _op_store_result(
+        self, writer: Any, fields: list[Any], value: Any, error: str | None
+    ) -> None:
+        await self._run(self.storage.store_result, job_from_wire(fields), value, error)
+        event, self._results_event = self._results_event, asyncio.Event()
+        event.set()  # type: ignore[union-attr]
+
+    async def _op_get_results(
+        self, writer: asyncio.StreamWriter, job_ids: list[str], timeout: float | None
+    ) -> list[list[Any]]:
+        # [id, value, error] per finished job; waits like dequeue_many
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ids = list(dict.fromkeys(job_ids))
+        while True:
+            event = self._results_event
+            found = await self._run(self.storage.get_results, ids, 0)
+            wait = self._poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+            if len(found) == len(ids) or wait <= 0 or writer.is_closing():
+                return [
+                    [job_id, None, str(value)]
+                    if isinstance(value, TaskExecutionError)
+                    else [job_id, value, None]
+                    for job_id, value in found.items()
+                ]
+            try:
+                await asyncio.wait_for(event.wait(), wait)  # type: ignore[union-attr]
+            except TimeoutError:
+                pass
@@ -79,11 +79,76 @@ def main() -> None:
     p = sub.add_parser("dlq-replay", help="re-enqueue items from DLQ (SQLite)")
     p.add_argument("--db", default="pinion.db")
     p.add_argument("--limit", type=int, default=10)
+    p = sub.add_parser("prune", help="delete or archive finished jobs in small batches (SQLite)")
+    p.add_argument("--db", default="pinion.db")
+    p.add_argument("--older-than", type=float, help="seconds since the job finished")
+    p.add_argument("--keep", type=int, help="keep only the newest N finished jobs")
+    p.add_argument("--archive", metavar="PATH", help="move pruned jobs to this SQLite file")
+    p.add_argument("--batch-size", type=int, default=500)
+    p = sub.add_parser("vacuum", help="return free pages to the OS incrementally (SQLite)")
+    p.add_argument("--db", default="pinion.db")
+    p.add_argument("--pages", type=int, help="stop after freeing N pages (default: all)")
+    p.add_argument(
+        "--full",
+        action="store_true",
+        help="rewrite the file once (exclusive lock); enables incremental vacuum on older DBs",
+    )
     p = sub.add_parser("enqueue", help="enqueue a task by name (SQLite)")
-    p.add_argument("task", help="task name")
+    p.add_argument("task", nargs="?", help="task name")
     p.add_argument("--db", default="pinion.db")
     p.add_argument("--args", help="JSON list of positional args")
     p.add_argument("--kwargs", help="JSON dict of keyword args")
+    p.add_argument(
+        "--from-jsonl",
+        metavar="PATH",
+        help='stream jobs from a JSONL file ("-" for stdin); one {"task", "args", "kwargs"} object per line',
+    )
+    p.add_argument("--chunk-size", type=int, default=1000)
+    p.add_argument("--delay", type=float, help="seconds before the job becomes runnable")
+    p.add_argument("--priority", type=int, default=0, help="higher priorities are claimed first")
+    p.add_argument("--queue", default="default", help="named queue to enqueue into")
+    p.add_argument("--eta", help="run not before this time (epoch seconds or ISO 8601)")
+    p.add_argument("--dedup-key", help="skip the enqueue while a live job has this key")
+    p.add_argument(
+        "--on-duplicate",
+        choices=["ignore", "replace", "bump"],
+        default="ignore",
+        help="what a duplicate enqueue does to the live job",
+    )
+    p = sub.add_parser("bench", help="benchmark throughput and latency; prints JSON")
+    p.add_argument("--backend", choices=["memory", "sqlite", "both"], default="both")
+    p.add_argument("--jobs", type=int, default=2000)
+    p.add_argument("--producers", type=int, default=1, help="enqueueing threads")
+    p.add_argument("--enqueue-batch", type=int, default=1, help="jobs per enqueue_many call (1 uses enqueue)")
+    p.add_argument("--consumers", type=int, default=1, help="Worker instances")
+    p.add_argument("--concurrency", type=int, default=1, help="execution slots per worker")
+    p.add_argument("--processes", type=int, default=0, help="per-worker process pool size")
+    p.add_argument("--claim-batch", type=int, default=1)
+    p.add_argument("--prefetch", type=int, default=0, help="per-worker buffer of claimed jobs")
+    p.add_argument("--shards", type=int, default=0, help="split the sqlite backend over N files")
+    p.add_argument("--payload-bytes", type=int, default=0)
+    p.add_argument("--task", choices=["noop", "sleep"], default="noop")
+    p.add_argument("--sleep-ms", type=float, default=1.0, help="duration of the sleep task")
+    p.add_argument("--db", default=None, help="SQLite path (default: a temporary file)")
+    p.add_argument("--output", help="also write the JSON report to this file")
+    p = sub.add_parser("broker", help="serve a storage backend to RemoteStorage clients over TCP")
+    p.add_argument("--host", default="127.0.0.1", help="interface to listen on (use 0.0.0.0 for all)")
+    p.add_argument("--port", type=int, default=7878)
+    p.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite")
+    p.add_argument("--db", default="pinion.db", help="SQLite path for --backend sqlite")
+    p.add_argument("--shards", type=int, default=0, help="split the SQLite backend over N files")
+    p.add_argument(
+        "--serializer",
+        choices=["msgpack", "json", "pickle"],
+        default=None,
+        help="wire encoding; clients must use the same (default: msgpack if installed, else json)",
+    )
+    p.add_argument(
+        "--allow-pickle",
+        action="store_true",
+        help="allow --serializer pickle on a non-loopback --host (every client can run code here)",
+    )
+    p.add_argument("--threads", type=int, default=8, help="threads running storage calls")
     p = sub.add_parser("worker", help="run a worker for a SQLite DB")
     p.add_argument("--db", default="pinion.db")
     p.add_argument("--max-retries", type=int, default=3)
@@ -92,12 +157,85 @@ def main() -> None:
     p.add_argument("--task-timeout", type=float, default=0.0)
     p.add_argument("--visibility-timeout", type=float, default=10.0)
     p.add_argument("--run-seconds", type=float, default=0.0)
+    p.add_argument("--concurrency", type=int, default=1, help="jobs executed in parallel (threads)")
+    p.add_argument("--queues", help="comma-separated queues to consume, in priority order (default: all)")
+    p.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="serve Prometheus metrics on http://HOST:PORT/metrics",
+    )
+    p.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="interface for --metrics-port (use 0.0.0.0 to let other hosts scrape it)",
+    )
+    p.add_argument(
+        "--piggyback-heartbeats",
+        action="store_true",
+        help="refresh held leases inside claim/ack transactions instead of separate writes",
+    )
+    p.add_argument(
+        "--retention-days",
+        type=float,
+        default=None,
+        help="prune finished jobs older than N days in the background",
+    )
+    p.add_argument(
+        "--watch-interval",
+        type=float,
+        default=None,
+        help="poll PRAGMA data_version every N seconds to wake on other processes' enqueues (e.g. 0.005)",
+    )
+    p.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="execute tasks in a pool of N child processes (for CPU-bound tasks)",
+    )
+    p.add_argument(
+        "--timeout-mode",
+        choices=["thread", "process"],
+        default="thread",
+        help="'process' runs tasks in child processes that are killed on --task-timeout",
+    )
+    p.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        help="keep up to N claimed jobs buffered so the next one starts without a claim round-trip",
+    )
     p.add_argument(
         "--import",
         dest="imports",
         action="append",
         help="Python module(s) to import for task registration (repeatable)",
     )
+    for name in ("status", "running", "pending", "dlq-list", "dlq-replay", "prune", "vacuum", "enqueue", "worker"):
+        sub.choices[name].add_argument(
+            "--shards",
+            type=int,
+            default=0,
+            help="the DB is split into N files (<db stem>.0<suffix>, ...) by ShardedSqliteStorage",
+        )
+    for name in ("enqueue", "worker"):
+        sub.choices[name].add_argument(
+            "--broker",
+            metavar="HOST:PORT",
+            help="use a `pinion broker` instead of opening --db",
+        )
+        sub.choices[name].add_argument(
+            "--broker-serializer",
+            choices=["msgpack", "json", "pickle"],
+            default=None,
+            help="wire encoding the broker was started with (default: msgpack if installed, else json)",
+        )
+        sub.choices[name].add_argument(
+            "--shard-by",
+            choices=["id", "queue"],
+            default=None,
+            help="shard key for new sharded DBs (default: id; existing DBs keep theirs)",
+        )
     args = parser.parse_args()
 
     if args.version:
@@ -141,75 +279,264 @@ def main() -> None:
             print("metrics:", w.metrics)
         return
 
+    if args.cmd == "bench":
+        import json as _json
+        from .bench import BenchConfig, run_bench
+
+        backends = ["memory", "sqlite"] if args.backend == "both" else [args.backend]
+        reports = [
+            run_bench(
+                BenchConfig(
+                    backend=backend,
+                    jobs=args.jobs,
+                    producers=max(1, args.producers),
+                    enqueue_batch=max(1, args.enqueue_batch),
+                    consumers=max(1, args.consumers),
+                    concurrency=max(1, args.concurrency),
+                    processes=max(0, args.processes),
+                    claim_batch=max(1, args.claim_batch),
+                    prefetch=max(0, args.prefetch),
+                    shards=max(0, args.shards),
+                    payload_bytes=args.payload_bytes,
+                    task=args.task,
+                    sleep=args.sleep_ms / 1000,
+                    db=args.db,
+                )
+            )
+            for backend in backends
+        ]
+        out = _json.dumps(reports, indent=2)
+        print(out)
+        if args.output:
+            Path(args.output).write_text(out + "\n")
+        return
+
+    if args.cmd == "broker":
+        from .broker import Broker
+
+        logging.basicConfig(
+            level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s"
+        )
+        if args.backend == "memory":
+            storage = InMemoryStorage()
+        elif args.shards:
+            from .sharded import ShardedSqliteStorage
+
+            storage = ShardedSqliteStorage(args.db, shards=args.shards)
+        else:
+            from .sqlite_storage import SqliteStorage
+
+            storage = SqliteStorage(args.db)
+        try:
+            broker = Broker(
+                storage,
+                args.host,
+                args.port,
+                serializer=args.serializer,
+                threads=max(1, args.threads),
+                allow_pickle=args.allow_pickle,
+            )
+        except ValueError as e:
+            if args.backend != "memory":
+                storage.close()
+            parser.error(str(e))
+        try:
+            broker.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if args.backend != "memory":
+                storage.close()
+        return
+
     # SQLite admin subcommands
     # These require no task registration and work against an existing DB.
-    if args.cmd in {"status", "running", "pending", "dlq-list", "dlq-replay", "enqueue", "worker"}:
+    if args.cmd in {"status", "running", "pending", "dlq-list", "dlq-replay", "prune", "vacuum", "enqueue", "worker"}:
         import json as _json
-        from . import SqliteStorage, Job as _Job, RetryPolicy as _RetryPolicy, Worker as _Worker
+        from datetime import datetime as _datetime
+        from . import SqliteStorage, ShardedSqliteStorage, Job as _Job, RetryPolicy as _RetryPolicy, Worker as _Worker, Status as _Status
+        from .retention import RetentionPolicy as _RetentionPolicy
+        from .types import resolve_run_at as _resolve_run_at
         import importlib as _importlib
         import logging as _logging
         import threading as _threading
         import time as _time
 
         db = getattr(args, "db", "pinion.db")
-        s = SqliteStorage(db)
+        retention_days = getattr(args, "retention_days", None)
+        options = dict(
+            watch_interval=getattr(args, "watch_interval", None),
+            retention=_RetentionPolicy(max_age=retention_days * 86400) if retention_days else None,
+            # the worker heartbeats every 1s; refresh leases at that cadence
+            piggyback_heartbeats=1.0 if getattr(args, "piggyback_heartbeats", False) else None,
+        )
+        if getattr(args, "broker", None):
+            from .remote import RemoteStorage
+
+            s = RemoteStorage(args.broker, serializer=args.broker_serializer)
+            parts = []
+        elif args.shards:
+            try:
+                s = ShardedSqliteStorage(
+                    db, shards=args.shards, shard_by=getattr(args, "shard_by", None), **options
+                )
+            except ValueError as e:
+                parser.error(str(e))
+            parts = s.shards
+        else:
+            s = SqliteStorage(db, **options)
+            parts = [s]
+
+        # Listings run per shard with the same LIMIT, then merge and re-sort
+        def _rows(sql, params=()):
+            return [r for part in parts for r in part._ro.execute(sql, params).fetchall()]
+
         if args.cmd == "status":
             qsize = s.size()
-            counts = s._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status;").fetchall()
-            dlq = s._conn.execute("SELECT COUNT(*) FROM dlq;").fetchone()[0]
+            counts, queues = {}, {}
+            for st, n in _rows("SELECT status, COUNT(*) FROM jobs GROUP BY status;"):
+                counts[_Status(st).name] = counts.get(_Status(st).name, 0) + n
+            dlq = sum(n for (n,) in _rows("SELECT COUNT(*) FROM dlq;"))
+            for queue, n in _rows(
+                f"SELECT queue, COUNT(*) FROM jobs WHERE status={_Status.PENDING.value} GROUP BY queue;"
+            ):
+                queues[queue] = queues.get(queue, 0) + n
             print("queue size:", qsize)
-            print("jobs by status:", dict(counts))
+            print("pending by queue:", queues)
+            print("jobs by status:", counts)
             print("dlq count:", dlq)
             return
         if args.cmd == "running":
-            rows = s._conn.execute(
-                "SELECT id, func_name, attempts, heartbeat_at, created_at FROM jobs WHERE status='RUNNING' ORDER BY heartbeat_at DESC NULLS LAST, created_at DESC LIMIT ?;",
+            rows = _rows(
+                f"SELECT id, func_name, attempts, heartbeat_at, created_at FROM jobs WHERE status={_Status.RUNNING.value} ORDER BY heartbeat_at DESC NULLS LAST, created_at DESC LIMIT ?;",
                 (args.limit,),
-            ).fetchall()
+            )
+            rows.sort(key=lambda r: (r[3] is None, -(r[3] or 0), -r[4]))
+            rows = rows[: args.limit]
             for r in rows:
                 print(r)
             if not rows:
                 print("(none)")
             return
         if args.cmd == "pending":
-            rows = s._conn.execute(
-                "SELECT id, func_name, attempts, created_at FROM jobs WHERE status='PENDING' ORDER BY created_at ASC LIMIT ?;",
+            rows = _rows(
+                f"SELECT id, queue, func_name, priority, attempts, created_at, run_at FROM jobs WHERE status={_Status.PENDING.value} ORDER BY priority DESC, created_at ASC LIMIT ?;",
                 (args.limit,),
-            ).fetchall()
+            )
+            rows.sort(key=lambda r: (-r[3], r[5]))
+            rows = rows[: args.limit]
             for r in rows:
                 print(r)
             if not rows:
                 print("(none)")
             return
         if args.cmd == "dlq-list":
-            rows = s._conn.execute(
+            rows = _rows(
                 "SELECT id, func_name, attempts, error, failed_at FROM dlq ORDER BY failed_at DESC LIMIT ?;",
                 (args.limit,),
-            ).fetchall()
+            )
+            rows.sort(key=lambda r: -r[4])
+            rows = rows[: args.limit]
             for r in rows:
                 print(r)
             if not rows:
                 print("(empty)")
             return
         if args.cmd == "dlq-replay":
-            rows = s._conn.execute(
-                "SELECT id, func_name, args, kwargs FROM dlq ORDER BY failed_at ASC LIMIT ?;",
-                (args.limit,),
-            ).fetchall()
+            rows = [
+                (*r, part)
+                for part in parts
+                for r in part._conn.execute(
+                    "SELECT failed_at, id, func_name, args, kwargs, queue, priority, dedup_key FROM dlq ORDER BY failed_at ASC LIMIT ?;",
+                    (args.limit,),
+                ).fetchall()
+            ]
+            rows.sort(key=lambda r: r[0])
             count = 0
-            for _id, func_name, ajson, kjson in rows:
-                args_tuple = tuple(_json.loads(ajson))
-                kwargs_dict = _json.loads(kjson)
-                s.enqueue(_Job(func_name, args_tuple, kwargs_dict))
-                s._conn.execute("DELETE FROM dlq WHERE id=?;", (_id,))
+            for _, _id, func_name, ablob, kblob, queue, priority, dedup_key, part in rows[: args.limit]:
+                args_tuple = tuple(part._serializer.loads(ablob))
+                kwargs_dict = part._serializer.loads(kblob)
+                # a sharded storage routes the new job to its own shard
+                s.enqueue(_Job(
+                    func_name, args_tuple, kwargs_dict,
+                    queue=queue, priority=priority, dedup_key=dedup_key,
+                ))
+                part._conn.execute("DELETE FROM dlq WHERE id=?;", (_id,))
                 count += 1
             print(f"replayed {count} job(s)")
             return
+        if args.cmd == "prune":
+            if args.older_than is None and args.keep is None:
+                parser.error("prune needs --older-than and/or --keep")
+            count = s.prune(
+                max_age=args.older_than,
+                max_count=args.keep,
+                archive_path=args.archive,
+                batch_size=args.batch_size,
+            )
+            print(f"{'archived' if args.archive else 'pruned'} {count} job(s)")
+            return
+        if args.cmd == "vacuum":
+            freed = s.vacuum(args.pages, full=args.full)
+            print(f"freed {freed} page(s)")
+            return
+        if args.cmd == "enqueue" and args.from_jsonl:
+            import sys as _sys
+
+            def _stream(fh):
+                for lineno, line in enumerate(fh, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = _json.loads(line)
+                        job = _Job(
+                            rec["task"],
+                            tuple(rec.get("args") or ()),
+                            rec.get("kwargs") or {},
+                            priority=int(rec.get("priority", args.priority)),
+                            queue=rec.get("queue", args.queue),
+                            dedup_key=rec.get("dedup_key"),
+                        )
+                        if rec.get("delay") is not None or rec.get("eta") is not None:
+                            job.run_at = _resolve_run_at(rec.get("delay"), rec.get("eta"))
+                        yield job
+                    except (ValueError, KeyError, TypeError) as e:
+                        raise SystemExit(f"{args.from_jsonl}:{lineno}: invalid job line: {e}")
+
+            if args.from_jsonl == "-":
+                count = s.enqueue_many(
+                    _stream(_sys.stdin), chunk_size=args.chunk_size, on_duplicate=args.on_duplicate
+                )
+            else:
+                with open(args.from_jsonl, encoding="utf-8") as fh:
+                    count = s.enqueue_many(
+                        _stream(fh), chunk_size=args.chunk_size, on_duplicate=args.on_duplicate
+                    )
+            print(f"enqueued {count} job(s)")
+            return
         if args.cmd == "enqueue":
+            if not args.task:
+                parser.error("enqueue requires a task name or --from-jsonl")
             pos_args = tuple(_json.loads(args.args) if getattr(args, "args", None) else [])
             kw_args = _json.loads(args.kwargs) if getattr(args, "kwargs", None) else {}
-            s.enqueue(_Job(args.task, pos_args, kw_args))
-            print(f"enqueued {args.task} -> args={pos_args} kwargs={kw_args}")
+            eta = None
+            if args.eta:
+                try:
+                    eta = float(args.eta)
+                except ValueError:
+                    eta = _datetime.fromisoformat(args.eta)
+            job = _Job(
+                args.task, pos_args, kw_args, priority=args.priority, queue=args.queue, dedup_key=args.dedup_key
+            )
+            try:
+                job_id = s.enqueue(job, delay=args.delay, eta=eta, on_duplicate=args.on_duplicate)
+            except ValueError as e:
+                parser.error(str(e))
+            if job_id != job.id:
+                print(f"duplicate of live job {job_id} (on_duplicate={args.on_duplicate})")
+                return
+            print(f"enqueued {args.task} -> queue={args.queue} args={pos_args} kwargs={kw_args} id={job_id}")
             return
         if args.cmd == "worker":
             # Optional imports to register tasks in this process
@@ -221,7 +548,11 @@ def main() -> None:
                         print(f"failed to import {mod!r}: {e}")
             _logging.basicConfig(level=_logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
             retry = _RetryPolicy(max_retries=args.max_retries, base_delay=args.base_delay, jitter=not args.no_jitter)
-            w = _Worker(s, retry=retry, poll_timeout=0.1, task_timeout=args.task_timeout, visibility_timeout=args.visibility_timeout)
+            from .metrics import serve_metrics as _serve_metrics
+            w = _Worker(s, retry=retry, poll_timeout=0.1, task_timeout=args.task_timeout, visibility_timeout=args.visibility_timeout, concurrency=args.concurrency, processes=args.processes, timeout_mode=args.timeout_mode, prefetch=args.prefetch, imports=args.imports or (), queues=args.queues.split(",") if args.queues else None)
+            if args.metrics_port is not None:
+                _serve_metrics(w.metrics, args.metrics_port, args.metrics_host)
+                print(f"metrics: http://{args.metrics_host}:{args.metrics_port}/metrics")
             if args.run_seconds and args.run_seconds > 0:
                 t = _threading.Thread(target=w.run_forever, daemon=True)
                 t.start()
@@ -268,9 +599,14 @@ Admin (SQLite):
   pinion pending --db pinion.db --limit 10
   pinion dlq-list --db pinion.db --limit 10
   pinion dlq-replay --db pinion.db --limit 10
-  pinion enqueue TASK --db pinion.db --args '[]' --kwargs '{{}}'
+  pinion prune --db pinion.db --older-than 604800 [--keep 100000] [--archive old.db]
+  pinion vacuum --db pinion.db [--pages 1000]
+  pinion enqueue TASK --db pinion.db --args '[]' --kwargs '{{}}' [--delay 30] [--priority 10] [--queue emails]
+  pinion enqueue --db pinion.db --from-jsonl jobs.jsonl  # or - for stdin
   pinion worker --db pinion.db --max-retries 2 --task-timeout 5 \
     --import your_project.tasks  # import modules to register tasks
+  pinion worker --db pinion.db --queues emails,default --concurrency 4
+  pinion bench --backend both --jobs 5000 --claim-batch 10 --output bench.json
 
 CLI tips:
   Show version:      pinion --version
@@ -9,3 +9,8 @@ class TaskNotFound(PinionError):
 class TaskExecutionError(PinionError):
     pass
 
+
+
+# A broker failed a request with an error of no built-in type
+class BrokerError(PinionError):
+    pass
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Iterable
+import asyncio
+import importlib
+import inspect
+import multiprocessing
+import queue
+import threading
+
+from .errors import TaskNotFound
+from .registry import REGISTRY
+from .types import Job
+
+
+def invoke(fn: Callable[..., Any], args: tuple[Any, ...], kwargs: dict[str, Any]) -> Any:
+    result = fn(*args, **kwargs)
+    # async def tasks run outside an event loop: drive the coroutine here
+    if inspect.iscoroutine(result):
+        result = asyncio.run(result)
+    return result
+
+
+def _init_child(imports: tuple[str, ...]) -> None:
+    # Runs once per child: register tasks before any job arrives
+    for mod in imports:
+        importlib.import_module(mod)
+
+
+def _run_task(func_name: str, args: tuple[Any, ...], kwargs: dict[str, Any]) -> Any:
+    fn = REGISTRY.get(func_name.lower())
+    if not fn:
+        raise TaskNotFound(
+            f"no task registered: {func_name!r} (known: {list(REGISTRY)})"
+        )
+    return invoke(fn, args, kwargs)
+
+
+def _child_main(conn: Connection, imports: tuple[str, ...]) -> None:
+    # Loop of one supervised child: run (name, args, kwargs) requests until
+    # the parent closes the pipe or sends None
+    _init_child(imports)
+    conn.send("ready")
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        try:
+            reply = ("ok", _run_task(*request))
+        except BaseException as e:
+            reply = ("err", e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # unpicklable result or exception; send() pickles before writing
+            conn.send(("err", RuntimeError(f"could not return task outcome: {e!r}")))
+
+
+class _Child:
+    def __init__(self, ctx: Any, imports: tuple[str, ...]) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_child_main, args=(child_conn, imports), name="pinion-task", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self) -> None:
+        # spawning and importing task modules doesn't count against a timeout
+        if not self.ready:
+            try:
+                self.conn.recv()
+            except EOFError:
+                raise RuntimeError(
+                    f"task process failed to start (exit code {self.process.exitcode})"
+                ) from None
+            self.ready = True
+
+    def kill(self) -> None:
+        self.process.terminate()
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+# Pre-started children that execute registered tasks, one job at a time
+# each. Children import the given modules on start, so only the task name
+# and arguments cross the process boundary and claiming/acking stays in the
+# parent. A child that overruns its timeout (or dies) is terminated and
+# replaced, so a stuck task never outlives its job.
+class ProcessPool:
+    def __init__(
+        self,
+        processes: int,
+        imports: Iterable[str] = (),
+        mp_context: str | None = "spawn",
+    ) -> None:
+        self.processes = processes
+        self._ctx = multiprocessing.get_context(mp_context)
+        self._imports = tuple(imports)
+        self._lock = threading.Lock()
+        self._children = [_Child(self._ctx, self._imports) for _ in range(processes)]
+        self._idle: queue.SimpleQueue[_Child] = queue.SimpleQueue()
+        # Wait for every child up front so the first jobs don't pay for spawning
+        try:
+            for child in self._children:
+                child.wait_ready()
+        except BaseException:
+            self.shutdown()
+            raise
+        for child in self._children:
+            self._idle.put(child)
+
+    def _replace(self, child: _Child) -> _Child:
+        # the replacement starts now and is awaited before its first job
+        child.kill()
+        fresh = _Child(self._ctx, self._imports)
+        with self._lock:
+            self._children[self._children.index(child)] = fresh
+        return fresh
+
+    def call(self, job: Job, timeout: float | None = None) -> Any:
+        return self.run(job.func_name, job.args, job.kwargs, timeout)
+
+    def run(
+        self,
+        func_name: str,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+        timeout: float | None = None,
+    ) -> Any:
+        child = self._idle.get()
+        try:
+            try:
+                child.wait_ready()
+            except RuntimeError:
+                child = self._replace(child)
+                raise
+            if not child.process.is_alive():
+                child = self._replace(child)  # died while idle (OOM, kill)
+                child.wait_ready()
+            try:
+                child.conn.send((func_name, args, kwargs))
+            except OSError:
+                # died between the check and the send; retry once
+                child = self._replace(child)
+                child.wait_ready()
+                child.conn.send((func_name, args, kwargs))
+            if not child.conn.poll(timeout):
+                child = self._replace(child)
+                raise TimeoutError(f"task timed out after {timeout}s")
+            try:
+                status, value = child.conn.recv()
+            except EOFError:
+                code = child.process.exitcode
+                child = self._replace(child)
+                raise RuntimeError(f"task process died (exit code {code})") from None
+        finally:
+            self._idle.put(child)
+        if status == "err":
+            raise value
+        return value
+
+    def shutdown(self) -> None:
+        with self._lock:
+            children, self._children = self._children, []
+        for child in children:
+            child.close()
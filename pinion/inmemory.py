@@ -1,92 +1,419 @@
 from __future__ import annotations
 
-from collections import deque
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import count
+import heapq
+import logging
 import threading
 import time
-from typing import Any
+from typing import Any, Iterable, Sequence
 
-from .types import Job, Status
+from .errors import TaskExecutionError
+from .types import Job, Status, check_on_duplicate, resolve_run_at
 from .storage import Storage
 
+_log = logging.getLogger("pinion.inmemory")
+
+
+@dataclass(frozen=True, slots=True)
+class Outcome:
+    job_id: str
+    func_name: str
+    # SUCCESS, FAILED (for good) or PENDING (failed, retry scheduled)
+    status: Status
+    error: str | None
+    at: float
+
 
 class InMemoryStorage:
-    def __init__(self) -> None:
-        self._q: deque[Job] = deque()
+    def __init__(
+        self,
+        results_ttl: float | None = 3600.0,
+        max_outcomes: int | None = 10_000,
+        max_dead_letters: int | None = None,
+        outcomes_ttl: float | None = None,
+    ) -> None:
+        # Ready heaps of (-priority, seq, job) per queue: O(log n) push and claim
+        self._q: dict[str, list[tuple[int, int, Job]]] = {}
         self._cv = threading.Condition()
-        self._failures: dict[str, str] = {}
-        self._done: set[str] = set()
-        self._heartbeats: dict[str, float] = {}
+        # Latest outcome per job, oldest first, so trimming to max_outcomes
+        # or outcomes_ttl pops from the front in O(1) per entry
+        self._outcomes: OrderedDict[str, Outcome] = OrderedDict()
+        self._max_outcomes = max_outcomes
+        self._outcomes_ttl = outcomes_ttl
+        # Lease refreshes always stamp the current time and move the job to
+        # the end, so the order is expiry order: reaping pops expired leases
+        # off the front, O(1) each, without scanning the live ones
+        self._heartbeats: OrderedDict[str, float] = OrderedDict()
         self._running: dict[str, Job] = {}
-        self._dlq: list[tuple[Job, str, float]] = []
+        # (job, error, failed_at), oldest first. Unbounded by default: a dead
+        # letter is the only record of a job, so dropping one is opt-in and
+        # logged
+        self._dlq: deque[tuple[Job, str, float]] = deque()
+        self._max_dead_letters = max_dead_letters
+        # Timer heap of (run_at, seq, job) for jobs that are not yet due
+        self._delayed: list[tuple[float, int, Job]] = []
+        self._delayed_per_queue: dict[str, int] = {}
+        self._seq = count()
+        # dedup_key -> the PENDING/RUNNING job holding it
+        self._dedup: dict[str, Job] = {}
+        # Results in finish order as job_id -> (value, error, finished_at);
+        # with a fixed TTL the oldest entries are always at the front
+        self._results: OrderedDict[str, tuple[Any, str | None, float]] = OrderedDict()
+        self._results_ttl = results_ttl
+        self._results_cv = threading.Condition()
+
+    def _push(self, job: Job) -> None:
+        # caller holds self._cv
+        if job.run_at > time.time():
+            heapq.heappush(self._delayed, (job.run_at, next(self._seq), job))
+            self._delayed_per_queue[job.queue] = self._delayed_per_queue.get(job.queue, 0) + 1
+        else:
+            self._push_ready(job)
+
+    def _push_ready(self, job: Job) -> None:
+        heap = self._q.setdefault(job.queue, [])
+        heapq.heappush(heap, (-job.priority, next(self._seq), job))
+
+    def _admit(self, job: Job, on_duplicate: str) -> Job:
+        # caller holds self._cv; pushes job unless a live job holds its
+        # dedup_key, and returns whichever job stands for it
+        key = job.dedup_key
+        if key is not None:
+            held = self._dedup.get(key)
+            if held is not None and held.status in (Status.PENDING, Status.RUNNING):
+                if held.status is Status.PENDING:
+                    if on_duplicate == "replace":
+                        held.args, held.kwargs = job.args, job.kwargs
+                    elif on_duplicate == "bump" and job.priority > held.priority:
+                        self._reprioritize(held, job.priority)
+                return held
+            self._dedup[key] = job
+        self._push(job)
+        return job
+
+    def _reprioritize(self, job: Job, priority: int) -> None:
+        # caller holds self._cv; a delayed job picks up its priority when it
+        # is promoted, a ready one needs its heap entry rewritten (O(n), but
+        # only on a bump)
+        job.priority = priority
+        heap = self._q.get(job.queue, [])
+        for i, (_, seq, queued) in enumerate(heap):
+            if queued is job:
+                heap[i] = (-priority, seq, job)
+                heapq.heapify(heap)
+                return
+
+    def _free_key(self, job: Job) -> None:
+        # caller holds self._cv
+        held = self._dedup.get(job.dedup_key) if job.dedup_key is not None else None
+        if held is not None and held.id == job.id:
+            del self._dedup[job.dedup_key]
+
+    def _finish(self, job: Job, status: Status) -> Job:
+        # caller holds self._cv; ends job's lease and returns this storage's
+        # own object for it, which is a different one when calls arrive
+        # through a broker
+        self._heartbeats.pop(job.id, None)
+        held = self._running.pop(job.id, job)
+        held.status = job.status = status
+        return held
+
+    def _pick(self, queues: Sequence[str] | None) -> list[tuple[int, int, Job]] | None:
+        # caller holds self._cv; listed queues are drained in order, otherwise
+        # the best head across all queues wins
+        if queues:
+            for queue in queues:
+                heap = self._q.get(queue)
+                if heap:
+                    return heap
+            return None
+        heads = [heap for heap in self._q.values() if heap]
+        return min(heads, key=lambda h: h[0][:2]) if heads else None
+
+    def _promote_due(self) -> None:
+        # caller holds self._cv
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            job = heapq.heappop(self._delayed)[2]
+            self._delayed_per_queue[job.queue] -= 1
+            self._push_ready(job)
+
+    def _next_due(self) -> float | None:
+        with self._cv:
+            return self._delayed[0][0] if self._delayed else None
 
-    def enqueue(self, job: Job) -> None:
+    def enqueue(
+        self,
+        job: Job,
+        *,
+        delay: float | None = None,
+        eta: float | datetime | None = None,
+        on_duplicate: str = "ignore",
+    ) -> str:
+        check_on_duplicate(on_duplicate)
+        if delay is not None or eta is not None:
+            job.run_at = resolve_run_at(delay, eta)
         with self._cv:
-            self._q.append(job)
-            self._cv.notify()
+            held = self._admit(job, on_duplicate)
+            # delayed jobs change how long waiters should sleep
+            self._cv.notify_all()
+        return held.id
 
-    def dequeue(self, timeout: float | None = None) -> Job | None:
+    def enqueue_many(self, jobs: Iterable[Job], *, on_duplicate: str = "ignore") -> int:
+        check_on_duplicate(on_duplicate)
+        batch = list(jobs)
+        with self._cv:
+            for job in batch:
+                self._admit(job, on_duplicate)
+            self._cv.notify_all()
+        return len(batch)
+
+    def dequeue(
+        self, timeout: float | None = None, queues: Sequence[str] | None = None
+    ) -> Job | None:
+        jobs = self.dequeue_many(1, timeout, queues)
+        return jobs[0] if jobs else None
+
+    def dequeue_many(
+        self,
+        n: int,
+        timeout: float | None = None,
+        queues: Sequence[str] | None = None,
+        task: str | None = None,
+    ) -> list[Job]:
         end = None if timeout is None else time.time() + timeout
         with self._cv:
-            while not self._q:
-                if timeout is None:
-                    self._cv.wait()
+            while True:
+                self._promote_due()
+                if task is not None:
+                    jobs = self._take_task(n, queues, task)
+                    if jobs:
+                        break
                 else:
-                    remaining = end - time.time()
-                    if remaining <= 0:
-                        return None
-                    self._cv.wait(remaining)
-            job = self._q.popleft()
-            job.status = Status.RUNNING
-            job.attempts += 1
-            self._heartbeats[job.id] = time.time()
-            self._running[job.id] = job
-            return job
+                    heap = self._pick(queues)
+                    if heap:
+                        jobs = self._take(n, heap, queues)
+                        break
+                wait = None if end is None else end - time.time()
+                if wait is not None and wait <= 0:
+                    return []
+                if self._delayed:
+                    until_due = max(0.0, self._delayed[0][0] - time.time())
+                    wait = until_due if wait is None else min(wait, until_due)
+                self._cv.wait(wait)
+            now = time.time()
+            for job in jobs:
+                job.status = Status.RUNNING
+                job.attempts += 1
+                self._touch(job.id, now)
+                self._running[job.id] = job
+            return jobs
+
+    def _take(
+        self, n: int, heap: list[tuple[int, int, Job]], queues: Sequence[str] | None
+    ) -> list[Job]:
+        # caller holds self._cv
+        jobs: list[Job] = []
+        while heap and len(jobs) < n:
+            jobs.append(heapq.heappop(heap)[2])
+            if not heap:
+                heap = self._pick(queues)
+        return jobs
+
+    def _take_task(self, n: int, queues: Sequence[str] | None, task: str) -> list[Job]:
+        # caller holds self._cv; scans the ready heaps for jobs of one task,
+        # O(ready jobs), which only batch top-ups pay
+        groups = [[self._q.get(q, [])] for q in queues] if queues else [list(self._q.values())]
+        taken: list[Job] = []
+        for heaps in groups:
+            entries = heapq.nsmallest(
+                n - len(taken), (e for h in heaps for e in h if e[2].func_name == task)
+            )
+            chosen = {seq for _, seq, _ in entries}
+            for h in heaps:
+                if any(seq in chosen for _, seq, _ in h):
+                    h[:] = [e for e in h if e[1] not in chosen]
+                    heapq.heapify(h)
+            taken.extend(job for _, _, job in entries)
+            if len(taken) >= n:
+                break
+        return taken
+
+    def _record(self, job: Job, status: Status, error: str | None) -> None:
+        # caller holds self._cv
+        now = time.time()
+        self._outcomes.pop(job.id, None)
+        self._outcomes[job.id] = Outcome(job.id, job.func_name, status, error, now)
+        self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        # caller holds self._cv
+        outcomes = self._outcomes
+        if self._max_outcomes is not None:
+            while len(outcomes) > self._max_outcomes:
+                outcomes.popitem(last=False)
+        if self._outcomes_ttl is not None:
+            cutoff = now - self._outcomes_ttl
+            while outcomes and next(iter(outcomes.values())).at < cutoff:
+                outcomes.popitem(last=False)
+            while self._dlq and self._dlq[0][2] < cutoff:
+                self._evict_dead_letter("outcomes_ttl")
+        if self._max_dead_letters is not None:
+            while len(self._dlq) > self._max_dead_letters:
+                self._evict_dead_letter("max_dead_letters")
+
+    def _evict_dead_letter(self, reason: str) -> None:
+        # caller holds self._cv
+        job, error, _ = self._dlq.popleft()
+        _log.warning(
+            "inmemory.dlq_evicted job_id=%s func=%s error=%s reason=%s",
+            job.id, job.func_name, error, reason,
+        )
+
+    def recent_outcomes(
+        self, limit: int | None = 100, status: Status | None = None
+    ) -> list[Outcome]:
+        # Newest first; older entries may have been evicted
+        with self._cv:
+            self._trim(time.time())
+            found: list[Outcome] = []
+            for outcome in reversed(self._outcomes.values()):
+                if limit is not None and len(found) >= limit:
+                    break
+                if status is None or outcome.status is status:
+                    found.append(outcome)
+            return found
 
     def mark_done(self, job: Job) -> None:
-        job.status = Status.SUCCESS
         with self._cv:
-            self._done.add(job.id)
-            self._heartbeats.pop(job.id, None)
-            self._running.pop(job.id, None)
+            held = self._finish(job, Status.SUCCESS)
+            self._record(held, Status.SUCCESS, None)
+            self._free_key(held)
 
     def mark_failed(self, job: Job, exc: Exception) -> None:
-        job.status = Status.FAILED
         with self._cv:
-            self._failures[job.id] = repr(exc)
-            self._heartbeats.pop(job.id, None)
-            self._running.pop(job.id, None)
+            held = self._finish(job, Status.FAILED)
+            self._record(held, Status.FAILED, repr(exc))
+            self._free_key(held)
 
-    def size(self) -> int:
+    def retry_later(self, job: Job, exc: Exception, delay: float) -> None:
         with self._cv:
-            return len(self._q)
+            held = self._finish(job, Status.PENDING)
+            held.run_at = job.run_at = time.time() + delay
+            self._record(held, Status.PENDING, repr(exc))
+            self._push(held)
+            self._cv.notify_all()
+
+    def size(self, queue: str | None = None) -> int:
+        with self._cv:
+            if queue is None:
+                return sum(map(len, self._q.values())) + len(self._delayed)
+            return len(self._q.get(queue, ())) + self._delayed_per_queue.get(queue, 0)
+
+    def _touch(self, job_id: str, now: float) -> None:
+        # caller holds self._cv
+        self._heartbeats[job_id] = now
+        self._heartbeats.move_to_end(job_id)
 
     def heartbeat(self, job: Job) -> None:
+        self.heartbeat_many([job])
+
+    def heartbeat_many(self, jobs: Iterable[Job]) -> None:
+        now = time.time()
         with self._cv:
-            if job.status is Status.RUNNING:
-                self._heartbeats[job.id] = time.time()
+            for job in jobs:
+                if job.status is Status.RUNNING:
+                    self._touch(job.id, now)
 
     def reap_stale(self, visibility_timeout: float) -> int:
-        now = time.time()
+        cutoff = time.time() - visibility_timeout
         reaped = 0
         with self._cv:
-            stale_ids = [
-                jid
-                for jid, hb in list(self._heartbeats.items())
-                if hb + visibility_timeout < now
-            ]
-            for jid in stale_ids:
-                self._heartbeats.pop(jid, None)
+            # If the clock stepped back, a newer lease may sit in front of
+            # older ones; those are reaped once it expires too.
+            heartbeats = self._heartbeats
+            while heartbeats and next(iter(heartbeats.values())) < cutoff:
+                jid, _ = heartbeats.popitem(last=False)
                 job = self._running.pop(jid, None)
                 if job is not None and job.status is Status.RUNNING:
                     job.status = Status.PENDING
-                    self._q.append(job)
+                    self._push(job)
                     reaped += 1
             if reaped:
                 self._cv.notify_all()
         return reaped
 
+    def release(self, jobs: Iterable[Job]) -> None:
+        with self._cv:
+            for job in jobs:
+                self._heartbeats.pop(job.id, None)
+                held = self._running.pop(job.id, None)
+                if held is None or held.status is not Status.RUNNING:
+                    continue
+                held.status = job.status = Status.PENDING
+                held.attempts = job.attempts = max(held.attempts - 1, 0)
+                self._push(held)
+            self._cv.notify_all()
+
     def dead_letter(self, job: Job, exc: Exception) -> None:
         with self._cv:
-            self._dlq.append((job, repr(exc), time.time()))
+            now = time.time()
+            self._dlq.append((job, repr(exc), now))
+            self._trim(now)
             self._cv.notify_all()
 
+
+    # --- results ---
+    def _evict_results(self, now: float) -> None:
+        # caller holds self._results_cv
+        if self._results_ttl is None:
+            return
+        cutoff = now - self._results_ttl
+        while self._results:
+            _, (_, _, finished_at) = next(iter(self._results.items()))
+            if finished_at >= cutoff:
+                break
+            self._results.popitem(last=False)
+
+    def store_result(
+        self, job: Job, value: Any = None, error: str | None = None
+    ) -> None:
+        now = time.time()
+        with self._results_cv:
+            self._results.pop(job.id, None)
+            self._results[job.id] = (value, error, now)
+            self._evict_results(now)
+            self._results_cv.notify_all()
+
+    def get_result(self, job_id: str, timeout: float | None = None) -> Any:
+        found = self.get_results([job_id], timeout)
+        if job_id not in found:
+            raise TimeoutError(f"no result for job {job_id} after {timeout}s")
+        value = found[job_id]
+        if isinstance(value, TaskExecutionError):
+            raise value
+        return value
+
+    def get_results(
+        self, job_ids: Iterable[str], timeout: float | None = 0
+    ) -> dict[str, Any]:
+        ids = list(dict.fromkeys(job_ids))
+        end = None if timeout is None else time.time() + timeout
+        with self._results_cv:
+            while True:
+                self._evict_results(time.time())
+                found: dict[str, Any] = {}
+                for job_id in ids:
+                    entry = self._results.get(job_id)
+                    if entry is not None:
+                        value, error, _ = entry
+                        found[job_id] = TaskExecutionError(error) if error is not None else value
+                if len(found) == len(ids):
+                    return found
+                wait = None if end is None else end - time.time()
+                if wait is not None and wait <= 0:
+                    return found
+                self._results_cv.wait(wait)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections.abc import Mapping
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+import threading
+
+# Upper bounds in seconds; one extra bucket catches everything above
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+COUNTERS = ("processed", "succeeded", "failed", "retried", "dead_lettered", "reaped")
+HISTOGRAMS = {
+    "queue_wait_seconds": "Time from a job becoming due to being claimed",
+    "execution_seconds": "Task execution time",
+    "claim_seconds": "Duration of storage claim calls that returned jobs",
+}
+
+
+class Histogram:
+    # Fixed buckets, so observing is a bisect and an increment. Not
+    # thread-safe on its own; Metrics serializes access.
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        # cumulative counts per upper bound, as Prometheus expects
+        cumulative: dict[str, int] = {}
+        total = 0
+        for bound, n in zip((*map(str, self.buckets), "+Inf"), self.counts):
+            total += n
+            cumulative[bound] = total
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+
+class Metrics(Mapping[str, int]):
+    # Worker counters (overall and per task) and latency histograms behind
+    # one lock. Reads like the old dict of totals: metrics["processed"].
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self._totals = dict.fromkeys(COUNTERS, 0)
+        self._by_task: dict[tuple[str, str | None], int] = {}
+        self._histograms: dict[tuple[str, str | None], Histogram] = {}
+
+    def incr(self, task: str | None = None, **counts: int) -> None:
+        with self._lock:
+            for name, n in counts.items():
+                self._totals[name] = self._totals.get(name, 0) + n
+                key = (name, task)
+                self._by_task[key] = self._by_task.get(key, 0) + n
+
+    def observe(self, name: str, seconds: float, task: str | None = None) -> None:
+        with self._lock:
+            hist = self._histograms.get((name, task))
+            if hist is None:
+                hist = self._histograms[(name, task)] = Histogram(self._buckets)
+            hist.observe(seconds)
+
+    # --- Mapping over the totals ---
+    def __getitem__(self, name: str) -> int:
+        with self._lock:
+            return self._totals[name]
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._totals))
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+    def __repr__(self) -> str:
+        with self._lock:
+            return repr(dict(self._totals))
+
+    def snapshot(self) -> dict[str, Any]:
+        # A consistent copy: totals, per-task counters and histograms keyed
+        # by name then task ("" for histograms without a task)
+        with self._lock:
+            tasks: dict[str, dict[str, int]] = {}
+            for (name, task), n in self._by_task.items():
+                if task is not None:
+                    tasks.setdefault(task, {})[name] = n
+            histograms: dict[str, dict[str, Any]] = {}
+            for (name, task), hist in self._histograms.items():
+                histograms.setdefault(name, {})[task or ""] = hist.snapshot()
+            return {"counters": dict(self._totals), "tasks": tasks, "histograms": histograms}
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            by_task = sorted(self._by_task.items(), key=lambda kv: (kv[0][0], kv[0][1] or ""))
+            hists = sorted(
+                ((k, h.snapshot()) for k, h in self._histograms.items()),
+                key=lambda kv: (kv[0][0], kv[0][1] or ""),
+            )
+        lines: list[str] = []
+        for name in COUNTERS:
+            metric = f"pinion_jobs_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            rows = [(task, n) for (counter, task), n in by_task if counter == name]
+            for task, n in rows or [(None, 0)]:
+                lines.append(f"{metric}{_labels(task)} {n}")
+        for name, help_text in HISTOGRAMS.items():
+            metric = f"pinion_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (hist_name, task), snap in hists:
+                if hist_name != name:
+                    continue
+                for bound, n in snap["buckets"].items():
+                    lines.append(f"{metric}_bucket{_labels(task, le=bound)} {n}")
+                lines.append(f"{metric}_sum{_labels(task)} {snap['sum']}")
+                lines.append(f"{metric}_count{_labels(task)} {snap['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(task: str | None, **extra: str) -> str:
+    pairs = {"task": task} if task is not None else {}
+    pairs.update(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs.items()) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def serve_metrics(
+    metrics: Metrics, port: int, host: str = "127.0.0.1"
+) -> ThreadingHTTPServer:
+    # Serves GET /metrics in Prometheus text format from a daemon thread;
+    # call .shutdown() on the returned server to stop it.
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass  # scrapes are not worth a log line each
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="pinion-metrics", daemon=True
+    ).start()
+    return server
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import tracemalloc
+
+from .types import Job
+
+if TYPE_CHECKING:
+    from .worker import Worker
+
+HOOKS = ("before_claim", "before_execute", "after_execute", "on_retry", "on_dead_letter")
+
+
+class Middleware:
+    # Subclass and override the hooks you need; the rest cost nothing, as
+    # Worker only calls hooks a middleware actually overrides. Hooks run on
+    # the thread processing the job. An exception from before_execute fails
+    # the job like a task error; exceptions from other hooks are logged.
+    def before_claim(self, worker: Worker) -> None:
+        pass
+
+    def before_execute(self, worker: Worker, job: Job) -> None:
+        pass
+
+    # Called after every execution attempt; exc is None on success
+    def after_execute(
+        self, worker: Worker, job: Job, result: Any, exc: Exception | None
+    ) -> None:
+        pass
+
+    def on_retry(self, worker: Worker, job: Job, exc: Exception, delay: float) -> None:
+        pass
+
+    def on_dead_letter(self, worker: Worker, job: Job, exc: Exception) -> None:
+        pass
+
+
+def resolve_hooks(middleware: Iterable[Middleware]) -> dict[str, tuple[Any, ...]]:
+    # Bound hook methods per name, only for overrides. after_execute runs in
+    # reverse order so middlewares nest like context managers.
+    chain = list(middleware)
+    hooks: dict[str, tuple[Any, ...]] = {}
+    for name in HOOKS:
+        base = getattr(Middleware, name)
+        bound = [
+            getattr(m, name)
+            for m in chain
+            if getattr(type(m), name, base) is not base
+        ]
+        if name == "after_execute":
+            bound.reverse()
+        hooks[name] = tuple(bound)
+    return hooks
+
+
+class ProfilingMiddleware(Middleware):
+    # Profiles a random sample of jobs and keeps the hottest functions per
+    # task. mode="cprofile" times the worker thread running the task (sync
+    # tasks without task_timeout); mode="tracemalloc" records where the
+    # job's retained memory was allocated. One job is profiled at a time.
+    def __init__(
+        self,
+        sample_rate: float = 0.01,
+        mode: str = "cprofile",
+        top: int = 15,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        if mode not in ("cprofile", "tracemalloc"):
+            raise ValueError(f"unknown profiling mode {mode!r}")
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.top = top
+        self.log = logger or logging.getLogger("pinion.profile")
+        self._busy = threading.Lock()
+        self._active: dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._stats: dict[str, pstats.Stats] = {}
+        self._allocations: dict[str, dict[str, int]] = {}
+
+    def before_execute(self, worker: Worker, job: Job) -> None:
+        if random.random() >= self.sample_rate or not self._busy.acquire(blocking=False):
+            return
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            self._active[job.id] = profiler
+            profiler.enable()
+        else:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            self._active[job.id] = (started, tracemalloc.take_snapshot())
+
+    def after_execute(
+        self, worker: Worker, job: Job, result: Any, exc: Exception | None
+    ) -> None:
+        state = self._active.pop(job.id, None)
+        if state is None:
+            return
+        try:
+            if self.mode == "cprofile":
+                state.disable()
+                self._record_profile(job.func_name, state)
+            else:
+                started, before = state
+                after = tracemalloc.take_snapshot()
+                if started:
+                    tracemalloc.stop()
+                self._record_allocations(job.func_name, after.compare_to(before, "lineno"))
+        finally:
+            self._busy.release()
+
+    def _record_profile(self, task: str, profiler: cProfile.Profile) -> None:
+        with self._lock:
+            stats = self._stats.get(task)
+            if stats is None:
+                self._stats[task] = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+        self.log.info("profile.sample task=%s\n%s", task, self._format_stats(pstats.Stats(profiler)))
+
+    def _record_allocations(self, task: str, diffs: list[tracemalloc.StatisticDiff]) -> None:
+        with self._lock:
+            totals = self._allocations.setdefault(task, {})
+            for diff in diffs:
+                where = str(diff.traceback[0])
+                totals[where] = totals.get(where, 0) + diff.size_diff
+        lines = [f"{d.size_diff:+d} B {d.traceback[0]}" for d in diffs[: self.top]]
+        self.log.info("profile.sample task=%s\n%s", task, "\n".join(lines))
+
+    def _format_stats(self, stats: pstats.Stats) -> str:
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(self.top)
+        return out.getvalue()
+
+    def tasks(self) -> list[str]:
+        with self._lock:
+            return sorted({*self._stats, *self._allocations})
+
+    def report(self, task: str) -> str:
+        # Hottest functions (cprofile) or allocation sites (tracemalloc)
+        # over every sample of the task so far
+        with self._lock:
+            if self.mode == "cprofile":
+                stats = self._stats.get(task)
+                return self._format_stats(stats) if stats is not None else ""
+            totals = sorted(
+                self._allocations.get(task, {}).items(), key=lambda kv: -abs(kv[1])
+            )
+            return "\n".join(f"{size:+d} B {where}" for where, size in totals[: self.top])
+
+    def dump(self, directory: str) -> list[Path]:
+        # One file per task: <task>.prof (load with pstats) or <task>.txt
+        out = Path(directory)
+        out.mkdir(parents=True, exist_ok=True)
+        written = []
+        for task in self.tasks():
+            safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in task)
+            if self.mode == "cprofile":
+                path = out / f"{safe}.prof"
+                with self._lock:
+                    self._stats[task].dump_stats(path)
+            else:
+                path = out / f"{safe}.txt"
+                path.write_text(self.report(task) + "\n")
+            written.append(path)
+        return written
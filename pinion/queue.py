@@ -4,13 +4,19 @@ from __future__ import annotations
 # to smaller, focused modules for maintainability.
 
 from .types import Job, Status
-from .storage import Storage
+from .storage import ResultStore, Storage
 from .inmemory import InMemoryStorage
 from .worker import Worker
+from .aio import AsyncWorker, aget_result, aget_results
+from .middleware import Middleware, ProfilingMiddleware
 from .retry import RetryPolicy
+from .retention import RetentionPolicy
 from .registry import task
 from .sqlite_storage import SqliteStorage
-from .errors import PinionError, TaskNotFound, TaskExecutionError
+from .sharded import ShardedSqliteStorage
+from .broker import Broker
+from .remote import RemoteStorage
+from .errors import BrokerError, PinionError, TaskNotFound, TaskExecutionError
 
 # ---------- Demo tasks (kept for backward-compat behavior) ----------
 @task()
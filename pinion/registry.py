@@ -1,15 +1,37 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from typing import Any, Callable
 
 
 REGISTRY: dict[str, Callable[..., Any]] = {}
 
 
-def task(name: str | None = None):
+@dataclass(frozen=True, slots=True)
+class BatchSpec:
+    size: int  # most jobs per handler call
+    wait: float = 0.0  # seconds to wait for more jobs before calling
+
+
+# Task name -> batching options, for tasks registered with batch_size. The
+# handler takes a list[Job] and returns None (all succeeded) or one entry
+# per job: its result, or an Exception instance to fail just that job.
+BATCHES: dict[str, BatchSpec] = {}
+
+
+def task(
+    name: str | None = None, *, batch_size: int | None = None, batch_wait: float = 0.0
+):
+    if batch_size is not None and batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
     def deco(fn: Callable[..., Any]):
-        REGISTRY[(name or fn.__name__).lower()] = fn
+        key = (name or fn.__name__).lower()
+        REGISTRY[key] = fn
+        if batch_size is not None:
+            BATCHES[key] = BatchSpec(batch_size, max(0.0, batch_wait))
+        else:
+            BATCHES.pop(key, None)
         return fn
 
     return deco
-
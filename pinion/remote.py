@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Iterable, Sequence
+from concurrent.futures import Future
+from datetime import datetime
+from itertools import count, islice
+from typing import Any
+import socket
+import threading
+import time
+
+from .broker import (
+    ERROR, HEADER, HELLO, OK, OP_CODES, job_from_wire, job_to_wire, wire_serializer,
+)
+from .errors import BrokerError, TaskExecutionError
+from .serializers import Serializer, get_serializer
+from .types import Job, check_on_duplicate, resolve_run_at
+
+
+# Errors a backend raises as part of the SPI, re-raised as themselves
+_ERRORS: dict[str, type[Exception]] = {
+    "ValueError": ValueError,
+    "TimeoutError": TimeoutError,
+    "KeyError": KeyError,
+}
+# enqueue_many chunks in flight before waiting for the oldest reply
+_WINDOW = 8
+
+
+def parse_address(address: str | tuple[str, int]) -> tuple[str, int]:
+    if isinstance(address, tuple):
+        return address
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class _Connection:
+    # One socket shared by any number of threads: requests are written
+    # whole under a lock and a reader thread completes each caller's
+    # future by request id, so calls pipeline instead of taking turns.
+    def __init__(self, address: tuple[str, int], serializer: Serializer, timeout: float) -> None:
+        self._sock = socket.create_connection(address, timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        self._send_lock = threading.Lock()
+        self._pending: dict[int, Future[tuple[int, bytes]]] = {}
+        self._ids = count(1)
+        self.closed = False
+        try:
+            self._sock.sendall(HEADER.pack(len(serializer.name), 0, HELLO) + serializer.name.encode())
+            status, body = self._read()
+        except OSError:
+            self.close()
+            raise
+        if status != OK:
+            self.close()
+            raise BrokerError(body.decode())
+        self._sock.settimeout(None)
+        threading.Thread(target=self._read_loop, name="pinion-remote", daemon=True).start()
+
+    def _read(self) -> tuple[int, bytes]:
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ConnectionError("broker closed the connection")
+        length, _, status = HEADER.unpack(header)
+        body = self._file.read(length)
+        if len(body) < length:
+            raise ConnectionError("broker closed the connection")
+        return status, body
+
+    def _read_loop(self) -> None:
+        try:
+            while True:
+                header = self._file.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                length, request_id, status = HEADER.unpack(header)
+                body = self._file.read(length)
+                if len(body) < length:
+                    break
+                future = self._pending.pop(request_id, None)
+                if future is not None:
+                    future.set_result((status, body))
+        except (OSError, ValueError):
+            pass
+        self.close()
+
+    def request(self, op: int, body: bytes) -> Future[tuple[int, bytes]]:
+        future: Future[tuple[int, bytes]] = Future()
+        with self._send_lock:
+            if self.closed:
+                raise ConnectionError("broker connection is closed")
+            request_id = next(self._ids) & 0xFFFFFFFF
+            self._pending[request_id] = future
+            try:
+                self._sock.sendall(HEADER.pack(len(body), request_id, op) + body)
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                self.close()
+                raise ConnectionError(f"broker connection lost: {e}") from e
+        return future
+
+    def close(self) -> None:
+        with self._send_lock:
+            if self.closed:
+                return
+            self.closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        while self._pending:
+            _, future = self._pending.popitem()
+            future.set_exception(ConnectionError("broker connection lost"))
+
+
+class RemoteStorage:
+    # Storage (and ResultStore) served by a `pinion broker`. Calls from all
+    # threads spread over pool_size connections, each pipelining requests,
+    # and blocking claims wait on the broker, which pushes a reply as soon
+    # as work arrives. Dropped connections are reopened on the next call; a
+    # claim that can't reach the broker returns [] after a short pause, so
+    # workers ride out broker restarts.
+    def __init__(
+        self,
+        address: str | tuple[str, int] = "127.0.0.1:7878",
+        pool_size: int = 2,
+        serializer: str | Serializer | None = None,
+        connect_timeout: float = 5.0,
+    ) -> None:
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.address = parse_address(address)
+        # must match the broker's; both default to wire_serializer()
+        self._serializer = get_serializer(serializer or wire_serializer())
+        self._connect_timeout = connect_timeout
+        self._pool: list[_Connection | None] = [None] * pool_size
+        self._pool_lock = threading.Lock()
+        self._next = count()
+
+    # --- transport ---
+    def _connection(self) -> _Connection:
+        slot = next(self._next) % len(self._pool)
+        conn = self._pool[slot]
+        if conn is None or conn.closed:
+            with self._pool_lock:
+                conn = self._pool[slot]
+                if conn is None or conn.closed:
+                    conn = self._pool[slot] = _Connection(
+                        self.address, self._serializer, self._connect_timeout
+                    )
+        return conn
+
+    def _send(self, op: str, *args: Any) -> Future[tuple[int, bytes]]:
+        body = self._serializer.dumps(args)
+        try:
+            return self._connection().request(OP_CODES[op], body)
+        except ConnectionError:
+            raise
+        except OSError as e:  # e.g. a connect timeout
+            raise ConnectionError(f"cannot reach broker at {self.address}: {e}") from e
+
+    def _result(self, future: Future[tuple[int, bytes]]) -> Any:
+        status, body = future.result()
+        value = self._serializer.loads(body)
+        if status == ERROR:
+            name, message = value
+            raise _ERRORS.get(name, BrokerError)(message)
+        return value
+
+    def _call(self, op: str, *args: Any) -> Any:
+        return self._result(self._send(op, *args))
+
+    # --- Storage ---
+    def enqueue(
+        self,
+        job: Job,
+        *,
+        delay: float | None = None,
+        eta: float | datetime | None = None,
+        on_duplicate: str = "ignore",
+    ) -> str:
+        check_on_duplicate(on_duplicate)
+        if delay is not None or eta is not None:
+            job.run_at = resolve_run_at(delay, eta)
+        return self._call("enqueue", job_to_wire(job), on_duplicate)
+
+    def enqueue_many(
+        self, jobs: Iterable[Job], *, chunk_size: int = 1000, on_duplicate: str = "ignore"
+    ) -> int:
+        # Chunks are pipelined: up to _WINDOW are in flight at once, so the
+        # stream is never held in memory and round-trips overlap
+        check_on_duplicate(on_duplicate)
+        it = iter(jobs)
+        inflight: deque[Future[tuple[int, bytes]]] = deque()
+        total = 0
+        while chunk := [job_to_wire(job) for job in islice(it, chunk_size)]:
+            inflight.append(self._send("enqueue_many", chunk, on_duplicate))
+            if len(inflight) >= _WINDOW:
+                total += self._result(inflight.popleft())
+        while inflight:
+            total += self._result(inflight.popleft())
+        return total
+
+    def dequeue(
+        self, timeout: float | None = None, queues: Sequence[str] | None = None
+    ) -> Job | None:
+        jobs = self.dequeue_many(1, timeout, queues)
+        return jobs[0] if jobs else None
+
+    def dequeue_many(
+        self,
+        n: int,
+        timeout: float | None = None,
+        queues: Sequence[str] | None = None,
+        task: str | None = None,
+    ) -> list[Job]:
+        try:
+            found = self._call(
+                "dequeue_many", n, timeout, list(queues) if queues else None, task
+            )
+        except ConnectionError:
+            time.sleep(min(timeout, 1.0) if timeout is not None else 1.0)
+            return []
+        return [job_from_wire(fields) for fields in found]
+
+    def mark_done(self, job: Job) -> None:
+        self._call("mark_done", job_to_wire(job))
+
+    def mark_failed(self, job: Job, exc: Exception) -> None:
+        self._call("mark_failed", job_to_wire(job), repr(exc))
+
+    def retry_later(self, job: Job, exc: Exception, delay: float) -> None:
+        self._call("retry_later", job_to_wire(job), repr(exc), delay)
+
+    def dead_letter(self, job: Job, exc: Exception) -> None:
+        self._call("dead_letter", job_to_wire(job), repr(exc))
+
+    def size(self, queue: str | None = None) -> int:
+        return self._call("size", queue)
+
+    def heartbeat(self, job: Job) -> None:
+        self.heartbeat_many([job])
+
+    def heartbeat_many(self, jobs: Iterable[Job]) -> None:
+        chunk = [job_to_wire(job) for job in jobs]
+        if chunk:
+            self._call("heartbeat_many", chunk)
+
+    def release(self, jobs: Iterable[Job]) -> None:
+        chunk = [job_to_wire(job) for job in jobs]
+        if chunk:
+            self._call("release", chunk)
+
+    def reap_stale(self, visibility_timeout: float) -> int:
+        return self._call("reap_stale", visibility_timeout)
+
+    # --- results ---
+    def store_result(
+        self, job: Job, value: Any = None, error: str | None = None
+    ) -> None:
+        self._call("store_result", job_to_wire(job), value, error)
+
+    def get_result(self, job_id: str, timeout: float | None = None) -> Any:
+        found = self.get_results([job_id], timeout)
+        if job_id not in found:
+            raise TimeoutError(f"no result for job {job_id} after {timeout}s")
+        value = found[job_id]
+        if isinstance(value, TaskExecutionError):
+            raise value
+        return value
+
+    def get_results(
+        self, job_ids: Iterable[str], timeout: float | None = 0
+    ) -> dict[str, Any]:
+        rows = self._call("get_results", list(job_ids), timeout)
+        return {
+            job_id: TaskExecutionError(error) if error is not None else value
+            for job_id, value, error in rows
+        }
+
+    def close(self) -> None:
+        with self._pool_lock:
+            for conn in self._pool:
+                if conn is not None:
+                    conn.close()
+            self._pool = [None] * len(self._pool)
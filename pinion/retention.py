@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class RetentionPolicy:
+    # Finished (SUCCESS/FAILED) jobs are pruned when older than max_age
+    # seconds or beyond the newest max_count; either may be None.
+    max_age: float | None = 7 * 24 * 3600.0
+    max_count: int | None = None
+    archive_path: str | None = None  # move pruned rows to this SQLite file
+    batch_size: int = 500  # rows per short write transaction
+    interval: float = 60.0  # seconds between maintenance runs
+    vacuum_pages: int = 1000  # free pages returned to the OS per run
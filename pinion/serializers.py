@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from typing import Any, Protocol, runtime_checkable
+import json
+import pickle
+
+
+# Encodes job payloads (args, kwargs), stored results and DLQ entries for
+# SqliteStorage. The name is recorded in the database so every process
+# opening it decodes with the same codec.
+@runtime_checkable
+class Serializer(Protocol):
+    name: str
+
+    def dumps(self, obj: Any) -> bytes: ...
+    def loads(self, data: bytes) -> Any: ...
+
+
+class JsonSerializer:
+    # Portable and human-readable; only JSON types round-trip
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class PickleSerializer:
+    # Default: fast, compact and round-trips bytes, datetimes, numpy arrays
+    # and other picklable objects. Only open databases you trust.
+    name = "pickle"
+
+    def dumps(self, obj: Any) -> bytes:
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+class MsgpackSerializer:
+    # Compact and language-neutral; needs the optional msgpack package
+    name = "msgpack"
+
+    def __init__(self) -> None:
+        try:
+            import msgpack
+        except ImportError:
+            raise ImportError(
+                "the msgpack serializer needs msgpack: pip install 'pinion-queue[msgpack]'"
+            ) from None
+        self._msgpack = msgpack
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return self._msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+SERIALIZERS: dict[str, type[Any]] = {
+    "json": JsonSerializer,
+    "pickle": PickleSerializer,
+    "msgpack": MsgpackSerializer,
+}
+
+
+def get_serializer(spec: str | Serializer) -> Serializer:
+    if not isinstance(spec, str):
+        return spec
+    try:
+        return SERIALIZERS[spec]()
+    except KeyError:
+        raise ValueError(
+            f"unknown serializer {spec!r} (known: {list(SERIALIZERS)})"
+        ) from None
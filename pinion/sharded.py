@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Sequence
+from dataclasses import replace
+from datetime import datetime
+from itertools import count, islice
+from pathlib import Path
+from typing import Any
+import random
+import sqlite3
+import threading
+import time
+import zlib
+
+from .retention import RetentionPolicy
+from .serializers import Serializer
+from .sqlite_storage import SqliteStorage
+from .types import Job
+
+SHARD_BY = ("id", "queue")
+
+
+def shard_paths(path: str, shards: int) -> list[str]:
+    # pinion.db -> pinion.0.db, pinion.1.db, ...
+    if path == ":memory:":
+        return [path] * shards
+    p = Path(path)
+    return [str(p.with_name(f"{p.stem}.{i}{p.suffix}")) for i in range(shards)]
+
+
+class ShardedSqliteStorage:
+    # Spreads jobs over N SQLite files, each with its own write lock, so
+    # writers on different shards never wait for each other. A job's shard
+    # follows from its fields (dedup_key, else id or queue), so acks need no
+    # lookup table; results live on the shard of their job id. Priority
+    # order holds within a shard, not across shards.
+    def __init__(
+        self,
+        path: str = "pinion.db",
+        shards: int = 4,
+        shard_by: str | None = None,
+        watch_interval: float | None = None,
+        retention: RetentionPolicy | None = None,
+        serializer: str | Serializer | None = None,
+        piggyback_heartbeats: float | None = None,
+    ) -> None:
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        if shard_by is not None and shard_by not in SHARD_BY:
+            raise ValueError(f"shard_by must be one of {SHARD_BY}, not {shard_by!r}")
+        self._watch_interval = watch_interval
+        self._cv = threading.Condition()
+        if retention is not None and retention.max_count is not None:
+            # max_count is for the whole storage; each shard keeps its share
+            retention = replace(retention, max_count=-(-retention.max_count // shards))
+        self.shards: list[SqliteStorage] = []
+        try:
+            for i, shard_path in enumerate(shard_paths(path, shards)):
+                shard = SqliteStorage(
+                    shard_path,
+                    watch_interval=watch_interval,
+                    retention=retention,
+                    serializer=serializer,
+                    piggyback_heartbeats=piggyback_heartbeats,
+                    wakeup=self._cv,
+                )
+                self.shards.append(shard)
+                # None adopts what the files were created with, "id" for new ones
+                shard_by = self._check_layout(shard, f"{i}/{shards}", shard_by)
+        except BaseException:
+            self.close()
+            raise
+        self._shard_by = shard_by
+        # Claims start at a random shard so workers in different processes
+        # don't all hit shard 0 first, then rotate per call
+        self._rotation = count(random.randrange(shards))
+
+    @staticmethod
+    def _check_layout(shard: SqliteStorage, label: str, shard_by: str | None) -> str:
+        # Each file records its place in the layout; reopening with another
+        # shard count or key would route existing jobs to the wrong file
+        with shard._lock:
+            conn = shard._conn
+            conn.executemany(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?);",
+                [("shard", label), ("shard_by", shard_by or "id")],
+            )
+            meta = dict(
+                conn.execute("SELECT key, value FROM meta WHERE key IN ('shard', 'shard_by');")
+            )
+        if meta["shard"] != label:
+            raise ValueError(f"{shard._path} is shard {meta['shard']}, not {label}")
+        if shard_by is not None and meta["shard_by"] != shard_by:
+            raise ValueError(
+                f"{shard._path} is sharded by {meta['shard_by']!r}, not {shard_by!r}"
+            )
+        return meta["shard_by"]
+
+    # --- routing ---
+    def _index(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % len(self.shards)
+
+    def _index_of(self, job: Job) -> int:
+        # dedup keys route by themselves so a key is unique across shards
+        if job.dedup_key is not None:
+            return self._index(job.dedup_key)
+        return self._index(job.queue if self._shard_by == "queue" else job.id)
+
+    def shard_for(self, job: Job) -> SqliteStorage:
+        return self.shards[self._index_of(job)]
+
+    def _group(self, jobs: Iterable[Job]) -> dict[int, list[Job]]:
+        groups: dict[int, list[Job]] = {}
+        for job in jobs:
+            groups.setdefault(self._index_of(job), []).append(job)
+        return groups
+
+    def _generation(self) -> int:
+        return sum(shard._generation for shard in self.shards)
+
+    # --- API ---
+    def enqueue(
+        self,
+        job: Job,
+        *,
+        delay: float | None = None,
+        eta: float | datetime | None = None,
+        on_duplicate: str = "ignore",
+    ) -> str:
+        return self.shard_for(job).enqueue(
+            job, delay=delay, eta=eta, on_duplicate=on_duplicate
+        )
+
+    def enqueue_many(
+        self, jobs: Iterable[Job], *, chunk_size: int = 1000, on_duplicate: str = "ignore"
+    ) -> int:
+        # Each chunk is split by shard: one transaction per shard it touches
+        it = iter(jobs)
+        added = 0
+        while chunk := list(islice(it, chunk_size)):
+            for index, group in self._group(chunk).items():
+                added += self.shards[index].enqueue_many(
+                    group, chunk_size=chunk_size, on_duplicate=on_duplicate
+                )
+        return added
+
+    def dequeue(
+        self, timeout: float | None = None, queues: Sequence[str] | None = None
+    ) -> Job | None:
+        jobs = self.dequeue_many(1, timeout, queues)
+        return jobs[0] if jobs else None
+
+    def dequeue_many(
+        self,
+        n: int,
+        timeout: float | None = None,
+        queues: Sequence[str] | None = None,
+        task: str | None = None,
+    ) -> list[Job]:
+        deadline = None if timeout is None else time.time() + timeout
+        poll = 0.25 if self._watch_interval is None else 2.0
+        while True:
+            generation = self._generation()
+            jobs = self._claim(n, queues, task)
+            if jobs:
+                return jobs
+
+            # none available on any shard: block on the shared wakeup
+            wait = poll
+            next_due = self._next_due()
+            if next_due is not None:
+                wait = max(0.0, min(wait, next_due - time.time()))
+            if timeout is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return []
+                wait = min(wait, remaining)
+            with self._cv:
+                if self._generation() == generation:
+                    self._cv.wait(wait)
+
+    def _claim(
+        self, n: int, queues: Sequence[str] | None = None, task: str | None = None
+    ) -> list[Job]:
+        # Start at the next shard in rotation and take what is left of n from
+        # the ones after it, so a busy shard never starves a claimer. Queues
+        # stay in the order given: every shard is drained of the first queue
+        # before any is asked for the next.
+        total = len(self.shards)
+        start = next(self._rotation) % total
+        order = [self.shards[(start + i) % total] for i in range(total)]
+        jobs: list[Job] = []
+        for queue in queues or [None]:
+            for shard in order:
+                try:
+                    if queue is None:
+                        jobs.extend(shard._claim(n - len(jobs), None, task))
+                    else:
+                        jobs.extend(shard._claim_from(n - len(jobs), queue, task))
+                except sqlite3.OperationalError:
+                    continue  # busy; the next shard may not be
+                if len(jobs) >= n:
+                    return jobs
+        return jobs
+
+    def _next_due(self) -> float | None:
+        due = []
+        for shard in self.shards:
+            try:
+                next_due = shard._next_due()
+            except sqlite3.OperationalError:
+                continue  # busy; its waiters poll
+            if next_due is not None:
+                due.append(next_due)
+        return min(due, default=None)
+
+    def mark_done(self, job: Job) -> None:
+        self.shard_for(job).mark_done(job)
+
+    def mark_failed(self, job: Job, exc: Exception) -> None:
+        self.shard_for(job).mark_failed(job, exc)
+
+    def retry_later(self, job: Job, exc: Exception, delay: float) -> None:
+        self.shard_for(job).retry_later(job, exc, delay)
+
+    def dead_letter(self, job: Job, exc: Exception) -> None:
+        self.shard_for(job).dead_letter(job, exc)
+
+    def size(self, queue: str | None = None) -> int:
+        return sum(shard.size(queue) for shard in self.shards)
+
+    def heartbeat(self, job: Job) -> None:
+        self.shard_for(job).heartbeat(job)
+
+    def heartbeat_many(self, jobs: Iterable[Job]) -> None:
+        for index, group in self._group(jobs).items():
+            self.shards[index].heartbeat_many(group)
+
+    def release(self, jobs: Iterable[Job]) -> None:
+        for index, group in self._group(jobs).items():
+            self.shards[index].release(group)
+
+    def reap_stale(self, visibility_timeout: float) -> int:
+        return sum(shard.reap_stale(visibility_timeout) for shard in self.shards)
+
+    # --- results ---
+    def store_result(
+        self, job: Job, value: Any = None, error: str | None = None
+    ) -> None:
+        self.shards[self._index(job.id)].store_result(job, value, error)
+
+    def get_result(self, job_id: str, timeout: float | None = None) -> Any:
+        return self.shards[self._index(job_id)].get_result(job_id, timeout)
+
+    def get_results(
+        self, job_ids: Iterable[str], timeout: float | None = 0
+    ) -> dict[str, Any]:
+        by_shard: dict[int, list[str]] = {}
+        for job_id in dict.fromkeys(job_ids):
+            by_shard.setdefault(self._index(job_id), []).append(job_id)
+        deadline = None if timeout is None else time.time() + timeout
+        found: dict[str, Any] = {}
+        for index, ids in by_shard.items():
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            found.update(self.shards[index].get_results(ids, remaining))
+        return found
+
+    # --- maintenance ---
+    def prune(
+        self,
+        max_age: float | None = None,
+        max_count: int | None = None,
+        archive_path: str | None = None,
+        batch_size: int = 500,
+    ) -> int:
+        # max_count is split evenly: each shard keeps its newest share
+        share = None if max_count is None else -(-max_count // len(self.shards))
+        return sum(
+            shard.prune(max_age, share, archive_path, batch_size) for shard in self.shards
+        )
+
+    def vacuum(self, pages: int | None = None, full: bool = False) -> int:
+        # pages limits each shard, not the total
+        return sum(shard.vacuum(pages, full) for shard in self.shards)
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
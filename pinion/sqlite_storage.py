@@ -1,203 +1,937 @@
 from __future__ import annotations
 
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Iterable, Sequence
 import json
 import sqlite3
 import threading
 import time
-from typing import Any
+import weakref
 
-from .types import Job, Status
+from .errors import TaskExecutionError
+from .retention import RetentionPolicy
+from .serializers import Serializer, get_serializer
+from .types import Job, Status, check_on_duplicate, resolve_run_at
+
+
+_JOB_COLUMNS = "id, func_name, args, kwargs, status, attempts, created_at, error, run_at, priority, queue, dedup_key"
+_ARCHIVE_COLUMNS = _JOB_COLUMNS + ", finished_at"
+# Status is stored as the enum's integer value. The values are inlined into
+# SQL (not bound) so the planner can match the partial indexes.
+_PENDING = Status.PENDING.value
+_RUNNING = Status.RUNNING.value
+_SUCCESS = Status.SUCCESS.value
+_FAILED = Status.FAILED.value
+_FINISHED = f"status IN ({_SUCCESS}, {_FAILED})"
+_LIVE_KEY = f"dedup_key IS NOT NULL AND status IN ({_PENDING}, {_RUNNING})"
+# One upsert per on_duplicate policy. A conflict on the dedup index updates
+# (or leaves) the live job and RETURNING yields its id; running duplicates
+# fail the WHERE and return nothing.
+_INSERT_JOB = {
+    policy: (
+        "INSERT OR REPLACE INTO jobs (id, func_name, args, kwargs, status, attempts, created_at, error, heartbeat_at, run_at, priority, queue, dedup_key)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL, ?, ?, ?, ?)"
+        f" ON CONFLICT(dedup_key) WHERE {_LIVE_KEY} DO UPDATE SET {update}"
+    )
+    for policy, update in {
+        "ignore": "dedup_key=excluded.dedup_key",
+        "replace": f"args=excluded.args, kwargs=excluded.kwargs WHERE status={_PENDING}",
+        "bump": f"priority=max(priority, excluded.priority) WHERE status={_PENDING}",
+    }.items()
+}
+_REFRESH_LEASES = (
+    f"UPDATE jobs SET heartbeat_at=? WHERE status={_RUNNING} "
+    "AND id IN (SELECT value FROM json_each(?));"
+)
+# PRAGMA user_version; 1 = integer status and serializer-encoded BLOBs,
+# 2 = dedup_key, 3 = queue, priority and dedup_key kept in the DLQ
+_SCHEMA_VERSION = 3
+
+_CREATE_JOBS = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id          TEXT PRIMARY KEY,
+        func_name   TEXT NOT NULL,
+        args        BLOB NOT NULL,   -- serializer-encoded
+        kwargs      BLOB NOT NULL,   -- serializer-encoded
+        status      INTEGER NOT NULL,   -- Status value
+        attempts    INTEGER NOT NULL,
+        created_at  REAL NOT NULL,
+        error       TEXT,
+        heartbeat_at REAL,
+        run_at      REAL NOT NULL DEFAULT 0,  -- not claimable before
+        priority    INTEGER NOT NULL DEFAULT 0,  -- higher first
+        queue       TEXT NOT NULL DEFAULT 'default',
+        finished_at REAL,  -- set on SUCCESS/FAILED, drives retention
+        dedup_key   TEXT   -- unique among PENDING/RUNNING rows
+    );
+"""
+_CREATE_DLQ = """
+    CREATE TABLE IF NOT EXISTS dlq (
+        id           TEXT PRIMARY KEY,
+        func_name    TEXT NOT NULL,
+        args         BLOB NOT NULL,
+        kwargs       BLOB NOT NULL,
+        attempts     INTEGER NOT NULL,
+        error        TEXT NOT NULL,
+        failed_at    REAL NOT NULL,
+        queue        TEXT NOT NULL DEFAULT 'default',  -- restored on replay
+        priority     INTEGER NOT NULL DEFAULT 0,
+        dedup_key    TEXT
+    );
+"""
+# Task return values, written when a job finishes
+_CREATE_RESULTS = """
+    CREATE TABLE IF NOT EXISTS results (
+        job_id       TEXT PRIMARY KEY,
+        value        BLOB,   -- serializer-encoded
+        error        TEXT,   -- set when the job failed for good
+        finished_at  REAL NOT NULL
+    );
+"""
+
+class _ThreadConnections:
+    # One connection per thread, opened on first use. Connections owned by
+    # threads that have exited are closed whenever a new one is opened, so
+    # the pool stays bounded by the number of live threads.
+    def __init__(self, connect: Callable[[], sqlite3.Connection]) -> None:
+        self._connect = connect
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._owned: list[tuple[weakref.ref[threading.Thread], sqlite3.Connection]] = []
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._lock:
+                owned = []
+                for ref, other in self._owned:
+                    thread = ref()
+                    if thread is None or not thread.is_alive():
+                        other.close()
+                    else:
+                        owned.append((ref, other))
+                owned.append((weakref.ref(threading.current_thread()), conn))
+                self._owned = owned
+        return conn
+
+    def close_all(self) -> None:
+        with self._lock:
+            for _, conn in self._owned:
+                conn.close()
+            self._owned = []
 
 
 class SqliteStorage:
-    def __init__(self, path: str = "pinion.db") -> None:
-        self._cv = threading.Condition()  # local process wakeups
-        self._lock = threading.RLock()  # serialize access to sqlite connection
-        self._conn = sqlite3.connect(
-            path, isolation_level=None, check_same_thread=False
-        )
+    def __init__(
+        self,
+        path: str = "pinion.db",
+        watch_interval: float | None = None,
+        retention: RetentionPolicy | None = None,
+        serializer: str | Serializer | None = None,
+        piggyback_heartbeats: float | None = None,
+        wakeup: threading.Condition | None = None,
+    ) -> None:
+        # Connections open lazily in each thread, so pin the file now; a
+        # later os.chdir must not point new threads at another database
+        self._path = path if path == ":memory:" else str(Path(path).absolute())
+        # Leases claimed through this instance, id -> last refresh. With
+        # piggybacking, leases older than the interval are refreshed inside
+        # claim/ack transactions that happen anyway, and heartbeat_many
+        # skips the ones refreshed recently.
+        self._piggyback = piggyback_heartbeats
+        self._leases: dict[str, float] = {}
+        self._leases_lock = threading.Lock()
+        # local process wakeups; ShardedSqliteStorage passes one condition
+        # to all its shards so a claimer wakes for work on any of them
+        self._cv = wakeup or threading.Condition()
+        # Bumped on every wakeup so a claimer never sleeps through one that
+        # arrived between its claim attempt and its wait
+        self._generation = 0
+        # Result waiters have their own condition so finished jobs don't
+        # wake idle claimers and vice versa
+        self._results_cv = threading.Condition()
+        self._results_generation = 0
+        self._result_waiters = 0
+        self._closed = threading.Event()
+        self._watch_interval = watch_interval
+        self._watcher: threading.Thread | None = None
+        self._retention = retention
+        self._maintainer: threading.Thread | None = None
+        self._shared: sqlite3.Connection | None = None
+        if path == ":memory:":
+            # every connection would be a separate database: share one and
+            # serialize access to it
+            self._shared = self._connect()
+            self._lock: Any = threading.RLock()
+            self._read_lock: Any = self._lock
+        else:
+            # Writers get a connection per thread and readers separate
+            # read-only ones, so WAL readers never queue behind claims.
+            # This instance's writers take turns on an in-process lock:
+            # threads colliding on SQLite's write lock would otherwise
+            # back off in busy_timeout sleeps of a millisecond or more.
+            # Other processes are still serialized by busy_timeout.
+            self._writers = _ThreadConnections(self._connect)
+            self._readers = _ThreadConnections(lambda: self._connect(readonly=True))
+            self._lock = threading.RLock()
+            self._read_lock = nullcontext()
         with self._lock:
+            # Only takes effect on a new file; lets vacuum() return freed
+            # pages a few at a time instead of rewriting the whole DB
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
             self._conn.execute("PRAGMA journal_mode=WAL;")
-            self._conn.execute("PRAGMA busy_timeout=3000;")
-            self._conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS jobs (
-                    id         TEXT PRIMARY KEY,
-                    func_name  TEXT NOT NULL,
-                    args       TEXT NOT NULL,   -- json
-                    kwargs     TEXT NOT NULL,   -- json
-                    status     TEXT NOT NULL,   -- PENDING/RUNNING/SUCCESS/FAILED
-                    attempts   INTEGER NOT NULL,
-                    created_at REAL NOT NULL,
-                    error      TEXT,
-                    heartbeat_at REAL
-                );
-            """
-            )
-            # Best-effort schema upgrade for older DBs without heartbeat_at
+            # One write transaction, so processes opening the same file at
+            # once don't race through the upgrade
+            self._conn.execute("BEGIN IMMEDIATE;")
             try:
-                self._conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL;")
-            except sqlite3.OperationalError:
-                pass
-            self._conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at);"
+                self._serializer = self._setup_schema(serializer)
+                self._conn.execute("COMMIT;")
+            except BaseException:
+                self._conn.execute("ROLLBACK;")
+                raise
+
+        if watch_interval is not None and path != ":memory:":
+            self._watcher = threading.Thread(
+                target=self._watch_loop, name="pinion-sqlite-watch", daemon=True
             )
-            self._conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_jobs_status_hb ON jobs(status, heartbeat_at);"
+            self._watcher.start()
+        if retention is not None:
+            self._maintainer = threading.Thread(
+                target=self._maintain_loop, name="pinion-sqlite-maint", daemon=True
             )
-            # Dead letter table
-            self._conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS dlq (
-                    id           TEXT PRIMARY KEY,
-                    func_name    TEXT NOT NULL,
-                    args         TEXT NOT NULL,
-                    kwargs       TEXT NOT NULL,
-                    attempts     INTEGER NOT NULL,
-                    error        TEXT NOT NULL,
-                    failed_at    REAL NOT NULL
-                );
-                """
+            self._maintainer.start()
+
+    def _setup_schema(self, requested: str | Serializer | None) -> Serializer:
+        # caller holds the write transaction
+        conn = self._conn
+        version = conn.execute("PRAGMA user_version;").fetchone()[0]
+        tables = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        }
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+        row = conn.execute("SELECT value FROM meta WHERE key='serializer';").fetchone()
+        if row is None:
+            serializer = get_serializer(requested or "pickle")
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('serializer', ?);", (serializer.name,)
             )
+        else:
+            serializer = get_serializer(requested or row[0])
+            if serializer.name != row[0]:
+                raise ValueError(
+                    f"{self._path} stores payloads as {row[0]!r}, not {serializer.name!r}"
+                )
+        if "jobs" in tables and version < 1:
+            self._upgrade_legacy(conn, tables, serializer)
+        else:
+            if "jobs" in tables and version < 2:
+                conn.execute("ALTER TABLE jobs ADD COLUMN dedup_key TEXT;")
+            if "dlq" in tables and version < 3:
+                conn.execute("ALTER TABLE dlq ADD COLUMN queue TEXT NOT NULL DEFAULT 'default';")
+                conn.execute("ALTER TABLE dlq ADD COLUMN priority INTEGER NOT NULL DEFAULT 0;")
+                conn.execute("ALTER TABLE dlq ADD COLUMN dedup_key TEXT;")
+        conn.execute(_CREATE_JOBS)
+        conn.execute(_CREATE_DLQ)
+        conn.execute(_CREATE_RESULTS)
+        # Hot-path indexes only cover the rows they serve, so they stay
+        # small however many finished jobs accumulate.
+        # Claim order: one index range scan, no sort
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_jobs_pending_claim ON jobs(priority DESC, created_at) WHERE status={_PENDING};"
+        )
+        # Same order within one queue; also serves per-queue size()
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_jobs_pending_queue ON jobs(queue, priority DESC, created_at) WHERE status={_PENDING};"
+        )
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_jobs_pending_run_at ON jobs(run_at) WHERE status={_PENDING};"
+        )
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_jobs_running_hb ON jobs(heartbeat_at) WHERE status={_RUNNING};"
+        )
+        # Enforces dedup_key; finished jobs release their key
+        conn.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs(dedup_key) WHERE {_LIVE_KEY};"
+        )
+        # Claim order within one task, for batch handlers topping up
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_jobs_pending_task ON jobs(func_name, priority DESC, created_at) WHERE status={_PENDING};"
+        )
+        # Retention walks finished rows oldest first
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at) WHERE {_FINISHED};"
+        )
+        conn.execute(f"PRAGMA user_version={_SCHEMA_VERSION};")
+        return serializer
 
-    # --- helpers ---
     @staticmethod
-    def _row_to_job(row: tuple[Any, ...]) -> Job:
-        id, func_name, args, kwargs, status, attempts, created_at, _ = row
+    def _upgrade_legacy(
+        conn: sqlite3.Connection, tables: set[str], serializer: Serializer
+    ) -> None:
+        # Pre-1 files stored status names and JSON text, and older ones lack
+        # newer columns. Each table is rebuilt in the current format; the
+        # old indexes go with the old tables.
+        statuses = {s.name: s.value for s in Status}
+
+        def rebuild(table, create, columns, defaults, convert):
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_v0;")
+            conn.execute(create)
+            have = {row[1] for row in conn.execute(f"PRAGMA table_info({table}_v0);")}
+            select = ", ".join(c if c in have else defaults[c] for c in columns)
+            marks = ", ".join("?" for _ in columns)
+            cur = conn.execute(f"SELECT {select} FROM {table}_v0;")
+            while rows := cur.fetchmany(1000):
+                conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({marks});",
+                    [convert(*row) for row in rows],
+                )
+            conn.execute(f"DROP TABLE {table}_v0;")
+
+        def encode(text):
+            return None if text is None else serializer.dumps(json.loads(text))
+
+        def job(id, func_name, args, kwargs, status, attempts, created_at, error,
+                heartbeat_at, run_at, priority, queue, finished_at):
+            status = statuses[status]
+            if finished_at is None and status in (_SUCCESS, _FAILED):
+                finished_at = created_at  # best guess for rows finished before
+            return (id, func_name, encode(args), encode(kwargs), status, attempts,
+                    created_at, error, heartbeat_at, run_at, priority, queue, finished_at)
+
+        rebuild(
+            "jobs",
+            _CREATE_JOBS,
+            _JOB_COLUMNS.split(", ")[:8] + ["heartbeat_at", "run_at", "priority", "queue", "finished_at"],
+            {
+                "heartbeat_at": "NULL",
+                "run_at": "0",
+                "priority": "0",
+                "queue": "'default'",
+                "finished_at": "NULL",
+            },
+            job,
+        )
+        if "dlq" in tables:
+            rebuild(
+                "dlq",
+                _CREATE_DLQ,
+                ["id", "func_name", "args", "kwargs", "attempts", "error", "failed_at"],
+                {},
+                lambda id, name, args, kwargs, *rest: (id, name, encode(args), encode(kwargs), *rest),
+            )
+        if "results" in tables:
+            rebuild(
+                "results",
+                _CREATE_RESULTS,
+                ["job_id", "value", "error", "finished_at"],
+                {},
+                lambda job_id, value, error, finished_at: (job_id, encode(value), error, finished_at),
+            )
+
+    # --- helpers ---
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        if readonly:
+            uri = Path(self._path).as_uri() + "?mode=ro"
+            conn = sqlite3.connect(
+                uri, uri=True, isolation_level=None, check_same_thread=False
+            )
+        else:
+            conn = sqlite3.connect(
+                self._path, isolation_level=None, check_same_thread=False
+            )
+        conn.execute("PRAGMA busy_timeout=3000;")
+        return conn
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # read-write connection for the calling thread
+        if self._shared is not None:
+            return self._shared
+        return self._writers.get()
+
+    @property
+    def _ro(self) -> sqlite3.Connection:
+        # read-only connection for the calling thread (sizes, listings, stats)
+        if self._shared is not None:
+            return self._shared
+        return self._readers.get()
+
+    def _notify(self) -> None:
+        with self._cv:
+            self._generation += 1
+            self._cv.notify_all()
+
+    def _notify_results(self) -> None:
+        with self._results_cv:
+            self._results_generation += 1
+            self._results_cv.notify_all()
+
+    def _take_stale_leases(self, now: float) -> list[str]:
+        # ids due for a piggybacked refresh, marked refreshed as of now
+        if self._piggyback is None:
+            return []
+        with self._leases_lock:
+            stale = [jid for jid, at in self._leases.items() if now - at >= self._piggyback]
+            for jid in stale:
+                self._leases[jid] = now
+        return stale
+
+    def _track_leases(self, ids: Iterable[str], now: float) -> None:
+        if self._piggyback is not None:
+            with self._leases_lock:
+                self._leases.update(dict.fromkeys(ids, now))
+
+    def _drop_lease(self, job_id: str) -> None:
+        if self._piggyback is not None:
+            with self._leases_lock:
+                self._leases.pop(job_id, None)
+
+    def _write(self, sql: str, params: Sequence[Any]) -> list[tuple[Any, ...]]:
+        # One write statement. When held leases are due, their refresh rides
+        # along in the same transaction instead of costing a write of its own.
+        now = time.time()
+        stale = self._take_stale_leases(now)
+        with self._lock:
+            conn = self._conn
+            if not stale:
+                return conn.execute(sql, params).fetchall()
+            conn.execute("BEGIN IMMEDIATE;")
+            try:
+                rows = conn.execute(sql, params).fetchall()
+                conn.execute(_REFRESH_LEASES, (now, json.dumps(stale)))
+                conn.execute("COMMIT;")
+            except BaseException:
+                conn.execute("ROLLBACK;")
+                raise
+        return rows
+
+    def _watch_loop(self) -> None:
+        # Cross-process wakeups: PRAGMA data_version changes whenever another
+        # connection commits. Polling it is a cheap read that never touches
+        # the write lock, so idle workers can wait long between claim attempts.
+        conn = self._connect(readonly=True)
+        try:
+            last = conn.execute("PRAGMA data_version;").fetchone()[0]
+            while not self._closed.wait(self._watch_interval):
+                try:
+                    version = conn.execute("PRAGMA data_version;").fetchone()[0]
+                    if version == last:
+                        continue
+                    last = version
+                    # a result may have been written by another process
+                    if self._result_waiters:
+                        self._notify_results()
+                    # heartbeats and acks bump the version too; only wake
+                    # claimers when there is due work
+                    due = conn.execute(
+                        f"SELECT 1 FROM jobs WHERE status={_PENDING} AND run_at <= ? LIMIT 1;",
+                        (time.time(),),
+                    ).fetchone()
+                except sqlite3.OperationalError:
+                    continue
+                if due:
+                    self._notify()
+        finally:
+            conn.close()
+
+    def _maintain_loop(self) -> None:
+        policy = self._retention
+        assert policy is not None
+        while not self._closed.wait(policy.interval):
+            try:
+                self.prune(
+                    max_age=policy.max_age,
+                    max_count=policy.max_count,
+                    archive_path=policy.archive_path,
+                    batch_size=policy.batch_size,
+                )
+                self.vacuum(policy.vacuum_pages)
+            except sqlite3.Error:
+                # best-effort; the next run picks up where this one stopped
+                pass
+
+    def _row_to_job(self, row: tuple[Any, ...]) -> Job:
+        id, func_name, args, kwargs, status, attempts, created_at, _, run_at, priority, queue, dedup_key = row
         return Job(
             func_name=func_name,
-            args=tuple(json.loads(args)),
-            kwargs=json.loads(kwargs),
+            args=tuple(self._serializer.loads(args)),
+            kwargs=self._serializer.loads(kwargs),
             id=id,
-            status=Status[status],
+            status=Status(status),
             attempts=attempts,
             created_at=created_at,
+            run_at=run_at,
+            priority=priority,
+            queue=queue,
+            dedup_key=dedup_key,
+        )
+
+    def _job_params(self, job: Job) -> tuple[Any, ...]:
+        return (
+            job.id,
+            job.func_name,
+            self._serializer.dumps(job.args),
+            self._serializer.dumps(job.kwargs),
+            job.status.value,
+            job.attempts,
+            job.created_at,
+            job.run_at,
+            job.priority,
+            job.queue,
+            job.dedup_key,
         )
 
     # --- API ---
-    def enqueue(self, job: Job) -> None:
+    def enqueue(
+        self,
+        job: Job,
+        *,
+        delay: float | None = None,
+        eta: float | datetime | None = None,
+        on_duplicate: str = "ignore",
+    ) -> str:
+        sql = _INSERT_JOB[check_on_duplicate(on_duplicate)]
+        if delay is not None or eta is not None:
+            job.run_at = resolve_run_at(delay, eta)
+        params = self._job_params(job)
         with self._lock:
-            with self._cv:
-                self._conn.execute(
-                    "INSERT OR REPLACE INTO jobs (id, func_name, args, kwargs, status, attempts, created_at, error, heartbeat_at)"
-                    " VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL)",
-                    (
-                        job.id,
-                        job.func_name,
-                        json.dumps(list(job.args)),
-                        json.dumps(job.kwargs),
-                        job.status.name,
-                        job.attempts,
-                        job.created_at,
-                    ),
-                )
-                self._cv.notify_all()
+            while True:
+                row = self._conn.execute(sql + " RETURNING id;", params).fetchone()
+                if row is None:
+                    # a running job holds the key; if it finished meanwhile
+                    # the key is free and the next insert goes through
+                    row = self._conn.execute(
+                        f"SELECT id FROM jobs WHERE dedup_key=? AND {_LIVE_KEY};",
+                        (job.dedup_key,),
+                    ).fetchone()
+                if row is not None:
+                    break
+        if row[0] == job.id:
+            self._notify()
+        return row[0]
 
-    def dequeue(self, timeout: float | None = None) -> Job | None:
+    def enqueue_many(
+        self, jobs: Iterable[Job], *, chunk_size: int = 1000, on_duplicate: str = "ignore"
+    ) -> int:
+        # Consume the iterable lazily so arbitrarily large streams are never
+        # held in memory; each chunk is one transaction and one wakeup.
+        sql = _INSERT_JOB[check_on_duplicate(on_duplicate)]
+        it = iter(jobs)
+        count = 0
+        while True:
+            chunk = [self._job_params(job) for job in islice(it, chunk_size)]
+            if not chunk:
+                return count
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE;")
+                try:
+                    self._conn.executemany(sql, chunk)
+                    self._conn.execute("COMMIT;")
+                except BaseException:
+                    self._conn.execute("ROLLBACK;")
+                    raise
+            self._notify()
+            count += len(chunk)
+
+    def dequeue(
+        self, timeout: float | None = None, queues: Sequence[str] | None = None
+    ) -> Job | None:
+        jobs = self.dequeue_many(1, timeout, queues)
+        return jobs[0] if jobs else None
+
+    def dequeue_many(
+        self,
+        n: int,
+        timeout: float | None = None,
+        queues: Sequence[str] | None = None,
+        task: str | None = None,
+    ) -> list[Job]:
         deadline = None if timeout is None else time.time() + timeout
+        # With the watcher running, wakeups cover other processes too and the
+        # fallback poll can be rare
+        poll = 0.25 if self._watcher is None else 2.0
         while True:
-            # try to claim a pending job atomically
+            generation = self._generation
+            # claim up to n due pending jobs atomically in a single statement
             try:
-                with self._lock:
-                    cur = self._conn.cursor()
-                    cur.execute("BEGIN IMMEDIATE;")  # take write lock for atomic claim
-                    row = cur.execute(
-                        "SELECT id FROM jobs WHERE status='PENDING' ORDER BY created_at LIMIT 1;"
-                    ).fetchone()
-                    if row is None:
-                        self._conn.execute("COMMIT;")
-                    else:
-                        job_id = row[0]
-                        updated = cur.execute(
-                            "UPDATE jobs SET status='RUNNING', attempts=attempts+1, heartbeat_at=? "
-                            "WHERE id=? AND status='PENDING';",
-                            (time.time(), job_id),
-                        ).rowcount
-                        if updated == 1:
-                            job_row = cur.execute(
-                                "SELECT id, func_name, args, kwargs, status, attempts, created_at, error "
-                                "FROM jobs WHERE id=?;",
-                                (job_id,),
-                            ).fetchone()
-                            self._conn.execute("COMMIT;")
-                            return self._row_to_job(job_row)
-                        else:
-                            self._conn.execute("ROLLBACK;")
-                            continue
+                jobs = self._claim(n, queues, task)
+                if jobs:
+                    return jobs
             except sqlite3.OperationalError:
                 # busy; brief backoff
                 time.sleep(0.01)
 
-            # none available: optionally block
-            if timeout is None:
-                with self._cv:
-                    self._cv.wait(0.25)
-            else:
+            # none available: optionally block, waking early for delayed jobs
+            wait = poll
+            try:
+                next_due = self._next_due()
+                if next_due is not None:
+                    wait = max(0.0, min(wait, next_due - time.time()))
+            except sqlite3.OperationalError:
+                pass
+            if timeout is not None:
                 remaining = deadline - time.time()
                 if remaining <= 0:
-                    return None
-                with self._cv:
-                    self._cv.wait(min(0.25, remaining))
+                    return []
+                wait = min(wait, remaining)
+            with self._cv:
+                if self._generation == generation:
+                    self._cv.wait(wait)
+
+    def _claim(
+        self, n: int, queues: Sequence[str] | None = None, task: str | None = None
+    ) -> list[Job]:
+        if not queues:
+            return self._claim_from(n, None, task)
+        # Queues are drained in the order given, each from its own index range
+        jobs: list[Job] = []
+        for queue in queues:
+            jobs.extend(self._claim_from(n - len(jobs), queue, task))
+            if len(jobs) >= n:
+                break
+        return jobs
+
+    def _claim_from(self, n: int, queue: str | None, task: str | None = None) -> list[Job]:
+        # A writing statement takes the write lock up front, so the subquery
+        # and the update see the same snapshot and no other process can
+        # claim the same rows in between. The unary + keeps the planner on
+        # the ordered claim index instead of sorting every due row.
+        now = time.time()
+        where = f"status={_PENDING} AND +run_at <= ?"
+        params: tuple[Any, ...] = (now, now, n)
+        if queue is not None:
+            where = "queue=? AND " + where
+            params = (now, queue, now, n)
+        if task is not None:
+            where = "func_name=? AND " + where
+            params = (*params[:1], task, *params[1:])
+        rows = self._write(
+            f"UPDATE jobs SET status={_RUNNING}, attempts=attempts+1, heartbeat_at=? "
+            f"WHERE id IN (SELECT id FROM jobs WHERE {where} "
+            "ORDER BY priority DESC, created_at LIMIT ?"
+            f") RETURNING {_JOB_COLUMNS};",
+            params,
+        )
+        # RETURNING order is unspecified; restore claim order
+        jobs = [self._row_to_job(row) for row in rows]
+        self._track_leases((job.id for job in jobs), now)
+        jobs.sort(key=lambda j: (-j.priority, j.created_at))
+        return jobs
+
+    def _next_due(self) -> float | None:
+        with self._read_lock:
+            row = self._ro.execute(
+                f"SELECT MIN(run_at) FROM jobs WHERE status={_PENDING} AND run_at > ?;",
+                (time.time(),),
+            ).fetchone()
+        return row[0]
 
     def mark_done(self, job: Job) -> None:
-        with self._lock:
-            self._conn.execute(
-                "UPDATE jobs SET status='SUCCESS', error=NULL WHERE id=?;",
-                (job.id,),
-            )
-            with self._cv:
-                self._cv.notify_all()
+        self._drop_lease(job.id)
+        self._write(
+            f"UPDATE jobs SET status={_SUCCESS}, error=NULL, finished_at=? WHERE id=?;",
+            (time.time(), job.id),
+        )
+        self._notify()
 
     def mark_failed(self, job: Job, exc: Exception) -> None:
-        with self._lock:
-            self._conn.execute(
-                "UPDATE jobs SET status='FAILED', error=? WHERE id=?;",
-                (repr(exc), job.id),
-            )
-            with self._cv:
-                self._cv.notify_all()
+        self._drop_lease(job.id)
+        self._write(
+            f"UPDATE jobs SET status={_FAILED}, error=?, finished_at=? WHERE id=?;",
+            (repr(exc), time.time(), job.id),
+        )
+        self._notify()
 
-    def size(self) -> int:
-        with self._lock:
-            row = self._conn.execute(
-                "SELECT COUNT(*) FROM jobs WHERE status='PENDING';"
-            ).fetchone()
+    def retry_later(self, job: Job, exc: Exception, delay: float) -> None:
+        # A single update: the job goes straight back to PENDING, due later
+        job.status = Status.PENDING
+        job.run_at = time.time() + delay
+        self._drop_lease(job.id)
+        self._write(
+            f"UPDATE jobs SET status={_PENDING}, run_at=?, error=?, heartbeat_at=NULL WHERE id=?;",
+            (job.run_at, repr(exc), job.id),
+        )
+        self._notify()
+
+    def size(self, queue: str | None = None) -> int:
+        with self._read_lock:
+            if queue is None:
+                row = self._ro.execute(
+                    f"SELECT COUNT(*) FROM jobs WHERE status={_PENDING};"
+                ).fetchone()
+            else:
+                row = self._ro.execute(
+                    f"SELECT COUNT(*) FROM jobs WHERE queue=? AND status={_PENDING};",
+                    (queue,),
+                ).fetchone()
             return int(row[0])
 
     def heartbeat(self, job: Job) -> None:
+        self.heartbeat_many([job])
+
+    def heartbeat_many(self, jobs: Iterable[Job]) -> None:
+        now = time.time()
+        ids = [job.id for job in jobs]
+        if self._piggyback is not None:
+            # leases refreshed by a recent claim or ack need no write
+            with self._leases_lock:
+                ids = [
+                    jid
+                    for jid in ids
+                    if now - self._leases.get(jid, 0.0) >= self._piggyback
+                ]
+                self._leases.update((jid, now) for jid in ids if jid in self._leases)
+        if not ids:
+            return
         with self._lock:
-            self._conn.execute(
-                "UPDATE jobs SET heartbeat_at=? WHERE id=? AND status='RUNNING';",
-                (time.time(), job.id),
-            )
+            self._conn.execute(_REFRESH_LEASES, (now, json.dumps(ids)))
+
+    def release(self, jobs: Iterable[Job]) -> None:
+        jobs = list(jobs)
+        if not jobs:
+            return
+        ids = [job.id for job in jobs]
+        self._write(
+            f"UPDATE jobs SET status={_PENDING}, attempts=max(attempts - 1, 0), heartbeat_at=NULL "
+            f"WHERE status={_RUNNING} AND id IN (SELECT value FROM json_each(?));",
+            (json.dumps(ids),),
+        )
+        for job in jobs:
+            self._drop_lease(job.id)
+            job.status = Status.PENDING
+            job.attempts = max(job.attempts - 1, 0)
+        self._notify()
 
     def reap_stale(self, visibility_timeout: float) -> int:
         cutoff = time.time() - visibility_timeout
         with self._lock:
-            with self._cv:
-                cur = self._conn.cursor()
-                cur.execute("BEGIN IMMEDIATE;")
-                cur.execute(
-                    "UPDATE jobs SET status='PENDING' WHERE status='RUNNING' AND (heartbeat_at IS NULL OR heartbeat_at < ?);",
-                    (cutoff,),
-                )
-                count = cur.rowcount
-                self._conn.execute("COMMIT;")
-                if count:
-                    self._cv.notify_all()
-                return int(count)
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE;")
+            cur.execute(
+                f"UPDATE jobs SET status={_PENDING} WHERE status={_RUNNING} AND (heartbeat_at IS NULL OR heartbeat_at < ?);",
+                (cutoff,),
+            )
+            count = cur.rowcount
+            self._conn.execute("COMMIT;")
+        if count:
+            self._notify()
+        return int(count)
 
     def dead_letter(self, job: Job, exc: Exception) -> None:
         with self._lock:
             self._conn.execute(
-                "INSERT OR REPLACE INTO dlq (id, func_name, args, kwargs, attempts, error, failed_at) VALUES (?, ?, ?, ?, ?, ?, ?);",
+                "INSERT OR REPLACE INTO dlq (id, func_name, args, kwargs, attempts, error, failed_at, queue, priority, dedup_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
                 (
                     job.id,
                     job.func_name,
-                    json.dumps(list(job.args)),
-                    json.dumps(job.kwargs),
+                    self._serializer.dumps(job.args),
+                    self._serializer.dumps(job.kwargs),
                     job.attempts,
                     repr(exc),
                     time.time(),
+                    job.queue,
+                    job.priority,
+                    job.dedup_key,
                 ),
             )
+
+    # --- results ---
+    def store_result(
+        self, job: Job, value: Any = None, error: str | None = None
+    ) -> None:
+        encoded = None if error is not None else self._serializer.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (job_id, value, error, finished_at) VALUES (?, ?, ?, ?);",
+                (job.id, encoded, error, time.time()),
+            )
+        self._notify_results()
+
+    def get_result(self, job_id: str, timeout: float | None = None) -> Any:
+        found = self.get_results([job_id], timeout)
+        if job_id not in found:
+            raise TimeoutError(f"no result for job {job_id} after {timeout}s")
+        value = found[job_id]
+        if isinstance(value, TaskExecutionError):
+            raise value
+        return value
+
+    def get_results(
+        self, job_ids: Iterable[str], timeout: float | None = 0
+    ) -> dict[str, Any]:
+        ids = list(dict.fromkeys(job_ids))
+        found: dict[str, Any] = {}
+        deadline = None if timeout is None else time.time() + timeout
+        # In-process writers notify directly; other processes are seen by
+        # the watcher, so the fallback poll only matters without one
+        poll = 0.25 if self._watcher is None else 2.0
+        while True:
+            generation = self._results_generation
+            missing = [i for i in ids if i not in found]
+            if missing:
+                # one query for any number of ids: the list travels as json
+                with self._read_lock:
+                    rows = self._ro.execute(
+                        "SELECT job_id, value, error FROM results "
+                        "WHERE job_id IN (SELECT value FROM json_each(?));",
+                        (json.dumps(missing),),
+                    ).fetchall()
+                for job_id, value, error in rows:
+                    if error is not None:
+                        found[job_id] = TaskExecutionError(error)
+                    else:
+                        found[job_id] = self._serializer.loads(value)
+            if len(found) == len(ids):
+                return found
+            wait = poll
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return found
+                wait = min(wait, remaining)
+            with self._results_cv:
+                if self._results_generation == generation:
+                    self._result_waiters += 1
+                    try:
+                        self._results_cv.wait(wait)
+                    finally:
+                        self._result_waiters -= 1
+
+    # --- retention ---
+    def prune(
+        self,
+        max_age: float | None = None,
+        max_count: int | None = None,
+        archive_path: str | None = None,
+        batch_size: int = 500,
+    ) -> int:
+        # Deletes (or moves to archive_path) finished jobs older than max_age
+        # seconds or beyond the newest max_count, with their results. Each
+        # batch is its own short transaction so claims interleave freely.
+        # rows finished at or before `cutoff` go
+        cutoff = None
+        if max_age is not None:
+            cutoff = time.time() - max_age
+        if max_count is not None:
+            with self._read_lock:
+                row = self._ro.execute(
+                    f"SELECT finished_at FROM jobs WHERE {_FINISHED} "
+                    "ORDER BY finished_at DESC LIMIT 1 OFFSET ?;",
+                    (max_count,),
+                ).fetchone()
+            if row is not None and row[0] is not None:
+                # the newest row past the first max_count
+                cutoff = row[0] if cutoff is None else max(cutoff, row[0])
+        if cutoff is None:
+            return 0
+        total = 0
+        while True:
+            with self._lock:
+                conn = self._conn
+                if archive_path is not None:
+                    self._attach_archive(conn, archive_path)
+                conn.execute("BEGIN IMMEDIATE;")
+                try:
+                    ids = json.dumps(
+                        [
+                            r[0]
+                            for r in conn.execute(
+                                f"SELECT id FROM jobs WHERE {_FINISHED} AND finished_at <= ? "
+                                "ORDER BY finished_at LIMIT ?;",
+                                (cutoff, batch_size),
+                            )
+                        ]
+                    )
+                    chosen = "IN (SELECT value FROM json_each(?))"
+                    if archive_path is not None:
+                        conn.execute(
+                            f"INSERT OR REPLACE INTO archive.jobs ({_ARCHIVE_COLUMNS}) "
+                            f"SELECT {_ARCHIVE_COLUMNS} FROM jobs WHERE id {chosen};",
+                            (ids,),
+                        )
+                    count = conn.execute(f"DELETE FROM jobs WHERE id {chosen};", (ids,)).rowcount
+                    conn.execute(f"DELETE FROM results WHERE job_id {chosen};", (ids,))
+                    conn.execute("COMMIT;")
+                except BaseException:
+                    conn.execute("ROLLBACK;")
+                    raise
+            total += count
+            if count < batch_size:
+                return total
+
+    @staticmethod
+    def _attach_archive(conn: sqlite3.Connection, archive_path: str) -> None:
+        if any(row[1] == "archive" for row in conn.execute("PRAGMA database_list;")):
+            return
+        conn.execute("ATTACH DATABASE ? AS archive;", (archive_path,))
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS archive.jobs (
+                id          TEXT PRIMARY KEY,
+                func_name   TEXT NOT NULL,
+                args        BLOB NOT NULL,
+                kwargs      BLOB NOT NULL,
+                status      INTEGER NOT NULL,
+                attempts    INTEGER NOT NULL,
+                created_at  REAL NOT NULL,
+                error       TEXT,
+                run_at      REAL NOT NULL,
+                priority    INTEGER NOT NULL,
+                queue       TEXT NOT NULL,
+                finished_at REAL,
+                dedup_key   TEXT
+            );
+            """
+        )
+        # archives written before dedup keys existed
+        columns = {row[1] for row in conn.execute("PRAGMA archive.table_info(jobs);")}
+        if "dedup_key" not in columns:
+            conn.execute("ALTER TABLE archive.jobs ADD COLUMN dedup_key TEXT;")
+
+    def vacuum(self, pages: int | None = None, full: bool = False) -> int:
+        # Returns free pages to the OS in small steps (each its own short
+        # write) and truncates the WAL; returns the number of pages freed.
+        # full=True rewrites the file once under an exclusive lock, which
+        # also enables incremental vacuum on DBs created before it existed.
+        with self._lock:
+            conn = self._conn
+            before = conn.execute("PRAGMA page_count;").fetchone()[0]
+            if full:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+                conn.execute("VACUUM;")
+            else:
+                left = pages
+                while left is None or left > 0:
+                    free = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+                    step = min(free, 256) if left is None else min(free, 256, left)
+                    if step <= 0:
+                        break
+                    conn.execute(f"PRAGMA incremental_vacuum({step});").fetchall()
+                    after = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+                    if after >= free:
+                        break  # auto_vacuum is off: nothing to reclaim
+                    if left is not None:
+                        left -= free - after
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+            except sqlite3.OperationalError:
+                pass
+            return before - conn.execute("PRAGMA page_count;").fetchone()[0]
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._watcher is not None:
+            self._watcher.join()
+        if self._maintainer is not None:
+            self._maintainer.join()
+        if self._shared is not None:
+            self._shared.close()
+        else:
+            self._writers.close_all()
+            self._readers.close_all()
@@ -1,20 +1,61 @@
 from __future__ import annotations
 
-from typing import Protocol, runtime_checkable
+from datetime import datetime
+from typing import Any, Iterable, Protocol, Sequence, runtime_checkable
 
 from .types import Job
 
 
 @runtime_checkable
 class Storage(Protocol):
-    def enqueue(self, job: Job) -> None: ...
-    def dequeue(self, timeout: float | None = None) -> Job | None: ...
+    def enqueue(
+        self,
+        job: Job,
+        *,
+        delay: float | None = None,
+        eta: float | datetime | None = None,
+        on_duplicate: str = "ignore",
+    ) -> str: ...  # id of the job that now stands for this one
+    def enqueue_many(self, jobs: Iterable[Job], *, on_duplicate: str = "ignore") -> int: ...
+    def dequeue(
+        self, timeout: float | None = None, queues: Sequence[str] | None = None
+    ) -> Job | None: ...
+    # task restricts the claim to jobs of that func_name (batch top-ups)
+    def dequeue_many(
+        self,
+        n: int,
+        timeout: float | None = None,
+        queues: Sequence[str] | None = None,
+        task: str | None = None,
+    ) -> list[Job]: ...
     def mark_done(self, job: Job) -> None: ...
     def mark_failed(self, job: Job, exc: Exception) -> None: ...
-    def size(self) -> int: ...
+    def retry_later(self, job: Job, exc: Exception, delay: float) -> None: ...
+    def size(self, queue: str | None = None) -> int: ...
     # Heartbeat and reaping
     def heartbeat(self, job: Job) -> None: ...
+    # Refreshes every given lease in one write
+    def heartbeat_many(self, jobs: Iterable[Job]) -> None: ...
     def reap_stale(self, visibility_timeout: float) -> int: ...
+    # Hands claimed but unstarted jobs back: PENDING again, attempt undone
+    def release(self, jobs: Iterable[Job]) -> None: ...
     # Dead letter queue
     def dead_letter(self, job: Job, exc: Exception) -> None: ...
 
+
+
+# Optional: backends that keep task return values for callers to fetch.
+# Worker(store_results=True) requires one.
+@runtime_checkable
+class ResultStore(Protocol):
+    def store_result(
+        self, job: Job, value: Any = None, error: str | None = None
+    ) -> None: ...
+    # Blocks until the job finishes; raises TaskExecutionError if it failed
+    # and TimeoutError if no result arrives in time
+    def get_result(self, job_id: str, timeout: float | None = None) -> Any: ...
+    # Results already finished (or finishing within timeout), keyed by id;
+    # failed jobs map to a TaskExecutionError instance
+    def get_results(
+        self, job_ids: Iterable[str], timeout: float | None = 0
+    ) -> dict[str, Any]: ...
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
+from datetime import datetime
 from enum import Enum, auto
 from typing import Any
 import time
@@ -23,4 +24,37 @@ class Job:
     status: Status = Status.PENDING
     attempts: int = 0
     created_at: float = field(default_factory=time.time)
+    # Not claimable before this epoch time; 0 means immediately
+    run_at: float = 0.0
+    # Higher runs first; equal priorities run in FIFO order
+    priority: int = 0
+    queue: str = "default"
+    # At most one PENDING/RUNNING job per key; see ON_DUPLICATE
+    dedup_key: str | None = None
+
+
+# What enqueue does when a live job already holds the dedup_key: "ignore"
+# keeps the existing job as is, "replace" gives a pending one the new
+# args/kwargs and "bump" raises its priority to the new one's if higher.
+# A running duplicate is never changed. Either way enqueue returns the id
+# of the job that stands for the request.
+ON_DUPLICATE = ("ignore", "replace", "bump")
+
+
+def check_on_duplicate(on_duplicate: str) -> str:
+    if on_duplicate not in ON_DUPLICATE:
+        raise ValueError(f"unknown on_duplicate {on_duplicate!r} (known: {list(ON_DUPLICATE)})")
+    return on_duplicate
+
+
+def resolve_run_at(
+    delay: float | None = None, eta: float | datetime | None = None
+) -> float:
+    if delay is not None and eta is not None:
+        raise ValueError("pass either delay or eta, not both")
+    if delay is not None:
+        return time.time() + delay
+    if isinstance(eta, datetime):
+        return eta.timestamp()
+    return float(eta or 0.0)
 
@@ -1,45 +1,20 @@
 from __future__ import annotations
 
-from typing import Any
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable
 import logging
 import threading
 import time
 
 from .errors import TaskNotFound
-from .registry import REGISTRY
+from .executors import ProcessPool, invoke
+from .metrics import Metrics
+from .middleware import Middleware, resolve_hooks
+from .registry import BATCHES, REGISTRY
 from .retry import RetryPolicy
-from .storage import Storage
-from .types import Job, Status
-
-
-class JobExecution:
-    def __init__(self, storage: Storage, job: Job):
-        self.storage = storage
-        self.job = job
-
-    def __exit__(self, exc_type, exc, tb) -> bool:
-        if exc_type is None:
-            self.storage.mark_done(self.job)
-        else:
-            self.storage.mark_failed(self.job, exc)
-        return False  # don't suppress exceptions
-
-    def __enter__(self) -> Any:
-        fn = REGISTRY.get(self.job.func_name.lower())
-        if not fn:
-            raise TaskNotFound(
-                f"no task registered: {self.job.func_name!r} (known: {list(REGISTRY)})"
-            )
-        return fn
-
-
-def _requeue_later(storage: Storage, job: Job, delay: float) -> None:
-    def _t():
-        time.sleep(delay)
-        job.status = Status.PENDING
-        storage.enqueue(job)
-
-    threading.Thread(target=_t, daemon=True).start()
+from .storage import ResultStore, Storage
+from .types import Job
 
 
 class Worker:
@@ -53,8 +28,22 @@ class Worker:
         heartbeat_interval: float = 1.0,
         reap_interval: float = 2.0,
         task_timeout: float | None = None,
+        claim_batch: int = 1,
+        concurrency: int = 1,
+        processes: int = 0,
+        imports: Iterable[str] = (),
+        queues: Iterable[str] | None = None,
+        store_results: bool = False,
+        middleware: Iterable[Middleware] = (),
+        timeout_mode: str = "thread",
+        prefetch: int = 0,
     ):
+        if timeout_mode not in ("thread", "process"):
+            raise ValueError(f"unknown timeout_mode {timeout_mode!r}")
+        if store_results and not isinstance(storage, ResultStore):
+            raise TypeError(f"{type(storage).__name__} cannot store results")
         self.storage = storage
+        self.store_results = store_results
         self.poll_timeout = poll_timeout
         self.retry = retry or RetryPolicy()
         self.stop_event = threading.Event()
@@ -62,125 +51,467 @@ class Worker:
         self.visibility_timeout = visibility_timeout
         self.heartbeat_interval = heartbeat_interval
         self.reap_interval = reap_interval
-        self._current_job: Job | None = None
+        self.claim_batch = max(1, claim_batch)
+        # With a process pool, one slot thread per child keeps every child busy
+        self.processes = max(0, processes)
+        self.imports = tuple(imports)
+        self.concurrency = max(1, concurrency, self.processes)
+        self._pool: ProcessPool | None = None
+        # "process" runs tasks in supervised children that are terminated on
+        # timeout; "thread" uses reused threads that can only be abandoned
+        self.timeout_mode = timeout_mode
+        self._task_threads: ThreadPoolExecutor | None = None
+        self._overrunning = 0  # timed-out tasks still holding a pool thread
+        # Jobs claimed ahead of time by a background thread, refilled once
+        # fewer than the low-water mark are left. Buffered jobs sit in
+        # _inflight, so their leases are heartbeated like running ones.
+        self.prefetch = max(0, prefetch)
+        self._low_water = max(1, self.prefetch // 2)
+        self._buffer: deque[Job] = deque()
+        self._buffer_cv = threading.Condition()
+        self._prefetch_stopped = False
+        # Queues to consume, in order of preference; None consumes all
+        self.queues = list(queues) if queues else None
+        # Claimed jobs not yet finished; the heartbeat loop covers all of them
+        self._inflight: dict[str, Job] = {}
+        self._lock = threading.Lock()
         self._hb_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
         self._reaper_thread = threading.Thread(target=self._reaper_loop, daemon=True)
         self.task_timeout = task_timeout
-        self.metrics = {
-            "processed": 0,
-            "succeeded": 0,
-            "failed": 0,
-            "retried": 0,
-            "dead_lettered": 0,
-            "reaped": 0,
-        }
+        # Thread-safe; reads like a dict of totals, see Metrics.snapshot()
+        self.metrics = Metrics()
+        self.middleware = list(middleware)
+        # hook name -> overriding methods; call sites skip empty tuples
+        self._hooks = resolve_hooks(self.middleware)
 
     def stop(self) -> None:
         self.stop_event.set()
         # Give background threads a chance to exit
+        if self.prefetch:
+            self._release_prefetched()
 
     def run_forever(self) -> None:
+        self._start_helpers()
+        prefetcher = None
+        if self.prefetch:
+            self._prefetch_stopped = False
+            prefetcher = threading.Thread(
+                target=self._prefetch_loop, name="pinion-prefetch", daemon=True
+            )
+            prefetcher.start()
+        kill_on_timeout = self.timeout_mode == "process" and bool(self.task_timeout)
+        if (self.processes or kill_on_timeout) and self._pool is None:
+            # one child per slot unless an explicit pool size was given
+            self._pool = ProcessPool(self.processes or self.concurrency, self.imports)
+        try:
+            if self.concurrency == 1:
+                self._run_slot()
+                return
+            # Each slot claims and executes independently; all share one storage
+            with ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="pinion-slot"
+            ) as pool:
+                slots = [pool.submit(self._run_slot) for _ in range(self.concurrency)]
+                for slot in slots:
+                    slot.result()
+        finally:
+            if prefetcher is not None:
+                # the worker is done even if stop() wasn't called
+                with self._buffer_cv:
+                    self._prefetch_stopped = True
+                    self._buffer_cv.notify_all()
+                prefetcher.join()
+                self._release_prefetched()
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            if self._task_threads is not None:
+                # don't wait for tasks that overran their timeout
+                self._task_threads.shutdown(wait=False, cancel_futures=True)
+                self._task_threads = None
+
+    def _start_helpers(self) -> None:
         # start background helpers on first run
         if not self._hb_thread.is_alive():
             self._hb_thread.start()
         if self.visibility_timeout is not None and not self._reaper_thread.is_alive():
             self._reaper_thread.start()
+
+    def _run_slot(self) -> None:
         while not self.stop_event.is_set():
-            job = self.storage.dequeue(timeout=self.poll_timeout)
-            if job is None:
+            # A claimed batch is always run to completion so no job is left
+            # RUNNING without a heartbeat when the worker stops.
+            # with prefetch, before_claim runs on the prefetch thread
+            if self._hooks["before_claim"] and not self.prefetch:
+                self._run_hooks("before_claim")
+            try:
+                jobs = self._claim()
+            except Exception:
+                # a storage or broker hiccup must not end the slot for good
+                self.log.exception("worker.claim_failed")
+                self.stop_event.wait(self.poll_timeout)
                 continue
+            self._dispatch(jobs)
+
+    def _run_hooks(self, name: str, *args: Any) -> None:
+        for hook in self._hooks[name]:
+            try:
+                hook(self, *args)
+            except Exception:
+                self.log.exception("middleware.error hook=%s", name)
+
+    def _incr(self, task: str | None = None, **counts: int) -> None:
+        self.metrics.incr(task, **counts)
+
+    def _observe_claim(self, jobs: list[Job], started: float) -> None:
+        now = time.time()
+        self.metrics.observe("claim_seconds", now - started)
+        for job in jobs:
+            # waiting starts when the job became due (delays and retry
+            # backoff are not queueing)
+            waited = now - max(job.created_at, job.run_at)
+            self.metrics.observe("queue_wait_seconds", max(0.0, waited), job.func_name)
+
+    def _prefetch_loop(self) -> None:
+        while True:
+            with self._buffer_cv:
+                while not self._stopping() and len(self._buffer) >= self._low_water:
+                    self._buffer_cv.wait(self.poll_timeout)
+                if self._stopping():
+                    return
+                want = self.prefetch - len(self._buffer)
+            if self._hooks["before_claim"]:
+                self._run_hooks("before_claim")
+            started = time.time()
+            try:
+                jobs = self.storage.dequeue_many(
+                    want, timeout=self.poll_timeout, queues=self.queues
+                )
+            except Exception:
+                self.log.exception("prefetch.claim_failed")
+                self.stop_event.wait(self.poll_timeout)
+                continue
+            if not jobs:
+                continue
+            self._observe_claim(jobs, started)
+            with self._lock:
+                for job in jobs:
+                    self._inflight[job.id] = job
+            # checked under the buffer lock, so a concurrent stop() either
+            # releases these with the buffer or leaves them to us
+            with self._buffer_cv:
+                stopping = self._stopping()
+                if not stopping:
+                    self._buffer.extend(jobs)
+                    self._buffer_cv.notify_all()
+            if stopping:
+                self._release(jobs)
+                return
+
+    def _stopping(self) -> bool:
+        return self.stop_event.is_set() or self._prefetch_stopped
+
+    def _take_prefetched(self) -> list[Job]:
+        with self._buffer_cv:
+            if not self._buffer and not self.stop_event.is_set():
+                self._buffer_cv.wait(self.poll_timeout)
+            if not self._buffer:
+                return []
+            job = self._buffer.popleft()
+            if len(self._buffer) < self._low_water:
+                self._buffer_cv.notify_all()
+        return [job]
+
+    def _release_prefetched(self) -> None:
+        with self._buffer_cv:
+            jobs = list(self._buffer)
+            self._buffer.clear()
+            self._buffer_cv.notify_all()
+        self._release(jobs)
+
+    def _release(self, jobs: list[Job]) -> None:
+        # back to PENDING for any worker; if that fails, the reaper
+        # recovers them once their leases lapse
+        if not jobs:
+            return
+        try:
+            self.storage.release(jobs)
+            self.log.info("prefetch.released count=%d", len(jobs))
+        except Exception:
+            self.log.exception("prefetch.release_failed count=%d", len(jobs))
+        finally:
+            with self._lock:
+                for job in jobs:
+                    self._inflight.pop(job.id, None)
+
+    def _claim(self) -> list[Job]:
+        if self.prefetch:
+            return self._take_prefetched()
+        started = time.time()
+        if self.claim_batch > 1:
+            jobs = self.storage.dequeue_many(
+                self.claim_batch, timeout=self.poll_timeout, queues=self.queues
+            )
+        else:
+            job = self.storage.dequeue(timeout=self.poll_timeout, queues=self.queues)
+            jobs = [job] if job is not None else []
+        if jobs:
+            self._observe_claim(jobs, started)
+            with self._lock:
+                for job in jobs:
+                    self._inflight[job.id] = job
+        return jobs
+
+    def _dispatch(self, jobs: list[Job]) -> None:
+        # Jobs of batch tasks go to their handler together, in chunks of
+        # the task's batch_size; everything else runs one by one
+        batches: dict[str, list[Job]] = {}
+        for job in jobs:
+            name = job.func_name.lower()
+            if name in BATCHES:
+                batches.setdefault(name, []).append(job)
+            else:
+                self._process(job)
+        for name, group in batches.items():
+            size = BATCHES[name].size
+            for i in range(0, len(group), size):
+                self._process_batch(name, group[i : i + size])
+
+    def _process(self, job: Job) -> None:
+        self.log.info(
+            "job.start id=%s name=%s attempt=%d",
+            job.id,
+            job.func_name,
+            job.attempts,
+        )
+        started = time.perf_counter()
+        value, error = None, None
+        try:
+            for hook in self._hooks["before_execute"]:
+                hook(self, job)
+            value = self._execute(job)
+        except Exception as e:
+            error = e
+        self.metrics.observe("execution_seconds", time.perf_counter() - started, job.func_name)
+        self._settle(job, value, error)
+
+    def _process_batch(self, name: str, jobs: list[Job]) -> None:
+        spec = BATCHES[name]
+        if len(jobs) < spec.size:
+            self._fill_batch(jobs, spec.size, spec.wait)
+        self.log.info("batch.start name=%s size=%d", jobs[0].func_name, len(jobs))
+        started = time.perf_counter()
+        ready: list[Job] = []
+        for job in jobs:
+            try:
+                for hook in self._hooks["before_execute"]:
+                    hook(self, job)
+            except Exception as e:
+                # a rejected job is settled on its own and left out of the call
+                self._settle(job, None, e)
+            else:
+                ready.append(job)
+        if not ready:
+            return
+        try:
+            outcomes = self._execute_batch(ready)
+        except Exception as e:
+            outcomes = [e] * len(ready)
+        self.metrics.observe("execution_seconds", time.perf_counter() - started, ready[0].func_name)
+        for job, outcome in zip(ready, outcomes):
+            if isinstance(outcome, Exception):
+                self._settle(job, None, outcome)
+            else:
+                self._settle(job, outcome, None)
+
+    def _fill_batch(self, jobs: list[Job], size: int, wait: float) -> None:
+        # Tops the batch up with pending jobs of the same task, waiting up to
+        # `wait` seconds for them; the extra claims are in flight right away
+        deadline = time.time() + wait
+        while len(jobs) < size and not self.stop_event.is_set():
+            started = time.time()
+            try:
+                more = self.storage.dequeue_many(
+                    size - len(jobs),
+                    timeout=max(0.0, deadline - started),
+                    queues=self.queues,
+                    task=jobs[0].func_name,
+                )
+            except Exception:
+                self.log.exception("batch.claim_failed name=%s", jobs[0].func_name)
+                return
+            if more:
+                self._observe_claim(more, started)
+                with self._lock:
+                    for job in more:
+                        self._inflight[job.id] = job
+                jobs.extend(more)
+            if not more or time.time() >= deadline:
+                return
+
+    def _execute_batch(self, jobs: list[Job]) -> list[Any]:
+        name = jobs[0].func_name
+        if self._pool is not None:
+            timeout = self.task_timeout if self.task_timeout else None
+            returned = self._pool.run(name, (jobs,), {}, timeout)
+        else:
+            returned = self._call(self._lookup(name), (jobs,), {})
+        if returned is None:
+            return [None] * len(jobs)
+        outcomes = list(returned)
+        if len(outcomes) != len(jobs):
+            raise ValueError(
+                f"batch task {name!r} returned {len(outcomes)} outcomes for {len(jobs)} jobs"
+            )
+        return outcomes
+
+    def _settle(self, job: Job, value: Any, error: Exception | None) -> None:
+        # after_execute hooks, then the job's ack, retry or dead letter
+        try:
+            if self._hooks["after_execute"]:
+                self._run_hooks("after_execute", job, value, error)
+            if error is not None:
+                raise error
+            if self.store_results:
+                self._save_result(job, value)
+            self.storage.mark_done(job)
+            self._incr(job.func_name, processed=1, succeeded=1)
+        except Exception as e:
+            self._fail(job, e)
+        finally:
+            with self._lock:
+                self._inflight.pop(job.id, None)
+
+    def _lookup(self, func_name: str) -> Any:
+        fn = REGISTRY.get(func_name.lower())
+        if not fn:
+            raise TaskNotFound(
+                f"no task registered: {func_name!r} (known: {list(REGISTRY)})"
+            )
+        return fn
+
+    def _execute(self, job: Job) -> Any:
+        if self._pool is not None:
+            # Task lookup and execution happen in a child process
+            timeout = self.task_timeout if self.task_timeout else None
+            return self._pool.call(job, timeout)
+        # Resolve the task early so TaskNotFound gets marked as failed
+        return self._call(self._lookup(job.func_name), job.args, job.kwargs)
+
+    def _call(self, fn: Any, args: tuple[Any, ...], kwargs: dict[str, Any]) -> Any:
+        # Execute with optional timeout
+        if self.task_timeout is None or self.task_timeout <= 0:
+            return invoke(fn, args, kwargs)
+        # Wait up to task_timeout on a reused thread. The pool always has a
+        # free thread per slot (see _abandon), so the timeout never covers
+        # time spent queued behind other tasks.
+        with self._lock:
+            if self._task_threads is None:
+                self._task_threads = ThreadPoolExecutor(
+                    max_workers=self.concurrency * 2, thread_name_prefix="pinion-task"
+                )
+                self._overrunning = 0
+            pool = self._task_threads
+        future = pool.submit(invoke, fn, args, kwargs)
+        try:
+            return future.result(self.task_timeout)
+        except TimeoutError:
+            if future.done():
+                raise  # the task itself raised TimeoutError
+            if not future.cancel():
+                self._abandon(pool, future)
+            raise TimeoutError(f"task timed out after {self.task_timeout}s") from None
+
+    def _abandon(self, pool: ThreadPoolExecutor, future: Any) -> None:
+        # An overrunning task keeps its thread until it returns. Once they
+        # hold a pool's spare threads, later calls get a fresh pool and the
+        # old one is left to drain, so hung tasks never wedge the worker.
+        with self._lock:
+            if pool is not self._task_threads:
+                return
+            self._overrunning += 1
+            if self._overrunning >= self.concurrency:
+                pool.shutdown(wait=False)
+                self._task_threads = None
+                return
+        future.add_done_callback(lambda _: self._returned(pool))
+
+    def _returned(self, pool: ThreadPoolExecutor) -> None:
+        with self._lock:
+            if pool is self._task_threads:
+                self._overrunning -= 1
+
+    def _save_result(
+        self, job: Job, value: Any = None, error: str | None = None
+    ) -> None:
+        # Stored before the final status so a finished job always has one.
+        # A value the backend can't encode must not fail (and rerun) the job.
+        try:
+            self.storage.store_result(job, value, error)  # type: ignore[attr-defined]
+        except Exception as e:
+            self.log.exception("job.result_failed id=%s", job.id)
+            if error is None:
+                try:
+                    self.storage.store_result(job, error=f"result not stored: {e!r}")  # type: ignore[attr-defined]
+                except Exception:
+                    pass
+
+    def _fail(self, job: Job, e: Exception) -> None:
+        self.log.error(
+            "job.fail id=%s name=%s attempt=%d err=%r",
+            job.id,
+            job.func_name,
+            job.attempts,
+            e,
+            exc_info=e,
+        )
+        # attempts incremented in dequeue(); attempt 1 just ran
+        if job.attempts <= self.retry.max_retries:
+            delay = self.retry.compute_delay(job.attempts)
             self.log.info(
-                "job.start id=%s name=%s attempt=%d",
+                "job.retry id=%s delay=%.3f next_attempt=%d",
+                job.id,
+                delay,
+                job.attempts + 1,
+            )
+            if self._hooks["on_retry"]:
+                self._run_hooks("on_retry", job, e, delay)
+            try:
+                # one storage update; the backend holds the job until it is due
+                self.storage.retry_later(job, e, delay)
+            except Exception:
+                # the job stays RUNNING and is recovered by the reaper
+                self.log.exception("job.retry_failed id=%s", job.id)
+            self._incr(job.func_name, failed=1, retried=1)
+        else:
+            self.log.error(
+                "job.giveup id=%s name=%s attempt=%d",
                 job.id,
                 job.func_name,
                 job.attempts,
             )
+            if self._hooks["on_dead_letter"]:
+                self._run_hooks("on_dead_letter", job, e)
+            if self.store_results:
+                self._save_result(job, error=repr(e))
             try:
-                self._current_job = job
-                # Resolve the task early so TaskNotFound gets marked as failed
-                fn = REGISTRY.get(job.func_name.lower())
-                if not fn:
-                    raise TaskNotFound(
-                        f"no task registered: {job.func_name!r} (known: {list(REGISTRY)})"
-                    )
-                # Execute with optional timeout
-                if self.task_timeout is None or self.task_timeout <= 0:
-                    with JobExecution(self.storage, job) as _:
-                        fn(*job.args, **job.kwargs)
-                else:
-                    # Run in a helper thread and wait up to task_timeout
-                    result: dict[str, Any] = {}
-
-                    def _call():
-                        try:
-                            fn(*job.args, **job.kwargs)
-                            result["ok"] = True
-                        except Exception as ex:  # propagate later
-                            result["exc"] = ex
-
-                    t = threading.Thread(target=_call)
-                    t.daemon = True
-                    t.start()
-                    t.join(self.task_timeout)
-                    if t.is_alive():
-                        # Timed out; mark failed and proceed (cannot kill the thread)
-                        raise TimeoutError(f"task timed out after {self.task_timeout}s")
-                    # If thread finished, check for exception
-                    if "exc" in result:
-                        raise result["exc"]
-                    with JobExecution(self.storage, job):
-                        # Success already happened, just finalize
-                        pass
-                self.metrics["processed"] += 1
-                self.metrics["succeeded"] += 1
-            except Exception as e:
-                self.log.exception(
-                    "job.fail id=%s name=%s attempt=%d err=%r",
-                    job.id,
-                    job.func_name,
-                    job.attempts,
-                    e,
-                )
-                # If failure happened before entering context (e.g., missing task),
-                # it hasn't been marked yet — record failure now.
-                if job.status is not Status.FAILED and job.status is not Status.SUCCESS:
-                    try:
-                        self.storage.mark_failed(job, e)
-                    except Exception:
-                        pass
-                # attempts incremented in dequeue(); attempt 1 just ran
-                if job.attempts <= self.retry.max_retries:
-                    delay = self.retry.compute_delay(job.attempts)
-                    self.log.info(
-                        "job.retry id=%s delay=%.3f next_attempt=%d",
-                        job.id,
-                        delay,
-                        job.attempts + 1,
-                    )
-                    _requeue_later(self.storage, job, delay)
-                    self.metrics["failed"] += 1
-                    self.metrics["retried"] += 1
-                else:
-                    self.log.error(
-                        "job.giveup id=%s name=%s attempt=%d",
-                        job.id,
-                        job.func_name,
-                        job.attempts,
-                    )
-                    try:
-                        self.storage.dead_letter(job, e)
-                        self.metrics["dead_lettered"] += 1
-                    except Exception:
-                        pass
-            finally:
-                self._current_job = None
+                self.storage.mark_failed(job, e)
+            except Exception:
+                pass
+            try:
+                self.storage.dead_letter(job, e)
+                self._incr(job.func_name, dead_lettered=1)
+            except Exception:
+                pass
 
     def _heartbeat_loop(self) -> None:
         while not self.stop_event.is_set():
-            job = self._current_job
-            if job is not None:
+            with self._lock:
+                jobs = list(self._inflight.values())
+            if jobs:
                 try:
-                    self.storage.heartbeat(job)
+                    # one write for every lease this worker holds
+                    self.storage.heartbeat_many(jobs)
                 except Exception:
                     # best-effort heartbeat
                     pass
@@ -194,7 +525,7 @@ class Worker:
                 count = self.storage.reap_stale(self.visibility_timeout)
                 if count:
                     self.log.info("reaper.requeued count=%d", count)
-                    self.metrics["reaped"] += int(count)
+                    self._incr(reaped=int(count))
             except Exception:
                 # best-effort reaping
                 pass
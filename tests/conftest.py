@@ -1,13 +1,15 @@
 import pytest
 
-from pinion.registry import REGISTRY
+from pinion.registry import BATCHES, REGISTRY
 
 
 @pytest.fixture(autouse=True)
 def restore_registry():
-    snapshot = REGISTRY.copy()
+    snapshot, batches = REGISTRY.copy(), BATCHES.copy()
     try:
         yield
     finally:
         REGISTRY.clear()
-        REGISTRY.update(snapshot)
\ No newline at end of file
+        REGISTRY.update(snapshot)
+        BATCHES.clear()
+        BATCHES.update(batches)
\ No newline at end of file
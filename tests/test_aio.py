@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pinion.aio import AsyncWorker, aget_result
+from pinion.inmemory import InMemoryStorage
+from pinion.registry import task
+from pinion.retry import RetryPolicy
+from pinion.types import Job, Status
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_async_worker_runs_coroutines_concurrently():
+    storage = InMemoryStorage()
+    state = {"active": 0, "peak": 0}
+
+    @task("async-nap")
+    async def nap() -> None:
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.2)
+        state["active"] -= 1
+
+    jobs = [Job("async-nap") for _ in range(50)]
+    storage.enqueue_many(jobs)
+
+    worker = AsyncWorker(
+        storage,
+        max_concurrency=50,
+        retry=RetryPolicy(jitter=False),
+        poll_timeout=0.02,
+        visibility_timeout=None,
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    started = time.time()
+    thread.start()
+
+    try:
+        assert wait_until(lambda: all(j.status is Status.SUCCESS for j in jobs))
+        elapsed = time.time() - started
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+    assert state["peak"] == 50
+    assert elapsed < 1.5
+    assert worker.metrics["succeeded"] == 50
+
+
+def test_async_worker_retries_and_times_out():
+    storage = InMemoryStorage()
+
+    @task("async-hang")
+    async def hang() -> None:
+        await asyncio.sleep(5)
+
+    storage.enqueue(Job("async-hang"))
+
+    worker = AsyncWorker(
+        storage,
+        retry=RetryPolicy(max_retries=1, base_delay=0.01, jitter=False),
+        poll_timeout=0.02,
+        visibility_timeout=None,
+        task_timeout=0.05,
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        assert wait_until(lambda: len(storage._dlq) == 1)
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+    assert "timed out" in storage._dlq[0][1]
+    assert worker.metrics["retried"] == 1
+    assert worker.metrics["dead_lettered"] == 1
+
+
+def test_async_worker_keeps_claiming_after_claim_errors():
+    class Flaky(InMemoryStorage):
+        failures = 2
+
+        def dequeue_many(self, *args, **kwargs):
+            if Flaky.failures:
+                Flaky.failures -= 1
+                raise ConnectionError("broker connection lost")
+            return super().dequeue_many(*args, **kwargs)
+
+    @task("async-after-flake")
+    async def noop() -> None:
+        pass
+
+    storage = Flaky()
+    job = Job("async-after-flake")
+    storage.enqueue(job)
+    worker = AsyncWorker(storage, poll_timeout=0.02, visibility_timeout=None)
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+    try:
+        assert wait_until(lambda: job.status is Status.SUCCESS)
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+
+def test_aget_result_waits_without_blocking_the_loop():
+    storage = InMemoryStorage()
+    job = Job("demo")
+
+    async def main():
+        waiting = asyncio.create_task(aget_result(storage, job.id, timeout=2.0))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        storage.store_result(job, "done")
+        return await waiting
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_async_worker_refuses_worker_only_options():
+    with pytest.raises(ValueError, match="processes=4"):
+        AsyncWorker(InMemoryStorage(), processes=4)
+    with pytest.raises(ValueError, match="concurrency=8, prefetch=16"):
+        AsyncWorker(InMemoryStorage(), concurrency=8, prefetch=16)
+    with pytest.raises(ValueError, match="timeout_mode='process'"):
+        AsyncWorker(InMemoryStorage(), timeout_mode="process")
+    AsyncWorker(InMemoryStorage(), concurrency=1, timeout_mode="thread")
+
+
+def test_many_result_waits_leave_the_default_executor_free():
+    storage = InMemoryStorage()
+    jobs = [Job("demo") for _ in range(64)]
+
+    async def main():
+        waits = [asyncio.create_task(aget_result(storage, j.id, timeout=5.0)) for j in jobs]
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        assert await asyncio.to_thread(lambda: "free") == "free"
+        assert time.perf_counter() - started < 0.5
+        for job in jobs:
+            storage.store_result(job, job.id)
+        return await asyncio.gather(*waits)
+
+    assert asyncio.run(main()) == [j.id for j in jobs]
@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+from pinion.bench import BenchConfig, percentiles, run_bench
+
+# Small by default so the suite stays fast; set PINION_BENCH_JOBS (and
+# optionally PINION_BENCH_OUT, a directory) to run real benchmark sizes and
+# keep the JSON reports for comparison across releases.
+JOBS = int(os.environ.get("PINION_BENCH_JOBS", "200"))
+
+
+def test_percentiles_use_nearest_rank_in_ms():
+    samples = [i / 1000 for i in range(1, 101)]
+    assert percentiles(samples) == {"p50": 50.0, "p95": 95.0, "p99": 99.0, "max": 100.0}
+    assert percentiles([])["p99"] == 0.0
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        BenchConfig(backend="memory", jobs=JOBS),
+        BenchConfig(backend="memory", jobs=JOBS, producers=2, consumers=2, concurrency=2),
+        BenchConfig(backend="sqlite", jobs=JOBS, claim_batch=10, enqueue_batch=50),
+        BenchConfig(backend="sqlite", jobs=JOBS, task="sleep", sleep=0.0005, concurrency=4),
+    ],
+    ids=["memory", "memory-threads", "sqlite-batched", "sqlite-sleep"],
+)
+def test_bench_reports_throughput_and_latency(config, tmp_path):
+    report = run_bench(config)
+
+    assert report["completed"] == config.jobs
+    assert report["failed"] == 0
+    assert report["jobs_per_s"] > 0
+    for name in ("enqueue", "enqueue_to_start", "claim"):
+        stats = report["latency_ms"][name]
+        assert 0 <= stats["p50"] <= stats["p95"] <= stats["p99"] <= stats["max"]
+    json.dumps(report)  # comparable across runs as plain JSON
+
+    out = os.environ.get("PINION_BENCH_OUT")
+    if out:
+        name = f"{config.backend}-{config.task}-{config.consumers}x{config.concurrency}.json"
+        with open(os.path.join(out, name), "w") as fh:
+            json.dump(report, fh, indent=2)
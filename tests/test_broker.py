@@ -0,0 +1,210 @@
+import threading
+import time
+
+import pytest
+
+from pinion.broker import Broker
+from pinion.errors import BrokerError, TaskExecutionError
+from pinion.inmemory import InMemoryStorage
+from pinion.registry import task
+from pinion.remote import RemoteStorage
+from pinion.retry import RetryPolicy
+from pinion.sqlite_storage import SqliteStorage
+from pinion.types import Job
+from pinion.worker import Worker
+
+
+@pytest.fixture
+def broker():
+    # a long poll_interval, so only pushed wakeups can make claims prompt
+    b = Broker(InMemoryStorage(), port=0, poll_interval=5.0)
+    b.start()
+    yield b
+    b.stop()
+
+
+def test_remote_worker_round_trip(broker):
+    @task("remote_add")
+    def remote_add(a, b):
+        return a + b
+
+    @task("remote_boom")
+    def remote_boom():
+        raise ValueError("kaboom")
+
+    client = RemoteStorage(broker.address)
+    worker = Worker(
+        RemoteStorage(broker.address),
+        retry=RetryPolicy(max_retries=0),
+        store_results=True,
+        poll_timeout=0.1,
+    )
+    t = threading.Thread(target=worker.run_forever, daemon=True)
+    t.start()
+    try:
+        ok, bad = Job("remote_add", (2, 3)), Job("remote_boom")
+        client.enqueue(ok)
+        client.enqueue(bad)
+        assert client.get_result(ok.id, timeout=5.0) == 5
+        with pytest.raises(TaskExecutionError, match="kaboom"):
+            client.get_result(bad.id, timeout=5.0)
+    finally:
+        worker.stop()
+        t.join(timeout=5.0)
+    assert broker.storage._dlq[0][1] == "ValueError('kaboom')"
+    client.close()
+
+
+def test_blocked_claim_is_woken_by_enqueue(broker):
+    client = RemoteStorage(broker.address)
+    got = []
+    t = threading.Thread(target=lambda: got.append(client.dequeue(timeout=4.0)))
+    t.start()
+    time.sleep(0.1)
+    started = time.perf_counter()
+    job = Job("demo", dedup_key="one")
+    client.enqueue(job)
+    t.join()
+    assert got[0].id == job.id
+    assert got[0].dedup_key == "one"
+    assert time.perf_counter() - started < 1.0
+    client.close()
+
+
+def test_pipelined_calls_share_one_connection(broker):
+    client = RemoteStorage(broker.address, pool_size=1)
+    threads = [
+        threading.Thread(target=lambda: [client.enqueue(Job("demo")) for _ in range(50)])
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # many chunks in flight at once
+    assert client.enqueue_many((Job("demo") for _ in range(1000)), chunk_size=10) == 1000
+    assert client.size() == 1200
+
+    claimed = client.dequeue_many(1200, timeout=1.0)
+    assert len(claimed) == 1200
+    client.release(claimed[:200])
+    assert client.size() == 200
+    client.close()
+
+
+def test_json_wire_and_sqlite_backend(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    b = Broker(storage, port=0, serializer="json")
+    b.start()
+    try:
+        with pytest.raises(BrokerError, match="broker speaks 'json'"):
+            RemoteStorage(b.address, serializer="pickle").size()
+        client = RemoteStorage(b.address, serializer="json")
+        job = Job("demo", (1, "x"), {"k": [1, 2]}, priority=3, queue="q")
+        client.enqueue(job, delay=60)
+        assert client.size("q") == 1
+        assert client.dequeue(timeout=0.1) is None  # not due yet
+        with pytest.raises(ValueError, match="unknown on_duplicate"):
+            client.enqueue(Job("demo"), on_duplicate="merge")
+        client.close()
+    finally:
+        b.stop()
+        storage.close()
+
+
+def test_claims_survive_a_broker_restart():
+    storage = InMemoryStorage()
+    first = Broker(storage, port=0)
+    address = first.start()
+    client = RemoteStorage(address)
+    assert client.size() == 0
+    first.stop()
+    assert client.dequeue_many(1, timeout=0.05) == []
+
+    second = Broker(storage, port=address[1])
+    second.start()
+    try:
+        client.enqueue(Job("demo"))
+        assert client.dequeue(timeout=1.0) is not None
+    finally:
+        client.close()
+        second.stop()
+
+
+def test_dedup_key_is_freed_through_the_broker(broker):
+    client = RemoteStorage(broker.address)
+    first = Job("demo", (1,), dedup_key="k")
+    assert client.enqueue(first) == first.id
+    client.mark_done(client.dequeue(timeout=1.0))
+
+    second = Job("demo", (2,), dedup_key="k")
+    assert client.enqueue(second) == second.id
+    assert client.size() == 1
+
+    # after a remote retry, the pending job still takes replacements
+    client.retry_later(client.dequeue(timeout=1.0), RuntimeError("again"), 0)
+    client.enqueue(Job("demo", (3,), dedup_key="k"), on_duplicate="replace")
+    claimed = client.dequeue(timeout=1.0)
+    assert (claimed.id, claimed.args) == (second.id, (3,))
+    client.close()
+
+
+def test_pickle_is_refused_on_a_public_bind():
+    with pytest.raises(ValueError, match="allow_pickle"):
+        Broker(InMemoryStorage(), host="0.0.0.0", port=0, serializer="pickle")
+    Broker(InMemoryStorage(), host="0.0.0.0", port=0, serializer="pickle", allow_pickle=True)
+    # the default codec can't run code when decoding
+    assert Broker(InMemoryStorage(), host="0.0.0.0", port=0)._serializer.name != "pickle"
+
+
+def test_concurrent_claimers_survive_timeouts_racing_wakeups(broker):
+    # claims time out constantly while enqueues wake waiters, so some
+    # wakeups pop a waiter its timeout has already cancelled
+    client = RemoteStorage(broker.address, pool_size=4)
+    errors, claimed = [], []
+    stop = threading.Event()
+
+    def claimer():
+        while not stop.is_set():
+            try:
+                claimed.extend(client.dequeue_many(1, timeout=0.002))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=claimer) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for _ in range(300):
+        client.enqueue(Job("demo"))
+        time.sleep(0.002)
+    stop.set()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert len(claimed) + client.size() == 300
+    client.close()
+
+
+def test_idle_claims_do_not_poll_the_storage():
+    class Counting(InMemoryStorage):
+        claims = 0
+
+        def dequeue_many(self, *args, **kwargs):
+            Counting.claims += 1
+            return super().dequeue_many(*args, **kwargs)
+
+    b = Broker(Counting(), port=0, poll_interval=0.01)
+    b.start()
+    client = RemoteStorage(b.address)
+    try:
+        assert client.dequeue(timeout=0.5) is None
+        assert Counting.claims <= 2  # the first try and one at the deadline
+
+        # a delayed job sets the only timer
+        job = Job("demo")
+        client.enqueue(job, delay=0.2)
+        assert client.dequeue(timeout=2.0).id == job.id
+        assert Counting.claims <= 5
+    finally:
+        client.close()
+        b.stop()
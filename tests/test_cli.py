@@ -0,0 +1,30 @@
+import sys
+
+from pinion.cli import main
+from pinion.sqlite_storage import SqliteStorage
+from pinion.types import Job
+
+
+def run_cli(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["pinion", "--no-update-check", *argv])
+    main()
+
+
+def test_dlq_replay_keeps_queue_priority_and_dedup_key(tmp_path, monkeypatch, capsys):
+    db = str(tmp_path / "queue.db")
+    storage = SqliteStorage(db)
+    storage.enqueue(Job("send", ("a@b.c",), queue="emails", priority=7, dedup_key="a@b.c"))
+    job, exc = storage.dequeue(timeout=0.1), RuntimeError("smtp down")
+    storage.mark_failed(job, exc)  # as the worker does; frees the key
+    storage.dead_letter(job, exc)
+
+    run_cli(monkeypatch, "dlq-replay", "--db", db)
+    assert "replayed 1 job(s)" in capsys.readouterr().out
+
+    assert storage.size("default") == 0
+    job = storage.dequeue(timeout=0.1, queues=["emails"])
+    assert (job.func_name, job.args, job.priority, job.dedup_key) == (
+        "send", ("a@b.c",), 7, "a@b.c",
+    )
+    assert storage._ro.execute("SELECT COUNT(*) FROM dlq;").fetchone()[0] == 0
+    storage.close()
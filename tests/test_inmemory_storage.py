@@ -1,5 +1,8 @@
 import time
 
+import pytest
+
+from pinion.errors import TaskExecutionError
 from pinion.inmemory import InMemoryStorage
 from pinion.types import Job, Status
 
@@ -59,3 +62,216 @@ def test_dead_letter_records_entry():
     assert saved_job is job
     assert "RuntimeError" in error_repr
     assert timestamp <= time.time()
+
+
+def test_dequeue_many_claims_up_to_n_in_order():
+    storage = InMemoryStorage()
+    jobs = [Job("demo") for _ in range(5)]
+    for job in jobs:
+        storage.enqueue(job)
+
+    claimed = storage.dequeue_many(3, timeout=0.05)
+
+    assert claimed == jobs[:3]
+    assert all(j.status is Status.RUNNING and j.attempts == 1 for j in claimed)
+    assert storage.size() == 2
+    assert storage.dequeue_many(10, timeout=0.05) == jobs[3:]
+    assert storage.dequeue_many(10, timeout=0.01) == []
+
+
+def test_enqueue_many_appends_all_jobs():
+    storage = InMemoryStorage()
+
+    count = storage.enqueue_many(Job("demo") for _ in range(4))
+
+    assert count == 4
+    assert storage.size() == 4
+
+
+def test_delayed_job_is_claimed_only_when_due():
+    storage = InMemoryStorage()
+    later = Job("later")
+    now = Job("now")
+    storage.enqueue(later, delay=0.1)
+    storage.enqueue(now)
+
+    assert storage.size() == 2
+    assert storage.dequeue(timeout=0.01) is now
+    assert storage.dequeue(timeout=0.01) is None
+
+    started = time.time()
+    assert storage.dequeue(timeout=1.0) is later
+    assert time.time() - started < 0.5
+
+
+def test_retry_later_returns_job_to_pending_with_delay():
+    storage = InMemoryStorage()
+    job = Job("demo")
+    storage.enqueue(job)
+    claimed = storage.dequeue(timeout=0.05)
+
+    storage.retry_later(claimed, RuntimeError("boom"), delay=0.05)
+
+    assert job.status is Status.PENDING
+    assert job.run_at > time.time()
+    assert storage.dequeue(timeout=0.01) is None
+    again = storage.dequeue(timeout=1.0)
+    assert again is job
+    assert again.attempts == 2
+
+
+def test_higher_priority_jobs_are_claimed_first():
+    storage = InMemoryStorage()
+    low = Job("low", priority=-1)
+    urgent = Job("urgent", priority=10)
+    normal = [Job("normal") for _ in range(2)]
+    storage.enqueue(low)
+    storage.enqueue(normal[0])
+    storage.enqueue(urgent)
+    storage.enqueue(normal[1])
+
+    claimed = storage.dequeue_many(4, timeout=0.05)
+
+    assert claimed == [urgent, normal[0], normal[1], low]
+
+
+def test_named_queues_are_consumed_independently():
+    storage = InMemoryStorage()
+    bulk = Job("bulk", queue="bulk")
+    mail = Job("mail", queue="mail", priority=-5)
+    storage.enqueue(bulk)
+    storage.enqueue(mail)
+
+    assert storage.size("bulk") == 1
+    assert storage.size("mail") == 1
+    assert storage.size() == 2
+    assert storage.dequeue(timeout=0.01, queues=["other"]) is None
+    # listed queues are drained in order, regardless of priority across queues
+    assert storage.dequeue(timeout=0.01, queues=["mail", "bulk"]) is mail
+    assert storage.dequeue(timeout=0.01, queues=["mail", "bulk"]) is bulk
+    assert storage.size() == 0
+
+
+def test_results_are_returned_and_expire_after_ttl():
+    storage = InMemoryStorage(results_ttl=0.1)
+    ok, bad = Job("ok"), Job("bad")
+    storage.store_result(ok, 42)
+    storage.store_result(bad, error="RuntimeError('fail')")
+
+    assert storage.get_result(ok.id, timeout=0) == 42
+    with pytest.raises(TaskExecutionError):
+        storage.get_result(bad.id, timeout=0)
+
+    time.sleep(0.15)
+    assert storage.get_results([ok.id, bad.id]) == {}
+    with pytest.raises(TimeoutError):
+        storage.get_result(ok.id, timeout=0.01)
+
+
+def test_heartbeat_many_refreshes_running_jobs():
+    storage = InMemoryStorage()
+    for _ in range(2):
+        storage.enqueue(Job("demo"))
+    jobs = storage.dequeue_many(2, timeout=0.01)
+    for job_id in storage._heartbeats:
+        storage._heartbeats[job_id] = 0.0
+
+    storage.heartbeat_many(jobs)
+
+    assert storage.reap_stale(visibility_timeout=60.0) == 0
+    assert all(at > 0 for at in storage._heartbeats.values())
+
+
+def test_dedup_key_collapses_duplicates_per_policy():
+    storage = InMemoryStorage()
+    first = Job("reindex", args=(1,), dedup_key="user:42")
+    other = Job("reindex", args=(0,), priority=5)
+    storage.enqueue(other)
+    assert storage.enqueue(first) == first.id
+
+    assert storage.enqueue(Job("reindex", args=(2,), dedup_key="user:42")) == first.id
+    assert first.args == (1,)
+    storage.enqueue(Job("reindex", args=(3,), dedup_key="user:42"), on_duplicate="replace")
+    assert first.args == (3,)
+    storage.enqueue(Job("reindex", priority=9, dedup_key="user:42"), on_duplicate="bump")
+    assert storage.size() == 2
+
+    # the bump moved it ahead of the priority 5 job
+    assert storage.dequeue(timeout=0.01) is first
+    storage.enqueue(Job("reindex", args=(4,), dedup_key="user:42"), on_duplicate="replace")
+    assert first.args == (3,)  # running jobs are left alone
+    storage.mark_done(first)
+    again = Job("reindex", dedup_key="user:42")
+    assert storage.enqueue(again) == again.id
+    with pytest.raises(ValueError):
+        storage.enqueue(Job("reindex"), on_duplicate="merge")
+
+
+def test_dequeue_many_task_claims_only_that_task_in_order():
+    storage = InMemoryStorage()
+    low, other, high = Job("bulk"), Job("single"), Job("bulk", priority=3)
+    for job in (low, other, high):
+        storage.enqueue(job)
+
+    assert storage.dequeue_many(5, timeout=0.01, task="bulk") == [high, low]
+    assert storage.dequeue_many(5, timeout=0.01, task="bulk") == []
+    assert storage.dequeue(timeout=0.01) is other
+
+
+def test_release_returns_claimed_jobs_to_pending():
+    storage = InMemoryStorage()
+    storage.enqueue_many([Job("demo"), Job("demo")])
+    jobs = storage.dequeue_many(2, timeout=0.01)
+
+    storage.release(jobs)
+
+    assert [(j.status, j.attempts) for j in jobs] == [(Status.PENDING, 0)] * 2
+    assert storage.size() == 2
+    assert storage.reap_stale(visibility_timeout=0.0) == 0
+
+
+def test_outcomes_and_dlq_are_bounded_and_queryable(caplog):
+    storage = InMemoryStorage(max_outcomes=3, max_dead_letters=2, outcomes_ttl=0.2)
+    jobs = [Job("demo") for _ in range(5)]
+    storage.enqueue_many(jobs)
+    for job in storage.dequeue_many(5, timeout=0.01):
+        if job is jobs[0]:
+            storage.retry_later(job, RuntimeError("flaky"), delay=60)
+        elif job is jobs[1]:
+            storage.mark_failed(job, RuntimeError("bad"))
+            storage.dead_letter(job, RuntimeError("bad"))
+        else:
+            storage.mark_done(job)
+    for _ in range(2):
+        storage.dead_letter(jobs[0], RuntimeError("again"))
+
+    recent = storage.recent_outcomes()
+    assert [o.job_id for o in recent] == [jobs[4].id, jobs[3].id, jobs[2].id]
+    assert storage.recent_outcomes(limit=1, status=Status.SUCCESS)[0].job_id == jobs[4].id
+    assert storage.recent_outcomes(status=Status.FAILED) == []
+    assert len(storage._dlq) == 2 and storage._dlq[0][1] == "RuntimeError('again')"
+    assert f"inmemory.dlq_evicted job_id={jobs[1].id}" in caplog.text
+
+    time.sleep(0.25)
+    assert storage.recent_outcomes() == []
+    storage.dead_letter(jobs[0], RuntimeError("last"))
+    assert len(storage._dlq) == 1
+
+
+def test_dlq_is_unbounded_by_default():
+    storage = InMemoryStorage()
+    for _ in range(10_001):
+        storage.dead_letter(Job("demo"), RuntimeError("bad"))
+    assert len(storage._dlq) == 10_001
+
+
+def test_reap_stale_pops_only_expired_leases_in_expiry_order():
+    storage = InMemoryStorage()
+    storage.enqueue_many(Job("demo") for _ in range(3))
+    jobs = storage.dequeue_many(3, timeout=0.01)
+    time.sleep(0.1)
+    storage.heartbeat_many(jobs[:1])
+
+    assert storage.reap_stale(visibility_timeout=0.05) == 2
+    assert [j.status for j in jobs] == [Status.RUNNING, Status.PENDING, Status.PENDING]
+    assert list(storage._heartbeats) == [jobs[0].id]
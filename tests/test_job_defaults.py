@@ -16,3 +16,7 @@ def test_storage_size_matches_enqueued_jobs():
     storage.enqueue(Job("other"))
 
     assert storage.size() == 2
+
+
+def test_job_runs_immediately_by_default():
+    assert Job("demo").run_at == 0.0
@@ -0,0 +1,71 @@
+import threading
+import time
+import urllib.request
+
+from pinion.inmemory import InMemoryStorage
+from pinion.metrics import Metrics, serve_metrics
+from pinion.registry import task
+from pinion.retry import RetryPolicy
+from pinion.types import Job
+from pinion.worker import Worker
+
+
+def test_metrics_counts_per_task_and_buckets_latencies():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.incr("send", processed=1, succeeded=1)
+    metrics.incr("send", processed=1, succeeded=1)
+    metrics.incr(reaped=2)
+    for seconds in (0.05, 0.5, 5.0):
+        metrics.observe("execution_seconds", seconds, "send")
+
+    assert metrics["processed"] == 2
+    assert dict(metrics)["reaped"] == 2
+    snap = metrics.snapshot()
+    assert snap["tasks"] == {"send": {"processed": 2, "succeeded": 2}}
+    hist = snap["histograms"]["execution_seconds"]["send"]
+    assert hist["buckets"] == {"0.1": 1, "1.0": 2, "+Inf": 3}
+    assert hist["count"] == 3
+
+    text = metrics.render_prometheus()
+    assert 'pinion_jobs_succeeded_total{task="send"} 2' in text
+    assert "pinion_jobs_reaped_total 2" in text
+    assert 'pinion_execution_seconds_bucket{task="send",le="+Inf"} 3' in text
+
+
+def test_worker_records_latencies_and_serves_prometheus():
+    storage = InMemoryStorage()
+
+    @task("metrics-task")
+    def work() -> None:
+        time.sleep(0.01)
+
+    for _ in range(3):
+        storage.enqueue(Job("metrics-task"))
+    worker = Worker(
+        storage,
+        retry=RetryPolicy(jitter=False),
+        poll_timeout=0.05,
+        visibility_timeout=None,
+    )
+    server = serve_metrics(worker.metrics, 0)
+    assert server.server_address[0] == "127.0.0.1"  # loopback unless asked
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+    try:
+        deadline = time.time() + 2.0
+        while worker.metrics["succeeded"] < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        port = server.server_address[1]
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+        server.shutdown()
+
+    snap = worker.metrics.snapshot()
+    assert snap["tasks"]["metrics-task"]["succeeded"] == 3
+    assert snap["histograms"]["execution_seconds"]["metrics-task"]["count"] == 3
+    assert snap["histograms"]["queue_wait_seconds"]["metrics-task"]["count"] == 3
+    assert snap["histograms"]["claim_seconds"][""]["count"] >= 1
+    assert 'pinion_jobs_succeeded_total{task="metrics-task"} 3' in body
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from pinion.inmemory import InMemoryStorage
+from pinion.middleware import Middleware, ProfilingMiddleware
+from pinion.registry import task
+from pinion.retry import RetryPolicy
+from pinion.types import Job, Status
+from pinion.worker import Worker
+
+
+def run_until(worker, predicate, timeout=2.0):
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+    try:
+        deadline = time.time() + timeout
+        while not predicate() and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+
+def test_middleware_hooks_wrap_execution_retries_and_dead_letters():
+    events = []
+
+    class Recorder(Middleware):
+        def before_execute(self, worker, job):
+            events.append(("before", job.func_name))
+
+        def after_execute(self, worker, job, result, exc):
+            events.append(("after", result, type(exc).__name__ if exc else None))
+
+        def on_retry(self, worker, job, exc, delay):
+            events.append(("retry", job.attempts))
+
+        def on_dead_letter(self, worker, job, exc):
+            events.append(("dead", job.attempts))
+
+    class Broken(Middleware):
+        def after_execute(self, worker, job, result, exc):
+            raise RuntimeError("ignored")
+
+    @task("mw-ok")
+    def ok() -> int:
+        return 7
+
+    @task("mw-fail")
+    def fail() -> None:
+        raise ValueError("no")
+
+    storage = InMemoryStorage()
+    bad = Job("mw-fail")
+    storage.enqueue(Job("mw-ok"))
+    storage.enqueue(bad)
+    worker = Worker(
+        storage,
+        retry=RetryPolicy(max_retries=1, base_delay=0.01, jitter=False),
+        poll_timeout=0.02,
+        visibility_timeout=None,
+        middleware=[Recorder(), Broken()],
+    )
+    run_until(worker, lambda: bad.status is Status.FAILED)
+
+    assert events == [
+        ("before", "mw-ok"),
+        ("after", 7, None),
+        ("before", "mw-fail"),
+        ("after", None, "ValueError"),
+        ("retry", 1),
+        ("before", "mw-fail"),
+        ("after", None, "ValueError"),
+        ("dead", 2),
+    ]
+
+
+def test_only_overridden_hooks_are_called():
+    worker = Worker(InMemoryStorage(), middleware=[Middleware()])
+    assert all(not hooks for hooks in worker._hooks.values())
+
+
+def test_profiling_middleware_keeps_hottest_functions_per_task(tmp_path):
+    def crunch_numbers():
+        return sum(i * i for i in range(20000))
+
+    @task("mw-profiled")
+    def profiled() -> int:
+        return crunch_numbers()
+
+    storage = InMemoryStorage()
+    for _ in range(3):
+        storage.enqueue(Job("mw-profiled"))
+    profiler = ProfilingMiddleware(sample_rate=1.0)
+    worker = Worker(storage, poll_timeout=0.02, visibility_timeout=None, middleware=[profiler])
+    run_until(worker, lambda: worker.metrics["succeeded"] == 3)
+
+    assert profiler.tasks() == ["mw-profiled"]
+    assert "crunch_numbers" in profiler.report("mw-profiled")
+    assert [p.name for p in profiler.dump(str(tmp_path))] == ["mw-profiled.prof"]
+
+
+def test_profiling_middleware_tracemalloc_mode():
+    keep = []
+
+    @task("mw-alloc")
+    def alloc() -> None:
+        keep.append(bytearray(256 * 1024))
+
+    storage = InMemoryStorage()
+    storage.enqueue(Job("mw-alloc"))
+    profiler = ProfilingMiddleware(sample_rate=1.0, mode="tracemalloc")
+    worker = Worker(storage, poll_timeout=0.02, visibility_timeout=None, middleware=[profiler])
+    run_until(worker, lambda: worker.metrics["succeeded"] == 1)
+
+    assert "test_middleware.py" in profiler.report("mw-alloc").splitlines()[0]
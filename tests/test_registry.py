@@ -16,3 +16,20 @@ def test_task_default_name_lowercases_function_name():
         return "done"
 
     assert "dowork" in REGISTRY
+
+
+def test_task_records_batch_options():
+    from pinion.registry import BATCHES
+
+    @task("bulk-write", batch_size=50, batch_wait=0.2)
+    def bulk_write(jobs):
+        return None
+
+    assert BATCHES["bulk-write"].size == 50
+    assert BATCHES["bulk-write"].wait == 0.2
+
+    @task("bulk-write")
+    def plain():
+        return None
+
+    assert "bulk-write" not in BATCHES
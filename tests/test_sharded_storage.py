@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from pinion.retention import RetentionPolicy
+from pinion.sharded import ShardedSqliteStorage
+from pinion.types import Job, Status
+
+
+def test_sharded_spreads_jobs_and_aggregates(tmp_path):
+    storage = ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=4)
+    jobs = [Job("demo", args=(i,)) for i in range(40)]
+    assert storage.enqueue_many(jobs) == 40
+
+    assert sorted(p.name for p in tmp_path.glob("queue.*.db")) == [
+        f"queue.{i}.db" for i in range(4)
+    ]
+    assert all(shard.size() > 0 for shard in storage.shards)
+    assert storage.size() == 40
+
+    # one claim steals from every shard until n is reached
+    claimed = storage.dequeue_many(40, timeout=0.1)
+    assert sorted(j.id for j in claimed) == sorted(j.id for j in jobs)
+    assert storage.size() == 0
+
+    for job in claimed:
+        storage.mark_done(job)
+        storage.store_result(job, job.args[0] * 2)
+    for job in claimed:
+        row = storage.shard_for(job)._conn.execute(
+            "SELECT status FROM jobs WHERE id=?;", (job.id,)
+        ).fetchone()
+        assert row[0] == Status.SUCCESS.value
+    found = storage.get_results([j.id for j in jobs])
+    assert found == {j.id: j.args[0] * 2 for j in jobs}
+    storage.close()
+
+
+def test_sharded_by_queue_keeps_a_queue_on_one_shard(tmp_path):
+    storage = ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=3, shard_by="queue")
+    storage.enqueue_many(Job("demo", queue="emails") for _ in range(10))
+    assert sorted(shard.size("emails") for shard in storage.shards) == [0, 0, 10]
+    assert len(storage.dequeue_many(10, timeout=0.1, queues=["emails"])) == 10
+    storage.close()
+
+    # reopening without shard_by keeps routing by queue
+    reopened = ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=3)
+    reopened.enqueue(Job("demo", queue="emails"))
+    assert sorted(shard.size("emails") for shard in reopened.shards) == [0, 0, 1]
+    reopened.close()
+
+
+def test_sharded_dedup_key_is_unique_across_shards(tmp_path):
+    storage = ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=4)
+    first = Job("demo", dedup_key="user-1")
+    assert storage.enqueue(first) == first.id
+    assert storage.enqueue(Job("demo", dedup_key="user-1")) == first.id
+    assert storage.size() == 1
+    storage.close()
+
+
+def test_sharded_reap_and_release_route_to_the_right_shard(tmp_path):
+    storage = ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=2)
+    storage.enqueue_many(Job("demo") for _ in range(6))
+    claimed = storage.dequeue_many(6, timeout=0.1)
+    storage.release(claimed[:2])
+    assert storage.size() == 2
+
+    for job in claimed[2:]:
+        storage.shard_for(job)._conn.execute(
+            "UPDATE jobs SET heartbeat_at=? WHERE id=?;", (time.time() - 5, job.id)
+        )
+    assert storage.reap_stale(1.0) == 4
+    assert storage.size() == 6
+    storage.close()
+
+
+def test_sharded_blocking_claim_wakes_for_any_shard(tmp_path):
+    storage = ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=4)
+    got = []
+    t = threading.Thread(target=lambda: got.append(storage.dequeue(timeout=5.0)))
+    t.start()
+    time.sleep(0.1)
+    started = time.perf_counter()
+    job = Job("demo")
+    storage.enqueue(job)
+    t.join()
+    assert got[0].id == job.id
+    assert time.perf_counter() - started < 0.2  # woken, not polled
+    storage.close()
+
+
+def test_sharded_rejects_a_different_layout(tmp_path):
+    ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=2).close()
+    with pytest.raises(ValueError, match="is shard 0/2, not 0/3"):
+        ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=3)
+    with pytest.raises(ValueError, match="sharded by 'id', not 'queue'"):
+        ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=2, shard_by="queue")
+
+
+def test_sharded_claims_drain_queues_in_order_across_shards(tmp_path):
+    storage = ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=4)
+    storage.enqueue_many(Job("demo", queue="low") for _ in range(8))
+    urgent = [Job("demo", queue="high") for _ in range(8)]
+    storage.enqueue_many(urgent)
+    for _ in range(4):  # whichever shard the rotation starts at
+        claimed = storage.dequeue_many(8, timeout=0.1, queues=["high", "low"])
+        assert {j.queue for j in claimed} == {"high"}
+        storage.release(claimed)
+    storage.close()
+
+
+def test_sharded_retention_max_count_is_split(tmp_path):
+    policy = RetentionPolicy(max_age=None, max_count=10)
+    storage = ShardedSqliteStorage(str(tmp_path / "queue.db"), shards=4, retention=policy)
+    assert [shard._retention.max_count for shard in storage.shards] == [3] * 4
+    assert policy.max_count == 10
+    storage.close()
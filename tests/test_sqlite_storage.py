@@ -1,5 +1,10 @@
+from datetime import datetime
+import threading
 import time
 
+import pytest
+
+from pinion.errors import TaskExecutionError
 from pinion.sqlite_storage import SqliteStorage
 from pinion.types import Job, Status
 
@@ -19,7 +24,7 @@ def test_sqlite_enqueue_dequeue_and_mark_done(tmp_path):
 
     storage.mark_done(dequeued)
     row = storage._conn.execute("SELECT status FROM jobs WHERE id=?;", (job.id,)).fetchone()
-    assert row[0] == "SUCCESS"
+    assert row[0] == Status.SUCCESS.value
 
 
 def test_sqlite_reap_stale_requeues_job(tmp_path):
@@ -62,3 +67,375 @@ def test_sqlite_dead_letter_persists_entry(tmp_path):
     assert row[1] == job.func_name
     assert row[2] == claimed.attempts
     assert "RuntimeError" in row[3]
+
+
+def test_sqlite_dequeue_many_claims_batch_once(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    jobs = [Job("demo", args=(i,), created_at=1000.0 + i) for i in range(5)]
+    for job in jobs:
+        storage.enqueue(job)
+
+    first = storage.dequeue_many(3, timeout=0.1)
+    second = storage.dequeue_many(3, timeout=0.1)
+
+    assert [j.id for j in first] == [j.id for j in jobs[:3]]
+    assert [j.id for j in second] == [j.id for j in jobs[3:]]
+    assert all(j.status is Status.RUNNING and j.attempts == 1 for j in first + second)
+    assert storage.size() == 0
+    assert storage.dequeue_many(3, timeout=0.05) == []
+
+
+def test_sqlite_enqueue_many_streams_in_chunks(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    jobs = [Job("demo", args=(i,), created_at=1000.0 + i) for i in range(25)]
+
+    count = storage.enqueue_many(iter(jobs), chunk_size=10)
+
+    assert count == 25
+    assert storage.size() == 25
+    claimed = storage.dequeue_many(25, timeout=0.1)
+    assert [j.args for j in claimed] == [(i,) for i in range(25)]
+
+
+def test_sqlite_delayed_and_retried_jobs_wait_until_due(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    job = Job("demo")
+
+    storage.enqueue(job, eta=time.time() + 0.1)
+    assert storage.size() == 1
+    assert storage.dequeue(timeout=0.01) is None
+    claimed = storage.dequeue(timeout=1.0)
+    assert claimed is not None and claimed.id == job.id
+
+    storage.retry_later(claimed, RuntimeError("boom"), delay=0.1)
+    row = storage._conn.execute(
+        "SELECT status, error FROM jobs WHERE id=?;", (job.id,)
+    ).fetchone()
+    assert row[0] == Status.PENDING.value
+    assert "RuntimeError" in row[1]
+    assert storage.dequeue(timeout=0.01) is None
+    again = storage.dequeue(timeout=1.0)
+    assert again is not None
+    assert again.attempts == 2
+
+
+def test_sqlite_claims_by_priority_then_age(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    old = Job("old", created_at=1.0)
+    newer = Job("newer", created_at=2.0)
+    urgent = Job("urgent", created_at=3.0, priority=5)
+    storage.enqueue_many([old, newer, urgent])
+
+    claimed = storage.dequeue_many(3, timeout=0.1)
+
+    assert [j.id for j in claimed] == [urgent.id, old.id, newer.id]
+    assert claimed[0].priority == 5
+
+
+def test_sqlite_named_queues_and_per_queue_size(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    storage.enqueue_many(
+        [Job("a", queue="bulk", created_at=1.0), Job("b", queue="bulk", created_at=2.0)]
+    )
+    storage.enqueue(Job("c", queue="mail", created_at=3.0))
+
+    assert storage.size("bulk") == 2
+    assert storage.size("mail") == 1
+    assert storage.size() == 3
+
+    claimed = storage.dequeue_many(2, timeout=0.1, queues=["mail", "bulk"])
+
+    assert [(j.func_name, j.queue) for j in claimed] == [("c", "mail"), ("a", "bulk")]
+    assert storage.size("bulk") == 1
+    assert storage.dequeue(timeout=0.01, queues=["mail"]) is None
+
+
+def test_sqlite_watcher_wakes_on_other_connection_enqueue(tmp_path):
+    path = str(tmp_path / "queue.db")
+    consumer = SqliteStorage(path, watch_interval=0.005)
+    producer = SqliteStorage(path)  # separate connection, no shared wakeups
+    result = {}
+
+    def consume():
+        result["job"] = consumer.dequeue(timeout=5.0)
+        result["at"] = time.time()
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    time.sleep(0.3)  # let the consumer settle into its (2s) fallback wait
+    enqueued_at = time.time()
+    producer.enqueue(Job("demo"))
+    thread.join(timeout=5.0)
+    consumer.close()
+
+    assert result["job"] is not None
+    assert result["at"] - enqueued_at < 0.2
+
+
+def test_sqlite_reads_do_not_wait_for_other_threads_writes(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    storage.enqueue(Job("demo"))
+    in_txn = threading.Event()
+    release = threading.Event()
+
+    def hold_write_lock():
+        conn = storage._conn
+        conn.execute("BEGIN IMMEDIATE;")
+        in_txn.set()
+        release.wait(5.0)
+        conn.execute("COMMIT;")
+
+    writer = threading.Thread(target=hold_write_lock)
+    writer.start()
+    try:
+        assert in_txn.wait(5.0)
+        started = time.time()
+        assert storage.size() == 1
+        assert storage.size("default") == 1
+        assert time.time() - started < 0.5
+    finally:
+        release.set()
+        writer.join(5.0)
+        storage.close()
+
+
+def test_sqlite_threads_keep_the_file_after_chdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = SqliteStorage("queue.db")
+    storage.enqueue(Job("demo"))
+    (tmp_path / "elsewhere").mkdir()
+    monkeypatch.chdir(tmp_path / "elsewhere")
+
+    got = []
+    t = threading.Thread(target=lambda: got.append((storage.size(), storage.dequeue(0))))
+    t.start()
+    t.join()
+    assert got[0][0] == 1 and got[0][1] is not None
+    assert list((tmp_path / "elsewhere").iterdir()) == []
+    storage.close()
+
+
+def test_sqlite_get_result_wakes_on_store_and_gathers_many(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    jobs = [Job("demo") for _ in range(3)]
+    got = {}
+
+    def wait_for_first():
+        got["value"] = storage.get_result(jobs[0].id, timeout=5.0)
+        got["at"] = time.time()
+
+    waiter = threading.Thread(target=wait_for_first)
+    waiter.start()
+    time.sleep(0.1)
+    stored_at = time.time()
+    storage.store_result(jobs[0], {"sum": 3})
+    waiter.join(5.0)
+
+    assert got["value"] == {"sum": 3}
+    assert got["at"] - stored_at < 0.2
+
+    storage.store_result(jobs[1], error="ValueError('kaboom')")
+    results = storage.get_results([j.id for j in jobs])
+    assert results[jobs[0].id] == {"sum": 3}
+    assert isinstance(results[jobs[1].id], TaskExecutionError)
+    assert jobs[2].id not in results
+    with pytest.raises(TaskExecutionError):
+        storage.get_result(jobs[1].id, timeout=0)
+    with pytest.raises(TimeoutError):
+        storage.get_result(jobs[2].id, timeout=0.05)
+    storage.close()
+
+
+def test_sqlite_prune_archives_finished_jobs_in_batches(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    jobs = [Job("demo") for _ in range(7)]
+    storage.enqueue_many(jobs)
+    claimed = storage.dequeue_many(6, timeout=0.1)
+    for job in claimed[:5]:
+        storage.mark_done(job)
+        storage.store_result(job, "ok")
+    storage.mark_failed(claimed[5], RuntimeError("x"))
+
+    # keep the newest 2 finished jobs; pending/running rows are never touched
+    archive = str(tmp_path / "archive.db")
+    assert storage.prune(max_count=2, archive_path=archive, batch_size=2) == 4
+    remaining = storage._ro.execute(
+        "SELECT status, COUNT(*) FROM jobs GROUP BY status;"
+    ).fetchall()
+    assert {Status(k): v for k, v in remaining} == {
+        Status.PENDING: 1,
+        Status.SUCCESS: 1,
+        Status.FAILED: 1,
+    }
+    assert storage.get_results([j.id for j in claimed[:4]]) == {}
+
+    import sqlite3
+
+    archived = sqlite3.connect(archive).execute("SELECT COUNT(*) FROM jobs;").fetchone()[0]
+    assert archived == 4
+
+    assert storage.prune(max_age=0) == 2
+    assert storage.size() == 1
+    storage.vacuum()
+    storage.close()
+
+
+def test_sqlite_serializers_round_trip_payloads(tmp_path):
+    when = datetime(2024, 1, 2, 3, 4, 5)
+    storage = SqliteStorage(str(tmp_path / "queue.db"))  # pickle by default
+    storage.enqueue(Job("demo", args=(b"\x00raw", when), kwargs={"n": {1: "a"}}))
+    job = storage.dequeue(timeout=0.1)
+    assert job.args == (b"\x00raw", when)
+    assert job.kwargs == {"n": {1: "a"}}
+    storage.close()
+
+    # the codec is recorded in the file; a different one is refused
+    with pytest.raises(ValueError, match="pickle"):
+        SqliteStorage(str(tmp_path / "queue.db"), serializer="json")
+
+    storage = SqliteStorage(str(tmp_path / "json.db"), serializer="json")
+    storage.enqueue(Job("demo", args=(1, "two"), kwargs={"x": [3]}))
+    job = storage.dequeue(timeout=0.1)
+    assert job.args == (1, "two")
+    assert job.kwargs == {"x": [3]}
+    storage.close()
+
+
+def test_sqlite_upgrades_legacy_text_schema(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, func_name TEXT NOT NULL, args TEXT NOT NULL,"
+        " kwargs TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL,"
+        " created_at REAL NOT NULL, error TEXT, heartbeat_at REAL);"
+    )
+    conn.execute("CREATE INDEX idx_jobs_status_created ON jobs(status, created_at);")
+    conn.execute(
+        "CREATE TABLE dlq (id TEXT PRIMARY KEY, func_name TEXT NOT NULL, args TEXT NOT NULL,"
+        " kwargs TEXT NOT NULL, attempts INTEGER NOT NULL, error TEXT NOT NULL, failed_at REAL NOT NULL);"
+    )
+    conn.executemany(
+        "INSERT INTO jobs VALUES (?, 'demo', ?, '{\"k\": 1}', ?, 0, ?, NULL, NULL);",
+        [("a", "[1, 2]", "PENDING", 1.0), ("b", "[]", "SUCCESS", 2.0)],
+    )
+    conn.execute("INSERT INTO dlq VALUES ('c', 'demo', '[3]', '{}', 4, 'err', 3.0);")
+    conn.commit()
+    conn.close()
+
+    storage = SqliteStorage(path)
+    job = storage.dequeue(timeout=0.1)
+    assert (job.id, job.args, job.kwargs) == ("a", (1, 2), {"k": 1})
+    row = storage._ro.execute(
+        "SELECT status, finished_at FROM jobs WHERE id='b';"
+    ).fetchone()
+    assert row == (Status.SUCCESS.value, 2.0)
+    dlq_args = storage._ro.execute("SELECT args FROM dlq;").fetchone()[0]
+    assert storage._serializer.loads(dlq_args) == [3]
+    assert storage._ro.execute("PRAGMA user_version;").fetchone()[0] == 3
+    storage.close()
+
+
+def test_sqlite_upgrades_dlq_to_keep_queue_and_priority(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "v2.db")
+    SqliteStorage(path).close()
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE dlq;")
+    conn.execute(
+        "CREATE TABLE dlq (id TEXT PRIMARY KEY, func_name TEXT NOT NULL, args BLOB NOT NULL,"
+        " kwargs BLOB NOT NULL, attempts INTEGER NOT NULL, error TEXT NOT NULL, failed_at REAL NOT NULL);"
+    )
+    conn.execute("INSERT INTO dlq VALUES ('old', 'demo', x'', x'', 1, 'err', 1.0);")
+    conn.execute("PRAGMA user_version=2;")
+    conn.commit()
+    conn.close()
+
+    storage = SqliteStorage(path)
+    job = Job("demo", queue="emails", priority=7)
+    storage.dead_letter(job, RuntimeError("boom"))
+    rows = storage._ro.execute(
+        "SELECT id, queue, priority, dedup_key FROM dlq ORDER BY failed_at;"
+    ).fetchall()
+    assert rows == [("old", "default", 0, None), (job.id, "emails", 7, None)]
+    assert storage._ro.execute("PRAGMA user_version;").fetchone()[0] == 3
+    storage.close()
+
+
+def test_sqlite_heartbeat_many_and_piggybacked_refresh(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"), piggyback_heartbeats=0.5)
+    storage.enqueue_many(Job("demo") for _ in range(3))
+    jobs = storage.dequeue_many(3, timeout=0.1)
+
+    def heartbeats():
+        return dict(storage._ro.execute("SELECT id, heartbeat_at FROM jobs;").fetchall())
+
+    storage._conn.execute("UPDATE jobs SET heartbeat_at=0;")
+    # just claimed: nothing due yet, so no write
+    storage.heartbeat_many(jobs)
+    assert set(heartbeats().values()) == {0}
+
+    # once due, one statement refreshes every held lease
+    storage._leases = dict.fromkeys(storage._leases, 0.0)
+    storage.heartbeat_many(jobs)
+    assert all(at > 0 for at in heartbeats().values())
+
+    # an ack refreshes the other due leases in its own transaction
+    storage._conn.execute("UPDATE jobs SET heartbeat_at=0;")
+    storage._leases = dict.fromkeys(storage._leases, 0.0)
+    storage.mark_done(jobs[0])
+    after = heartbeats()
+    assert after[jobs[1].id] > 0 and after[jobs[2].id] > 0
+    assert jobs[0].id not in storage._leases
+    storage.close()
+
+
+def test_sqlite_dedup_key_collapses_duplicates_per_policy(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    first = Job("reindex", args=(1,), dedup_key="user:42")
+    storage.enqueue(Job("reindex", args=(0,), priority=5))
+    assert storage.enqueue(first) == first.id
+
+    assert storage.enqueue(Job("reindex", args=(2,), dedup_key="user:42")) == first.id
+    storage.enqueue(Job("reindex", args=(3,), dedup_key="user:42"), on_duplicate="replace")
+    storage.enqueue(Job("reindex", priority=9, dedup_key="user:42"), on_duplicate="bump")
+    assert storage.enqueue_many(
+        [Job("reindex", args=(5,), dedup_key="user:42"), Job("reindex", dedup_key="user:7")]
+    ) == 2
+    assert storage.size() == 3
+
+    job = storage.dequeue(timeout=0.1)
+    assert (job.id, job.args, job.priority, job.dedup_key) == (first.id, (3,), 9, "user:42")
+    dup = Job("reindex", args=(4,), dedup_key="user:42")
+    assert storage.enqueue(dup, on_duplicate="replace") == first.id
+    storage.mark_done(job)
+    assert storage.enqueue(dup) == dup.id
+    storage.close()
+
+
+def test_sqlite_dequeue_many_task_claims_only_that_task(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    storage.enqueue_many(
+        [Job("bulk"), Job("single"), Job("bulk", priority=3, queue="fast")]
+    )
+
+    jobs = storage.dequeue_many(5, timeout=0.1, queues=["fast", "default"], task="bulk")
+    assert [(j.func_name, j.queue) for j in jobs] == [("bulk", "fast"), ("bulk", "default")]
+    assert storage.dequeue_many(5, timeout=0, task="bulk") == []
+    assert storage.size() == 1
+    storage.close()
+
+
+def test_sqlite_release_returns_claimed_jobs_to_pending(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "queue.db"))
+    storage.enqueue_many([Job("demo"), Job("demo")])
+    jobs = storage.dequeue_many(2, timeout=0.1)
+
+    storage.release(jobs[:1])
+
+    rows = dict(storage._ro.execute("SELECT id, attempts FROM jobs WHERE status=?;", (Status.PENDING.value,)))
+    assert rows == {jobs[0].id: 0}
+    assert storage.dequeue(timeout=0.1).id == jobs[0].id
+    storage.close()
@@ -1,6 +1,11 @@
 import threading
 import time
 
+import pytest
+
+from pinion.bench import NOOP
+from pinion.errors import TaskExecutionError
+from pinion.executors import ProcessPool
 from pinion.inmemory import InMemoryStorage
 from pinion.registry import task
 from pinion.retry import RetryPolicy
@@ -109,3 +114,409 @@ def test_worker_marks_timeout_and_dead_letters():
 
     assert storage._dlq[0][0].status is Status.FAILED
     assert worker.metrics["dead_lettered"] == 1
+
+
+def test_worker_slots_survive_claim_errors():
+    class Flaky(InMemoryStorage):
+        failures = 3
+
+        def dequeue_many(self, *args, **kwargs):
+            if Flaky.failures:
+                Flaky.failures -= 1
+                raise ConnectionError("broker connection lost")
+            return super().dequeue_many(*args, **kwargs)
+
+    storage = Flaky()
+    done: list[int] = []
+
+    @task("worker-after-flake")
+    def record(i: int) -> None:
+        done.append(i)
+
+    worker = Worker(storage, claim_batch=2, poll_timeout=0.02, visibility_timeout=None)
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+    try:
+        storage.enqueue_many(Job("worker-after-flake", args=(i,)) for i in range(6))
+        assert wait_until(lambda: len(done) == 6)
+        assert thread.is_alive()  # the only slot kept claiming
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+
+def test_worker_claims_jobs_in_batches():
+    storage = InMemoryStorage()
+    seen: list[int] = []
+
+    @task("batched-claim")
+    def record(i: int) -> None:
+        seen.append(i)
+
+    jobs = [Job("batched-claim", args=(i,)) for i in range(7)]
+    for job in jobs:
+        storage.enqueue(job)
+
+    worker = Worker(
+        storage,
+        retry=RetryPolicy(jitter=False),
+        poll_timeout=0.05,
+        visibility_timeout=None,
+        claim_batch=3,
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        assert wait_until(lambda: all(j.status is Status.SUCCESS for j in jobs))
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+    assert seen == list(range(7))
+    assert worker.metrics["succeeded"] == 7
+
+
+def test_worker_concurrency_runs_jobs_in_parallel():
+    storage = InMemoryStorage()
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    @task("parallel-sleep")
+    def nap() -> None:
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.1)
+        with lock:
+            state["active"] -= 1
+
+    jobs = [Job("parallel-sleep") for _ in range(8)]
+    for job in jobs:
+        storage.enqueue(job)
+
+    worker = Worker(
+        storage,
+        retry=RetryPolicy(jitter=False),
+        poll_timeout=0.02,
+        heartbeat_interval=0.02,
+        visibility_timeout=None,
+        concurrency=4,
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        assert wait_until(lambda: all(j.status is Status.SUCCESS for j in jobs))
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+    assert state["peak"] == 4
+    assert worker.metrics["processed"] == 8
+
+
+def test_worker_process_pool_executes_and_dead_letters():
+    storage = InMemoryStorage()
+    # "add" and "boom" are registered by pinion.queue, which children import
+    ok = Job("add", args=(2, 3))
+    bad = Job("boom")
+    storage.enqueue(ok)
+    storage.enqueue(bad)
+
+    worker = Worker(
+        storage,
+        retry=RetryPolicy(max_retries=0, jitter=False),
+        poll_timeout=0.02,
+        visibility_timeout=None,
+        processes=2,
+        imports=["pinion.queue"],
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        assert wait_until(lambda: len(storage._dlq) == 1, timeout=10.0)
+        assert wait_until(lambda: ok.status is Status.SUCCESS)
+    finally:
+        worker.stop()
+        thread.join(timeout=5.0)
+        worker.join(1.0)
+
+    assert storage._dlq[0][0] is bad
+    assert "kaboom" in storage._dlq[0][1]
+    assert worker.metrics["succeeded"] == 1
+
+
+def test_worker_timeout_mode_process_kills_hung_task(tmp_path, monkeypatch):
+    # spawn children see the parent's sys.path, so they can import this module
+    (tmp_path / "hang_tasks.py").write_text(
+        "import time\n"
+        "from pinion.registry import task\n"
+        "@task('hang')\n"
+        "def hang():\n"
+        "    time.sleep(60)\n"
+        "@task('pid')\n"
+        "def pid():\n"
+        "    import os\n"
+        "    return os.getpid()\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    storage = InMemoryStorage()
+    before, hung, after = Job("pid"), Job("hang"), Job("pid")
+    storage.enqueue(before)
+    storage.enqueue(hung)
+
+    worker = Worker(
+        storage,
+        retry=RetryPolicy(max_retries=0, jitter=False),
+        poll_timeout=0.02,
+        visibility_timeout=None,
+        task_timeout=0.5,
+        timeout_mode="process",
+        imports=["hang_tasks"],
+        store_results=True,
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        assert wait_until(lambda: len(storage._dlq) == 1, timeout=10.0)
+        storage.enqueue(after)
+        assert wait_until(lambda: after.status is Status.SUCCESS, timeout=10.0)
+    finally:
+        worker.stop()
+        thread.join(timeout=5.0)
+        worker.join(1.0)
+
+    assert storage._dlq[0][0] is hung
+    assert "timed out" in storage._dlq[0][1]
+    # the hung child was terminated and replaced by a fresh process
+    assert storage.get_result(before.id) != storage.get_result(after.id)
+
+
+def test_process_pool_replaces_child_that_died_while_idle():
+    pool = ProcessPool(1, imports=["pinion.bench"])
+    try:
+        child = pool._children[0]
+        child.process.kill()
+        child.process.join()
+        assert pool.run(NOOP, (), {}, timeout=5.0) is None
+        assert pool._children[0] is not child
+        assert pool.run(NOOP, (), {}, timeout=5.0) is None
+    finally:
+        pool.shutdown()
+
+
+def test_worker_thread_timeouts_reuse_threads():
+    storage = InMemoryStorage()
+    names = set()
+
+    @task("record-thread")
+    def record_thread() -> None:
+        names.add(threading.current_thread().name)
+
+    jobs = [Job("record-thread") for _ in range(30)]
+    for job in jobs:
+        storage.enqueue(job)
+
+    worker = Worker(
+        storage,
+        poll_timeout=0.02,
+        visibility_timeout=None,
+        task_timeout=1.0,
+        concurrency=2,
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        assert wait_until(lambda: worker.metrics["succeeded"] == 30, timeout=5.0)
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+    assert all(name.startswith("pinion-task") for name in names)
+    assert len(names) <= 4
+
+
+def test_worker_hung_thread_tasks_do_not_starve_later_jobs():
+    storage = InMemoryStorage()
+    release = threading.Event()
+    runs = []
+
+    @task("hang-thread")
+    def hang_thread() -> None:
+        release.wait(10)
+
+    @task("quick")
+    def quick() -> None:
+        runs.append(time.time())
+
+    storage.enqueue(Job("hang-thread"))
+    storage.enqueue(Job("hang-thread"))
+    storage.enqueue(Job("quick"))
+    worker = Worker(
+        storage,
+        retry=RetryPolicy(max_retries=0, jitter=False),
+        poll_timeout=0.02,
+        visibility_timeout=None,
+        task_timeout=0.3,
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+    try:
+        # both hung tasks hold the first pool's threads; the quick job
+        # still starts right away instead of timing out in the queue
+        assert wait_until(lambda: worker.metrics["succeeded"] == 1, timeout=3.0)
+        assert worker.metrics["dead_lettered"] == 2
+    finally:
+        release.set()
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+    time.sleep(0.1)
+    assert len(runs) == 1
+
+
+def test_worker_calls_batch_task_once_per_batch_and_acks_each_job():
+    storage = InMemoryStorage()
+    calls = []
+
+    @task("bulk-square", batch_size=4, batch_wait=0.5)
+    def bulk_square(jobs):
+        calls.append(len(jobs))
+        return [
+            ValueError("negative") if job.args[0] < 0 else job.args[0] ** 2
+            for job in jobs
+        ]
+
+    jobs = [Job("bulk-square", args=(n,)) for n in (1, 2, -3)]
+    late = Job("bulk-square", args=(4,))
+    for job in jobs:
+        storage.enqueue(job)
+
+    worker = Worker(
+        storage,
+        retry=RetryPolicy(max_retries=0, jitter=False),
+        poll_timeout=0.02,
+        visibility_timeout=None,
+        claim_batch=10,
+        store_results=True,
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        # arrives while the worker waits to fill the batch
+        time.sleep(0.1)
+        storage.enqueue(late)
+        assert wait_until(lambda: worker.metrics["processed"] + worker.metrics["dead_lettered"] == 4)
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+    assert calls == [4]
+    assert storage.get_results([j.id for j in (*jobs, late)])[late.id] == 16
+    assert storage.get_result(jobs[1].id) == 4
+    assert storage._dlq[0][0] is jobs[2]
+    assert worker.metrics["succeeded"] == 3
+
+
+def test_worker_prefetch_runs_jobs_and_releases_buffer_on_stop():
+    storage = InMemoryStorage()
+    started = threading.Event()
+
+    @task("prefetched")
+    def prefetched(pause: float) -> None:
+        started.set()
+        time.sleep(pause)
+
+    quick = [Job("prefetched", args=(0,)) for _ in range(20)]
+    storage.enqueue_many(quick)
+    worker = Worker(storage, poll_timeout=0.02, visibility_timeout=None, prefetch=4)
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+    try:
+        assert wait_until(lambda: worker.metrics["succeeded"] == 20)
+        started.clear()
+        slow = [Job("prefetched", args=(0.3,)) for _ in range(6)]
+        storage.enqueue_many(slow)
+        assert started.wait(2.0)
+        # let the prefetcher fill the buffer behind the running job
+        assert wait_until(lambda: len(worker._inflight) > 1)
+    finally:
+        worker.stop()
+        thread.join(timeout=2.0)
+        worker.join(1.0)
+
+    pending = [j for j in slow if j.status is Status.PENDING]
+    assert pending and all(j.attempts == 0 for j in pending)
+    assert storage.size() == len(pending) == 6 - worker.metrics["succeeded"] + 20
+    assert not worker._inflight
+
+
+def test_worker_awaits_async_tasks():
+    storage = InMemoryStorage()
+    results: list[int] = []
+
+    @task("sync-worker-async-task")
+    async def double(x: int) -> None:
+        results.append(x * 2)
+
+    job = Job("sync-worker-async-task", args=(21,))
+    storage.enqueue(job)
+
+    worker = Worker(storage, poll_timeout=0.05, visibility_timeout=None)
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        assert wait_until(lambda: job.status is Status.SUCCESS)
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)
+
+    assert results == [42]
+
+
+def test_worker_stores_results_for_get_result():
+    storage = InMemoryStorage()
+
+    @task("worker-result")
+    def mul(a: int, b: int) -> int:
+        return a * b
+
+    @task("worker-result-fail")
+    def fail() -> None:
+        raise ValueError("nope")
+
+    ok = Job("worker-result", args=(6, 7))
+    bad = Job("worker-result-fail")
+    storage.enqueue(ok)
+    storage.enqueue(bad)
+
+    worker = Worker(
+        storage,
+        retry=RetryPolicy(max_retries=0, jitter=False),
+        poll_timeout=0.05,
+        visibility_timeout=None,
+        store_results=True,
+    )
+    thread = threading.Thread(target=worker.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        assert storage.get_result(ok.id, timeout=2.0) == 42
+        with pytest.raises(TaskExecutionError, match="nope"):
+            storage.get_result(bad.id, timeout=2.0)
+    finally:
+        worker.stop()
+        thread.join(timeout=1.0)
+        worker.join(1.0)